@@ -1,14 +1,10 @@
-from flask import Flask, request, send_file, render_template_string, jsonify
-import qrcode
-from io import BytesIO
-import base64
+"""WSGI entry point used by gunicorn (Procfile / render.yaml): ``gunicorn app:app``"""
 import os
 
-app = Flask(__name__)
+from generate_qr import create_app
 
-# เนื้อหาเดิมของคุณ (คัดลอกทั้งหมดจาก generate_qr.py)
-# ... (ใส่โค้ดทั้งหมดจากไฟล์เดิม) ...
+app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(debug=False, host='0.0.0.0', port=port)
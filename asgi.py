@@ -0,0 +1,480 @@
+"""ASGI serving mode: requests run on an event loop, QR rendering in a process pool.
+
+``POST /generate`` ตรวจข้อมูลและสร้าง payload บน event loop (ใช้เวลาไม่กี่ไมโครวินาที)
+แล้วส่งงาน encode/PNG ไปยัง process pool ที่มีขนาดจำกัด event loop จึงรับคำขออื่น
+ต่อได้ระหว่าง render ถ้างานค้างเกิน ``QR_ASGI_MAX_PENDING`` จะตอบ 503 ทันทีแทน
+การต่อคิวยาว และคำขอที่เหมือนกันซึ่งกำลัง render อยู่จะรอผลเดียวกัน
+
+channel สำหรับจอ POS (``/pos/<terminal>``, ดู pos_channel.py) มีเฉพาะในโหมดนี้
+เพราะต้องถือการเชื่อมต่อค้างไว้จำนวนมากโดยไม่กิน thread
+
+route อื่นทั้งหมด (``/``, ``/validate/<mobile>``, ``/test``, ...) ส่งต่อให้ Flask app
+เดิมใน thread pool จึงตอบเหมือนโหมด WSGI ทุกประการ
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+    python bench.py servers      # เทียบกับ gunicorn (sync) ที่ concurrency ต่าง ๆ
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from tempfile import SpooledTemporaryFile
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+from werkzeug.datastructures import MultiDict
+from werkzeug.wrappers import Request, Response
+
+import metrics
+from generate_qr import (QR_FORMAT_MIMETYPES, create_app, generate_promptpay_payload,
+                         get_qr_image, pack_store, payload_etag, prepare_generate,
+                         prepare_payload, qr_render_params, render_cache)
+from pos_channel import POS_FORMATS, QR_POS_KEEPALIVE, PosHub, check_pos_token
+
+QR_ASGI_RENDER_WORKERS = int(os.environ.get('QR_ASGI_RENDER_WORKERS', 0)) or os.cpu_count() or 1
+QR_ASGI_MAX_PENDING = int(os.environ.get('QR_ASGI_MAX_PENDING', 0)) or QR_ASGI_RENDER_WORKERS * 16
+
+
+def _init_render_worker():
+    """Warm the encoder caches once in each pool process"""
+    get_qr_image(generate_promptpay_payload('0812345678', '1.00'))
+
+
+def render_in_worker(payload, fmt, renderer, target):
+    """Pool task: render (or read the shared cache/pack) in a worker process
+
+    คืน (ข้อมูล, เวลาแต่ละขั้นตอน) ให้ process หลักบันทึกลง metrics
+    """
+    with metrics.capture_stages(observe=False) as timings:
+        data = get_qr_image(payload, fmt, renderer, target)
+    return data, timings
+
+
+def wsgi_environ(scope, body):
+    """Build a WSGI environ for an ASGI HTTP scope and its request body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client')
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0] if client else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1')
+        value = value.decode('latin-1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _read_body(receive):
+    """Read the whole request body (spooled to disk when large)"""
+    body = SpooledTemporaryFile(max_size=1024 * 1024)
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    body.seek(0)
+    return body
+
+
+async def _wait_disconnect(receive):
+    """Return once the client has disconnected (ignoring any request body)"""
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+def _asgi_headers(headers):
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+async def _send_response(send, response):
+    """Send a complete werkzeug Response"""
+    await send({'type': 'http.response.start', 'status': response.status_code,
+                'headers': _asgi_headers(response.headers.to_wsgi_list())})
+    await send({'type': 'http.response.body', 'body': response.get_data()})
+
+
+def _json_response(data, status=200):
+    return Response(json.dumps(data, ensure_ascii=False), status, mimetype='application/json')
+
+
+# /pos/<terminal>, /pos/<terminal>/events, /pos/<terminal>/ws
+POS_PATH = re.compile(r'/pos/([A-Za-z0-9_-]{1,64})(/events|/ws)?')
+
+
+def _pos_format(scope):
+    """Return the ?format= of a POS subscription, or raise ValueError"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    fmt = query.get('format', [None])[0] or None
+    if fmt not in POS_FORMATS:
+        raise ValueError('format ต้องเป็น png หรือ svg (หรือไม่ระบุเพื่อรับเฉพาะ payload)')
+    return fmt
+
+
+def _pos_token(scope):
+    """Return the publish token from ``Authorization: Bearer`` or ?token= (browser WebSocket)"""
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            scheme, _, token = value.decode('latin-1').partition(' ')
+            if scheme.lower() == 'bearer':
+                return token.strip()
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return query.get('token', [''])[0]
+
+
+POS_FORBIDDEN = {'error': 'ต้องมี token ของ terminal นี้ (Authorization: Bearer <token>)'}
+
+
+class PromptPayASGI:
+    """ASGI application wrapping the Flask app with an async /generate"""
+
+    def __init__(self, flask_app=None, render_workers=QR_ASGI_RENDER_WORKERS,
+                 max_pending=QR_ASGI_MAX_PENDING):
+        self.flask_app = flask_app if flask_app is not None else create_app()
+        self.render_workers = render_workers
+        self.max_pending = max_pending
+        self.pool = None
+        self.pending = 0
+        self._in_flight = {}
+        self._waiters = {}
+        self.pos = PosHub(self.render)
+
+    def start(self):
+        """Create the render pool (spawned, so workers never inherit server threads)"""
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.render_workers,
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_render_worker)
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+            self.pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        pos = POS_PATH.fullmatch(scope.get('path', ''))
+        if scope['type'] == 'websocket':
+            if pos is not None and pos.group(2) == '/ws':
+                await self._pos_websocket(scope, receive, send, pos.group(1))
+            else:
+                await receive()
+                await send({'type': 'websocket.close', 'code': 1008})
+            return
+        if scope['type'] != 'http':
+            return
+        if pos is not None and pos.group(2) == '/events' and scope['method'] == 'GET':
+            await self._pos_events(scope, receive, send, pos.group(1))
+            return
+        body = await _read_body(receive)
+        if body is None:
+            return
+        try:
+            environ = wsgi_environ(scope, body)
+            if scope['method'] == 'POST' and scope['path'] == '/generate':
+                await self._generate(environ, send)
+            elif pos is not None and pos.group(2) is None and scope['method'] in ('POST', 'DELETE'):
+                await self._pos_update(scope, environ, send, pos.group(1))
+            else:
+                await self._call_flask(environ, send)
+        finally:
+            body.close()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def render(self, payload, fmt, renderer, target):
+        """Return rendered bytes, or None when the render queue is full"""
+        key = (payload,) + qr_render_params(fmt, renderer)
+        if pack_store is not None:
+            data = pack_store.get(target, key)
+            if data is not None:
+                return bytes(data)
+        data = render_cache.get(key)
+        if data is not None:
+            return data
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is None:
+            if self.pending >= self.max_pending:
+                return None
+            self.start()
+            loop = asyncio.get_running_loop()
+            job = self.pool.submit(render_in_worker, payload, fmt, renderer, target)
+            future = asyncio.wrap_future(job, loop=loop)
+            in_flight = self._in_flight[key] = (future, job)
+            # นับงานค้างตามงานใน pool จริง (เสร็จหรือยกเลิกได้จริง) ไม่ใช่ตาม asyncio future
+            self.pending += 1
+            job.add_done_callback(
+                lambda done: loop.is_closed() or loop.call_soon_threadsafe(self._job_done))
+            future.add_done_callback(lambda done: self._render_done(key, done))
+        future, job = in_flight
+        # ผู้รอที่ถูกยกเลิก (เช่น ยอด POS ที่ถูกแทนที่) ต้องไม่ยกเลิกงานที่คำขออื่นรออยู่
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            data, timings = await asyncio.shield(future)
+            metrics.add_captured_stages(timings)
+            return data
+        finally:
+            waiters = self._waiters.pop(key) - 1
+            if waiters:
+                self._waiters[key] = waiters
+            elif not future.done():
+                # ไม่มีใครรอแล้ว: ยกเลิกงานใน pool ถ้ายังไม่เริ่ม งานที่เริ่มแล้วทำต่อจนเสร็จ
+                # (ผลเก็บลง cache และคำขอใหม่ที่เหมือนกันรอผลเดียวกันได้)
+                job.cancel()
+
+    def _job_done(self):
+        self.pending -= 1
+
+    def _render_done(self, key, future):
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None and in_flight[0] is future:
+            del self._in_flight[key]
+        if not future.cancelled() and future.exception() is None:
+            data, timings = future.result()
+            metrics.record_stages(timings)
+            render_cache.put(key, data)
+
+    async def _generate(self, environ, send):
+        started = time.perf_counter()
+        request = Request(environ)
+        with metrics.capture_stages() as timings:
+            response = await self._generate_response(request)
+        elapsed = time.perf_counter() - started
+        # validate/payload วัดที่นี่ encode/image วัดใน process ของ pool (เหมือน Flask)
+        response.headers['Server-Timing'] = metrics.server_timing(timings, elapsed)
+
+        await _send_response(send, response)
+        metrics.record_request('/generate', response.status_code, time.perf_counter() - started)
+
+    async def _generate_response(self, request):
+        try:
+            error, params = prepare_generate(request)
+            if error:
+                response = Response(error, 400, mimetype='text/html')
+            else:
+                payload, fmt, renderer, target = params
+                etag = payload_etag(payload, *qr_render_params(fmt, renderer))
+                if request.if_none_match.contains(etag):
+                    response = Response(status=304)
+                else:
+                    data = await self.render(payload, fmt, renderer, target)
+                    if data is None:
+                        response = Response('เซิร์ฟเวอร์ไม่ว่าง กรุณาลองใหม่อีกครั้ง', 503,
+                                            {'Retry-After': '1'}, mimetype='text/html')
+                    else:
+                        response = Response(data, mimetype=QR_FORMAT_MIMETYPES[fmt])
+                if response.status_code != 503:
+                    response.set_etag(etag)
+                    response.vary.add('Accept')
+        except Exception as e:
+            response = Response(f'เกิดข้อผิดพลาด: {str(e)}', 400, mimetype='text/html')
+        return response
+
+    def _pos_publish(self, terminal, form):
+        """Validate a cart update (same fields as /payload) and publish it
+
+        คืน (body, HTTP status)
+        """
+        try:
+            error, params = prepare_payload(SimpleNamespace(form=form))
+        except Exception as e:
+            return {'error': f'เกิดข้อผิดพลาด: {str(e)}'}, 400
+        if error:
+            return {'error': error}, 400
+        payload, target = params
+        amount = f"{float(form['amount']):.2f}"
+        version = self.pos.update(terminal, payload, target, amount)
+        return {'terminal': terminal, 'version': version, 'payload': payload}, 202
+
+    async def _pos_update(self, scope, environ, send, terminal):
+        """POST /pos/<terminal> (form or JSON) publishes a cart total; DELETE clears it"""
+        started = time.perf_counter()
+        request = Request(environ)
+        if not check_pos_token(terminal, _pos_token(scope)):
+            body, status = POS_FORBIDDEN, 403
+        elif request.method == 'DELETE':
+            version = self.pos.update(terminal, None)
+            body, status = {'terminal': terminal, 'version': version, 'payload': None}, 202
+        else:
+            data = request.get_json(silent=True) if request.is_json else None
+            form = MultiDict(data) if isinstance(data, dict) else request.form
+            body, status = self._pos_publish(terminal, form)
+        await _send_response(send, _json_response(body, status))
+        metrics.record_request('/pos/<terminal>', status, time.perf_counter() - started)
+
+    async def _pos_events(self, scope, receive, send, terminal):
+        """Server-Sent Events stream of a terminal's QR (``event: qr``)"""
+        try:
+            fmt = _pos_format(scope)
+        except ValueError as e:
+            await _send_response(send, _json_response({'error': str(e)}, 400))
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': b'retry: 1000\n\n', 'more_body': True})
+
+        subscriber = self.pos.subscribe(terminal, fmt)
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        waiter = None
+        try:
+            while True:
+                waiter = asyncio.ensure_future(subscriber.wait())
+                done, _ = await asyncio.wait({waiter, disconnected}, timeout=QR_POS_KEEPALIVE,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    break
+                if waiter in done:
+                    event = subscriber.take()
+                    chunk = (f"id: {event['version']}\nevent: qr\n"
+                             f"data: {json.dumps(event, ensure_ascii=False)}\n\n")
+                else:
+                    waiter.cancel()
+                    chunk = ': keepalive\n\n'
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'),
+                            'more_body': True})
+        except OSError:
+            pass
+        finally:
+            self.pos.unsubscribe(terminal, subscriber)
+            disconnected.cancel()
+            if waiter is not None:
+                waiter.cancel()
+
+    async def _pos_websocket(self, scope, receive, send, terminal):
+        """WebSocket of a terminal's QR; text messages from the client are cart updates
+
+        เฉพาะการเชื่อมต่อที่แนบ token ของ terminal จึงส่งยอดได้ จอทั่วไปรับอย่างเดียว
+        """
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        try:
+            fmt = _pos_format(scope)
+        except ValueError:
+            await send({'type': 'websocket.close', 'code': 1008})
+            return
+        await send({'type': 'websocket.accept'})
+        publisher = check_pos_token(terminal, _pos_token(scope))
+
+        subscriber = self.pos.subscribe(terminal, fmt)
+        incoming = asyncio.ensure_future(receive())
+        waiter = None
+        try:
+            while True:
+                waiter = asyncio.ensure_future(subscriber.wait())
+                done, _ = await asyncio.wait({waiter, incoming},
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if incoming in done:
+                    message = incoming.result()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    # เครื่อง POS ใช้ socket เดียวกันส่งยอดได้ (JSON เดียวกับ POST)
+                    try:
+                        data = json.loads(message.get('text') or message.get('bytes') or 'null')
+                    except ValueError:
+                        data = None
+                    if not publisher:
+                        reply, status = POS_FORBIDDEN, 403
+                    elif isinstance(data, dict):
+                        reply, status = self._pos_publish(terminal, MultiDict(data))
+                    else:
+                        reply, status = {'error': 'ข้อความต้องเป็น JSON object'}, 400
+                    if status != 202:
+                        await send({'type': 'websocket.send',
+                                    'text': json.dumps(reply, ensure_ascii=False)})
+                    incoming = asyncio.ensure_future(receive())
+                if waiter in done:
+                    await send({'type': 'websocket.send',
+                                'text': json.dumps(subscriber.take(), ensure_ascii=False)})
+                else:
+                    waiter.cancel()
+        finally:
+            self.pos.unsubscribe(terminal, subscriber)
+            incoming.cancel()
+            if waiter is not None:
+                waiter.cancel()
+
+    async def _call_flask(self, environ, send):
+        """Run the Flask app in a worker thread and stream its response back
+
+        ทั้ง request (รวม generator ของ stream_with_context) ต้องอยู่ใน thread เดียว
+        แต่ละ chunk ส่งกลับผ่าน event loop และรอจนส่งเสร็จก่อนอ่าน chunk ถัดไป
+        """
+        loop = asyncio.get_running_loop()
+
+        def forward(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            response = {}
+
+            def start_response(status_line, headers, exc_info=None):
+                response['start'] = {'type': 'http.response.start',
+                                     'status': int(status_line.split(' ', 1)[0]),
+                                     'headers': _asgi_headers(headers)}
+
+            iterable = self.flask_app(environ, start_response)
+            try:
+                for chunk in iterable:
+                    if 'start' in response:
+                        forward(response.pop('start'))
+                    if chunk:
+                        forward({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if 'start' in response:
+                    forward(response.pop('start'))
+                forward({'type': 'http.response.body', 'body': b''})
+            finally:
+                close = getattr(iterable, 'close', None)
+                if close is not None:
+                    close()
+
+        await loop.run_in_executor(None, run)
+
+app = PromptPayASGI()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run('asgi:app', host='0.0.0.0', port=int(os.environ.get('PORT', 8000)))
@@ -0,0 +1,275 @@
+"""Offline batch generator: pre-render many PromptPay QR codes from a file.
+
+อ่านรายการจาก CSV หรือ JSON Lines ทีละแถว (header/field: mobile, amount, name
+หรือ Bill Payment: biller_id, ref1, ref2, amount, name, terminal, reference)
+กระจายงานสร้าง payload และ render ไปยัง process pool โดยจำกัดจำนวนงานที่ค้าง
+อยู่ แล้วเขียนผลลงโฟลเดอร์, ไฟล์ .tar หรือ .zip
+
+    python batch.py rows.csv --output qr_out/
+    python batch.py rows.jsonl --output qr.zip --workers 8
+    cat rows.csv | python batch.py - --output qr.tar --format svg
+    python batch.py invoices.csv --output bills/ --time-budget 3600   # หยุดเมื่อครบ 1 ชั่วโมง
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import tarfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+
+import metrics
+from generate_qr import QR_FORMAT_EXTENSIONS, process_batch_row
+
+
+def iter_rows(stream, input_format):
+    """Yield row dicts from a CSV or JSON Lines text stream"""
+    if input_format == 'csv':
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # ส่งต่อให้ process_batch_row รายงานเป็นแถวที่ผิดพลาด
+            yield line
+
+
+@contextmanager
+def open_rows(path, input_format=None):
+    """Open a CSV/JSON Lines file (``'-'`` = stdin) and yield an iterator of its rows
+
+    ``input_format`` ค่าเริ่มต้นดูจากนามสกุล (.jsonl/.ndjson = jsonl, อื่น ๆ = csv)
+    """
+    if input_format is None:
+        input_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    if path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+    else:
+        stream = open(path, encoding='utf-8-sig', newline='')
+    with stream:
+        yield iter_rows(stream, input_format)
+
+
+def report_failed(failed):
+    """Print (row number, error) pairs to stderr and return the exit status (0 or 1)"""
+    if not failed:
+        return 0
+    print(f"❌ {len(failed)} failed rows:", file=sys.stderr)
+    for index, error in failed:
+        print(f"   row {index}: {error}", file=sys.stderr)
+    return 1
+
+
+def iter_chunks(rows, size, start_row=1):
+    """Group ``rows`` into lists of (row number, row) with ``size`` items
+
+    แถวก่อน ``start_row`` ถูกข้ามไปแต่ยังนับลำดับ (ใช้ทำต่อจากรอบที่หยุดเพราะหมดเวลา)
+    """
+    numbered = islice(enumerate(rows, start=1), start_row - 1, None)
+    while True:
+        chunk = list(islice(numbered, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_chunk(task, chunk, *args):
+    """Pool side of map_chunks: return the task's result with its stage timings"""
+    with metrics.capture_stages(observe=False) as timings:
+        result = task(chunk, *args)
+    return result, timings
+
+
+def map_chunks(task, chunks, *args, workers=None, max_in_flight=None, stop=None):
+    """Run ``task(chunk, *args)`` on a process pool and yield each result as it finishes
+
+    จำนวน chunk ที่ส่งเข้า pool พร้อมกันถูกจำกัดไว้ที่ ``max_in_flight``
+    (ค่าเริ่มต้น 2 เท่าของจำนวน worker) หน่วยความจำจึงไม่โตตามขนาดไฟล์
+    ถ้า ``stop(chunk)`` คืน True จะไม่ส่ง chunk นั้นและ chunk ถัดไป งานที่ส่งไปแล้ว
+    ทำจนเสร็จ ผลลัพธ์เรียงตามลำดับที่เสร็จ ไม่ใช่ลำดับ chunk
+
+    เวลาแต่ละขั้นตอน (``metrics.stage``) ใน worker ถูกบันทึกลง registry ของ process นี้
+    (เขียนลง ``METRICS_DIR`` ตอนจบ ถ้ากำหนดไว้)
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or workers * 2
+    stopped = False
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        while True:
+            while len(pending) < max_in_flight and not stopped:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if stop is not None and stop(chunk):
+                    stopped = True
+                    break
+                pending.add(pool.submit(_run_chunk, task, chunk, *args))
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result, timings = future.result()
+                metrics.record_stages(timings)
+                yield result
+
+
+def render_chunk(chunk, fmt):
+    """Render a chunk of rows in a worker process
+
+    คืน list ของ (ลำดับแถว, ชื่อไฟล์, ข้อมูล, ข้อความ error)
+    """
+    results = []
+    for index, row in chunk:
+        try:
+            stem, data = process_batch_row(row, fmt)
+        except Exception as e:
+            results.append((index, None, None, str(e)))
+            continue
+        results.append((index, f"{index:06d}_{stem}.{QR_FORMAT_EXTENSIONS[fmt]}", data, None))
+    return results
+
+
+class DirectoryWriter:
+    """Write each file into a directory"""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+
+    def write(self, name, data):
+        with open(os.path.join(self.path, name), 'wb') as f:
+            f.write(data)
+
+    def close(self):
+        pass
+
+
+class ZipWriter:
+    """Append each file to a ZIP archive (stored, images are already compressed)"""
+
+    def __init__(self, path):
+        self.archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED)
+
+    def write(self, name, data):
+        self.archive.writestr(name, data)
+
+    def close(self):
+        self.archive.close()
+
+
+class TarWriter:
+    """Append each file to a tar archive"""
+
+    def __init__(self, path):
+        self.archive = tarfile.open(path, 'w')
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+
+def open_writer(path):
+    """Pick the output writer from the output path"""
+    if path.endswith('.zip'):
+        return ZipWriter(path)
+    if path.endswith('.tar'):
+        return TarWriter(path)
+    return DirectoryWriter(path)
+
+
+def run_batch(rows, writer, fmt='png', workers=None, chunk_size=64, max_in_flight=None,
+              time_budget=None, start_row=1):
+    """Render ``rows`` with a process pool and write them with ``writer``
+
+    งานถูกส่งผ่าน ``map_chunks`` โดยมีงานค้างไม่เกิน ``max_in_flight`` chunk
+    ถ้ากำหนด ``time_budget`` (วินาที) จะหยุดส่ง chunk ใหม่เมื่อหมดเวลา งานที่ส่งไปแล้ว
+    ทำจนเสร็จ แถวที่ทำแล้วจึงต่อเนื่องกันเสมอ และ ``next_row`` คือแถวแรกที่ยังไม่ได้ทำ
+    คืน dict สรุปผล: จำนวนที่สำเร็จ, แถวที่ผิดพลาด, throughput และ next_row
+    """
+    ok = 0
+    failed = []
+    next_row = None
+    started = time.perf_counter()
+
+    def out_of_time(chunk):
+        nonlocal next_row
+        if time_budget is not None and time.perf_counter() - started >= time_budget:
+            next_row = chunk[0][0]
+            return True
+        return False
+
+    for results in map_chunks(render_chunk, iter_chunks(rows, chunk_size, start_row), fmt,
+                              workers=workers, max_in_flight=max_in_flight, stop=out_of_time):
+        for index, filename, data, error in results:
+            if error is None:
+                writer.write(filename, data)
+                ok += 1
+            else:
+                failed.append((index, error))
+
+    elapsed = time.perf_counter() - started
+    total = ok + len(failed)
+    return {
+        'total': total,
+        'ok': ok,
+        'failed': sorted(failed),
+        'seconds': elapsed,
+        'rows_per_second': total / elapsed if elapsed else 0.0,
+        'next_row': next_row,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-generate PromptPay QR codes from CSV or JSON Lines')
+    parser.add_argument('input', help="CSV/JSON Lines file, or '-' for stdin")
+    parser.add_argument('-o', '--output', required=True,
+                        help='output directory, or a file ending in .zip or .tar')
+    parser.add_argument('--input-format', choices=('csv', 'jsonl'),
+                        help='default: from the file extension (.jsonl/.ndjson = jsonl, otherwise csv)')
+    parser.add_argument('--format', choices=tuple(QR_FORMAT_EXTENSIONS), default='png')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='default: CPU count')
+    parser.add_argument('--chunk-size', type=int, default=64, help='rows per task sent to a worker')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='stop starting new rows after this many seconds (exit status 2)')
+    parser.add_argument('--start-row', type=int, default=1,
+                        help='skip rows before this row number (resume an earlier run)')
+    args = parser.parse_args(argv)
+
+    writer = open_writer(args.output)
+    try:
+        with open_rows(args.input, args.input_format) as rows:
+            summary = run_batch(rows, writer, args.format, args.workers, args.chunk_size,
+                                time_budget=args.time_budget, start_row=args.start_row)
+    finally:
+        writer.close()
+
+    print(f"✅ {summary['ok']}/{summary['total']} QR codes -> {args.output} "
+          f"in {summary['seconds']:.2f}s ({summary['rows_per_second']:.0f} rows/s)")
+    status = report_failed(summary['failed'])
+    if summary['next_row'] is not None:
+        print(f"⏱️  time budget reached; resume with --start-row {summary['next_row']}",
+              file=sys.stderr)
+        return 2
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
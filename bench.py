@@ -0,0 +1,496 @@
+"""Reproducible benchmarks for the QR generation pipeline.
+
+ผลลัพธ์ทุกโหมดบันทึกเป็น JSON (``--output``) เพื่อเทียบกันข้ามรอบได้:
+
+* ``micro`` — จับเวลาแต่ละขั้นตอนแยกกัน (CRC16, payload, encode, PNG/SVG)
+* ``e2e``   — เรียก ``POST /generate`` และ ``/payload`` ผ่าน Flask test client ใน process เดียว
+  ทั้งแบบ render ใหม่ทุกครั้งและแบบได้จาก cache
+* ``load``  — ยิงคำขอ HTTP พร้อมกันหลายระดับ concurrency แล้วรายงาน p50/p95/p99
+  และ requests/sec (ถ้าไม่ระบุ ``--url`` จะเปิดเซิร์ฟเวอร์ชั่วคราวใน process นี้)
+* ``servers`` — load test เดียวกันกับ gunicorn (sync, ``app:app``) และ uvicorn
+  (ASGI, ``asgi:app``) ที่เปิดเป็น subprocess เพื่อเทียบ throughput และ tail latency
+* ``stress`` — คำขอที่เหมือนกันเข้ามาพร้อมกันเป็นชุด เทียบ CPU ต่อคำขอเมื่อปิด/เปิด
+  single-flight (``QR_SINGLE_FLIGHT``)
+
+    python bench.py micro --output before.json
+    python bench.py load --url http://127.0.0.1:8000 --concurrency 1,8,32
+    python bench.py servers --concurrency 1,16,64
+    python bench.py stress --clients 100
+    python bench.py compare before.json after.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.client import HTTPConnection
+from itertools import count
+from urllib.parse import urlencode, urlsplit
+
+os.environ.setdefault('QR_WARM_UP', '0')
+
+import generate_qr
+from crc16 import _crc16_ccitt_bitwise, crc16_ccitt
+from qr_plan import _fit_qr
+from qr_render import render_png, render_svg
+
+SAMPLE_TARGET = '0812345678'
+
+
+def _payloads(n, target=SAMPLE_TARGET):
+    """Distinct payloads (amount changes) so no cache can answer"""
+    return [generate_qr.generate_promptpay_payload(target, f"{i + 1}.{i % 100:02d}", 'Test Shop')
+            for i in range(n)]
+
+
+def _time_per_call(func, number, repeat=5):
+    """Return (best, median) seconds per call over ``repeat`` runs"""
+    runs = sorted(t / number for t in timeit.repeat(func, number=number, repeat=repeat))
+    return runs[0], runs[len(runs) // 2]
+
+
+def run_micro(number=200):
+    """Time each pipeline stage in isolation"""
+    payload = _payloads(1)[0]
+    payload_bytes = payload.encode('ascii')
+    qr = generate_qr.make_qr(payload)
+    matrix = qr.get_matrix()
+    amounts = count(1)
+    numbers = [f"{i:013d}" if i % 2 else f"08{i:08d}" for i in range(1000)]
+
+    def payload_cold():
+        generate_qr.compile_payload_template.cache_clear()
+        generate_qr.generate_promptpay_payload(SAMPLE_TARGET, '1000.00', 'Test Shop')
+
+    def pil_png():
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(generate_qr.BytesIO(), 'PNG')
+
+    cases = {
+        'crc16.bitwise': (lambda: _crc16_ccitt_bitwise(payload_bytes), number * 20),
+        'crc16.table': (lambda: crc16_ccitt(payload_bytes), number * 20),
+        'payload.compiled': (lambda: generate_qr.generate_promptpay_payload(
+            SAMPLE_TARGET, f"{next(amounts)}.00", 'Test Shop'), number * 20),
+        'payload.cold_template': (payload_cold, number * 5),
+        'encode.make_qr': (lambda: generate_qr.make_qr(payload), number),
+        'encode.make_fit': (lambda: _fit_qr(payload, generate_qr.QR_ERROR_CORRECTION), number // 4),
+        'image.png_direct': (lambda: render_png(matrix, generate_qr.QR_BOX_SIZE,
+                                                generate_qr.QR_PNG_COMPRESS_LEVEL), number),
+        'image.png_pil': (pil_png, number // 4),
+        'image.svg': (lambda: render_svg(matrix), number),
+        'validate.national_id_int': (lambda: generate_qr._is_valid_national_id_int(
+            '1234567890121'), number * 20),
+        'validate.national_id_table': (lambda: generate_qr.is_valid_national_id(
+            '1234567890121'), number * 20),
+        'validate.bulk_1000': (lambda: generate_qr.validate_numbers(numbers), max(number // 20, 1)),
+    }
+    results = {}
+    for name, (func, calls) in cases.items():
+        func()
+        best, median = _time_per_call(func, max(calls, 1))
+        results[name] = {'best_us': best * 1e6, 'median_us': median * 1e6}
+    return results
+
+
+def run_e2e(number=200):
+    """Time POST /generate through the Flask test client"""
+    app = generate_qr.create_app(warm=False)
+    client = app.test_client()
+    amounts = count(1)
+    results = {}
+    for fmt in ('png', 'svg'):
+        for renderer in (('direct', 'pil') if fmt == 'png' else ('direct',)):
+            query = {'format': fmt, 'renderer': renderer}
+
+            def uncached():
+                response = client.post('/generate', query_string=query,
+                                       data={'mobile': SAMPLE_TARGET, 'amount': f"{next(amounts)}.00"})
+                assert response.status_code == 200, response.data
+
+            def cached():
+                response = client.post('/generate', query_string=query,
+                                       data={'mobile': SAMPLE_TARGET, 'amount': '1.00'})
+                assert response.status_code == 200, response.data
+
+            calls = number if renderer == 'direct' else max(number // 4, 1)
+            for label, func in (('uncached', uncached), ('cached', cached)):
+                func()
+                best, median = _time_per_call(func, calls)
+                results[f"generate.{fmt}.{renderer}.{label}"] = {
+                    'best_us': best * 1e6, 'median_us': median * 1e6}
+
+    def payload_only():
+        response = client.post('/payload', data={'mobile': SAMPLE_TARGET,
+                                                 'amount': f"{next(amounts)}.00"})
+        assert response.status_code == 200, response.data
+
+    payload_only()
+    best, median = _time_per_call(payload_only, number)
+    results['payload.json'] = {'best_us': best * 1e6, 'median_us': median * 1e6}
+    results['validate'] = dict(zip(('best_us', 'median_us'), (
+        t * 1e6 for t in _time_per_call(lambda: client.get(f'/validate/{SAMPLE_TARGET}'), number))))
+    generate_qr.render_cache.clear()
+    return results
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def _start_local_server():
+    """Serve create_app() on an ephemeral port in a background thread"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, generate_qr.create_app(), threaded=True,
+                         request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def _load_level(url, concurrency, requests_per_level, unique_ratio, unique_amounts):
+    """Send ``requests_per_level`` requests with ``concurrency`` client threads"""
+    parts = urlsplit(url)
+    sequence = count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client():
+        conn = HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+        own = []
+        while True:
+            i = next(sequence)
+            if i >= requests_per_level:
+                break
+            # ส่วนหนึ่งเป็นจำนวนเงินไม่ซ้ำ (render ใหม่) ที่เหลือซ้ำกัน (cache)
+            amount = f"{next(unique_amounts)}.00" if (i % 100) < unique_ratio * 100 else '1.00'
+            body = urlencode({'mobile': SAMPLE_TARGET, 'amount': amount})
+            started = time.perf_counter()
+            try:
+                conn.request('POST', parts.path.rstrip('/') + '/generate', body,
+                             {'Content-Type': 'application/x-www-form-urlencoded'})
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except OSError as e:
+                conn.close()
+                conn = HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+                status = repr(e)
+            own.append(time.perf_counter() - started)
+            if status != 200:
+                with lock:
+                    errors.append(status)
+        conn.close()
+        with lock:
+            latencies.extend(own)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(client) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'seconds': elapsed,
+        'requests_per_second': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1e3,
+        'p95_ms': percentile(latencies, 0.95) * 1e3,
+        'p99_ms': percentile(latencies, 0.99) * 1e3,
+    }
+
+
+def run_load(url=None, concurrency=(1, 4, 16), requests_per_level=500, unique_ratio=0.2):
+    """Measure throughput and tail latency of POST /generate at each concurrency"""
+    server = None
+    if url is None:
+        server, url = _start_local_server()
+    # จำนวนเงินที่ไม่ซ้ำต้องไม่ซ้ำข้ามระดับด้วย ไม่เช่นนั้นระดับหลังจะได้จาก cache
+    unique_amounts = count(2)
+    try:
+        return {'url': url, 'unique_ratio': unique_ratio,
+                'levels': [_load_level(url, level, requests_per_level, unique_ratio, unique_amounts)
+                           for level in concurrency]}
+    finally:
+        if server is not None:
+            server.shutdown()
+
+
+SERVER_COMMANDS = {
+    # sync: gunicorn ตาม gunicorn.conf.py (preload, WEB_CONCURRENCY × GUNICORN_THREADS)
+    'gunicorn': [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                 '--bind', '127.0.0.1:{port}', 'app:app'],
+    # async: uvicorn process เดียว render ใน process pool (asgi.py)
+    'uvicorn': [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1',
+                '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+def _free_port():
+    import socket
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_ready(url, timeout=60):
+    parts = urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = HTTPConnection(parts.hostname, parts.port, timeout=2)
+            conn.request('GET', '/validate/0812345678')
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} ไม่ตอบภายใน {timeout} วินาที')
+
+
+def run_servers(servers=tuple(SERVER_COMMANDS), concurrency=(1, 4, 16), requests_per_level=500,
+                unique_ratio=0.2):
+    """Start each server in a subprocess and run the same load test against it"""
+    results = {}
+    root = os.path.dirname(os.path.abspath(__file__))
+    for name in servers:
+        port = _free_port()
+        command = [part.format(port=port) for part in SERVER_COMMANDS[name]]
+        process = subprocess.Popen(command, cwd=root, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.DEVNULL)
+        try:
+            url = f"http://127.0.0.1:{port}"
+            _wait_until_ready(url)
+            results[name] = run_load(url, concurrency, requests_per_level, unique_ratio)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return results
+
+
+def run_stress(clients=64, bursts=20):
+    """Fire bursts of identical concurrent requests with and without single-flight
+
+    แต่ละ burst ใช้จำนวนเงินใหม่ (ไม่มีใน cache) แล้วให้ ``clients`` thread ส่งคำขอ
+    เดียวกันพร้อมกัน วัด CPU time ต่อคำขอและจำนวนครั้งที่ render จริง
+    """
+    from qr_cache import SingleFlight
+
+    app = generate_qr.create_app(warm=False)
+    local = threading.local()
+    renders = count()
+    render_qr = generate_qr.render_qr
+
+    def counting_render(*args, **kwargs):
+        next(renders)
+        return render_qr(*args, **kwargs)
+
+    def request(barrier, amount):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        barrier.wait()
+        response = local.client.post('/generate', data={'mobile': SAMPLE_TARGET, 'amount': amount})
+        assert response.status_code == 200, response.data
+
+    amounts = count(1)
+    flight = generate_qr.render_flight
+    results = {}
+    generate_qr.render_qr = counting_render
+    try:
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            for label, render_flight in (('single_flight_off', None),
+                                         ('single_flight_on', SingleFlight())):
+                generate_qr.render_flight = render_flight
+                first_render = next(renders)
+                cpu_started, wall_started = time.process_time(), time.perf_counter()
+                for _ in range(bursts):
+                    barrier = threading.Barrier(clients)
+                    amount = f"{next(amounts)}.00"
+                    for future in [pool.submit(request, barrier, amount) for _ in range(clients)]:
+                        future.result()
+                cpu = time.process_time() - cpu_started
+                wall = time.perf_counter() - wall_started
+                total = clients * bursts
+                results[label] = {
+                    'requests': total,
+                    'renders': next(renders) - first_render - 1,
+                    'cpu_ms_per_request': cpu / total * 1e3,
+                    'requests_per_second': total / wall,
+                }
+    finally:
+        generate_qr.render_qr = render_qr
+        generate_qr.render_flight = flight
+        generate_qr.render_cache.clear()
+    return results
+
+
+def environment():
+    """Describe the machine and code version a result was produced on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import qrcode
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'qrcode': getattr(qrcode, '__version__', None) or _dist_version('qrcode'),
+        'settings': {'renderer': generate_qr.QR_RENDERER,
+                     'png_compress_level': generate_qr.QR_PNG_COMPRESS_LEVEL,
+                     'mask_pattern': generate_qr.QR_MASK_PATTERN},
+    }
+
+
+def _dist_version(name):
+    from importlib import metadata
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def _flatten(results, prefix=''):
+    """Yield (name, metric, value) for timing entries in a result document"""
+    for name, value in results.items():
+        if name == 'load':
+            yield from _load_metrics('load', value)
+        elif name == 'servers':
+            for server, load in value.items():
+                yield from _load_metrics(f"servers.{server}", load)
+        elif name == 'stress':
+            for label, level in value.items():
+                for metric in ('cpu_ms_per_request', 'requests_per_second'):
+                    yield f"stress.{label}", metric, level[metric]
+        elif isinstance(value, dict) and 'median_us' in value:
+            yield prefix + name, 'median_us', value['median_us']
+        elif isinstance(value, dict) and name != 'environment':
+            yield from _flatten(value, f"{prefix}{name}.")
+
+
+def _load_metrics(prefix, load):
+    for level in load['levels']:
+        key = f"{prefix}.c{level['concurrency']}"
+        for metric in ('requests_per_second', 'p50_ms', 'p95_ms', 'p99_ms'):
+            yield key, metric, level[metric]
+
+
+def compare(before, after):
+    """Print the relative change of every metric present in both result files"""
+    old = {(name, metric): value for name, metric, value in _flatten(before)}
+    print(f"{'benchmark':<40} {'metric':<20} {'before':>12} {'after':>12} {'change':>8}")
+    for name, metric, value in _flatten(after):
+        if (name, metric) not in old:
+            continue
+        previous = old[name, metric]
+        change = (value - previous) / previous * 100 if previous else 0.0
+        print(f"{name:<40} {metric:<20} {previous:12.2f} {value:12.2f} {change:+7.1f}%")
+
+
+def _print_timings(results):
+    for name, value in results.items():
+        print(f"   {name:<36} {value['median_us']:10.2f} µs (best {value['best_us']:.2f})")
+
+
+def _print_load(load):
+    for level in load['levels']:
+        print(f"   c={level['concurrency']:<4} {level['requests_per_second']:8.1f} req/s  "
+              f"p50 {level['p50_ms']:7.2f} ms  p95 {level['p95_ms']:7.2f} ms  "
+              f"p99 {level['p99_ms']:7.2f} ms  errors {level['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the PromptPay QR pipeline')
+    sub = parser.add_subparsers(dest='mode', required=True)
+    for mode in ('micro', 'e2e', 'all'):
+        p = sub.add_parser(mode)
+        p.add_argument('-n', '--number', type=int, default=200, help='calls per timing run')
+        p.add_argument('-o', '--output', help='write results as JSON')
+    for mode in ('load', 'servers'):
+        p = sub.add_parser(mode)
+        if mode == 'load':
+            p.add_argument('--url', help='server to test (default: start one in this process)')
+        else:
+            p.add_argument('--server', action='append', choices=tuple(SERVER_COMMANDS),
+                           help='servers to compare (repeatable, default: all)')
+        p.add_argument('-c', '--concurrency', default='1,4,16', help='comma-separated levels')
+        p.add_argument('-n', '--requests', type=int, default=500, help='requests per level')
+        p.add_argument('--unique', type=float, default=0.2,
+                       help='fraction of requests with a new amount (cache misses)')
+        p.add_argument('-o', '--output', help='write results as JSON')
+    p = sub.add_parser('stress', help='duplicate-heavy bursts, single-flight off vs on')
+    p.add_argument('-c', '--clients', type=int, default=64, help='identical requests per burst')
+    p.add_argument('-b', '--bursts', type=int, default=20)
+    p.add_argument('-o', '--output', help='write results as JSON')
+    p = sub.add_parser('compare')
+    p.add_argument('before')
+    p.add_argument('after')
+    args = parser.parse_args(argv)
+
+    if args.mode == 'compare':
+        with open(args.before) as f_before, open(args.after) as f_after:
+            compare(json.load(f_before), json.load(f_after))
+        return 0
+
+    results = {'environment': environment()}
+    if args.mode in ('micro', 'all'):
+        results['micro'] = run_micro(args.number)
+        print('micro-benchmarks (per call):')
+        _print_timings(results['micro'])
+    if args.mode in ('e2e', 'all'):
+        results['e2e'] = run_e2e(args.number)
+        print('end-to-end via test client (per request):')
+        _print_timings(results['e2e'])
+    if args.mode == 'load':
+        levels = [int(level) for level in args.concurrency.split(',')]
+        results['load'] = run_load(args.url, levels, args.requests, args.unique)
+        print(f"load test against {results['load']['url']}:")
+        _print_load(results['load'])
+    if args.mode == 'servers':
+        levels = [int(level) for level in args.concurrency.split(',')]
+        results['servers'] = run_servers(args.server or tuple(SERVER_COMMANDS), levels,
+                                         args.requests, args.unique)
+        for name, load in results['servers'].items():
+            print(f"{name}:")
+            _print_load(load)
+
+    if args.mode == 'stress':
+        results['stress'] = run_stress(args.clients, args.bursts)
+        print(f"{args.bursts} bursts of {args.clients} identical requests:")
+        for label, level in results['stress'].items():
+            print(f"   {label:<18} {level['renders']:5d} renders  "
+                  f"{level['cpu_ms_per_request']:7.3f} ms CPU/request  "
+                  f"{level['requests_per_second']:8.1f} req/s")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"results -> {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Streaming EMVCo TLV parser and CRC verifier for PromptPay payloads.
+
+แยก payload (tag 2 หลัก, ความยาว 2 หลัก, ค่า) จาก bytes/memoryview โดยค่า
+ของแต่ละ tag เป็น memoryview ที่ชี้ไปยังข้อมูลเดิม (ไม่คัดลอก) และแยก template
+ซ้อน (Tag 26-51, 62, 64) ออกเป็น sub-tag พร้อมตรวจ CRC ของ Tag 63
+
+ใช้ตรวจ QR Code ที่พิมพ์จากระบบอื่นได้จาก command line:
+
+    python emv_tlv.py scanned.txt          # หนึ่ง payload ต่อบรรทัด
+    python emv_tlv.py scanned.txt --json   # ผลทุกบรรทัดเป็น JSON Lines
+"""
+
+import sys
+from collections import namedtuple
+
+from crc16 import crc16_ccitt
+
+# Template ที่มี sub-tag ซ้อนอยู่ข้างใน
+NESTED_TAGS = frozenset([f"{tag:02d}" for tag in range(26, 52)] + ['62', '64'])
+
+TAG_NAMES = {
+    '00': 'Payload Format Indicator',
+    '01': 'Point of Initiation Method',
+    '29': 'Merchant Account Information',
+    '30': 'Bill Payment',
+    '52': 'Merchant Category Code',
+    '53': 'Transaction Currency',
+    '54': 'Transaction Amount',
+    '58': 'Country Code',
+    '59': 'Merchant Name',
+    '60': 'Merchant City',
+    '62': 'Additional Data Field',
+    '63': 'CRC',
+}
+
+SUBTAG_NAMES = {
+    '29': {'00': 'Application ID', '01': 'Mobile Number', '02': 'National ID',
+           '03': 'E-Wallet ID'},
+    '30': {'00': 'Application ID', '01': 'Biller ID', '02': 'Reference 1',
+           '03': 'Reference 2'},
+    '62': {'01': 'Bill Number', '02': 'Mobile Number', '03': 'Store Label',
+           '05': 'Reference Label', '06': 'Customer Label', '07': 'Terminal Label'},
+}
+
+
+class PayloadError(ValueError):
+    """Raised when a payload is not a well-formed EMVCo TLV string"""
+
+
+class TLVField(namedtuple('TLVField', 'tag value children')):
+    """One TLV element; ``value`` is a memoryview, ``children`` nested fields"""
+
+    __slots__ = ()
+
+    def to_dict(self, parent=None):
+        """Return a JSON-friendly description of this field"""
+        if parent is None:
+            name = TAG_NAMES.get(self.tag, f'Tag {self.tag}')
+        else:
+            name = SUBTAG_NAMES.get(parent, {}).get(self.tag, f'Tag {self.tag}')
+        info = {
+            'name': name,
+            'length': len(self.value),
+            'value': bytes(self.value).decode('utf-8', 'replace'),
+        }
+        if self.children:
+            info['subfields'] = {child.tag: child.to_dict(self.tag) for child in self.children}
+        return info
+
+
+ParsedPayload = namedtuple('ParsedPayload', 'fields crc crc_expected')
+
+
+def iter_tlv(view, start=0, end=None):
+    """Yield (tag, offset, value) for each TLV element in ``view[start:end]``"""
+    end = len(view) if end is None else end
+    pos = start
+    while pos < end:
+        if pos + 4 > end:
+            raise PayloadError(f'ข้อมูลไม่ครบที่ตำแหน่ง {pos}')
+        header = bytes(view[pos:pos + 4])
+        if not header.isdigit():
+            raise PayloadError(f'tag/ความยาวไม่ถูกต้องที่ตำแหน่ง {pos}: {header!r}')
+        tag = header[:2].decode('ascii')
+        value_end = pos + 4 + int(header[2:])
+        if value_end > end:
+            raise PayloadError(f'ความยาวของ Tag {tag} เกินขอบเขตข้อมูล')
+        yield tag, pos, view[pos + 4:value_end]
+        pos = value_end
+
+
+def parse_payload(data):
+    """Parse a payload (str, bytes or memoryview) and check its structure
+
+    คืน ParsedPayload: fields ระดับบนสุด (พร้อม sub-tag ของ template),
+    CRC ที่อยู่ใน payload และ CRC ที่คำนวณได้ (None ถ้าไม่มี Tag 63)
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    view = memoryview(data)
+
+    fields = []
+    crc = crc_expected = None
+    for tag, pos, value in iter_tlv(view):
+        if crc is not None:
+            raise PayloadError('CRC (Tag 63) ต้องอยู่ท้ายสุดของ payload')
+        children = ()
+        if tag in NESTED_TAGS:
+            children = tuple(TLVField(sub_tag, sub_value, ())
+                             for sub_tag, _, sub_value in iter_tlv(value))
+        elif tag == '63':
+            if len(value) != 4:
+                raise PayloadError('CRC (Tag 63) ต้องมีความยาว 4')
+            crc = bytes(value).decode('ascii', 'replace')
+            crc_expected = f"{crc16_ccitt(view[:pos + 4]):04X}"
+        fields.append(TLVField(tag, value, children))
+
+    if not fields or fields[0].tag != '00':
+        raise PayloadError('payload ต้องขึ้นต้นด้วย Payload Format Indicator (Tag 00)')
+    return ParsedPayload(fields, crc, crc_expected)
+
+
+def verify_payload(data, details=False):
+    """Return a dict describing whether a payload is valid
+
+    payload ถูกต้องเมื่อโครงสร้าง TLV ถูกต้อง มี Tag 63 และ CRC ตรงกัน
+    """
+    try:
+        parsed = parse_payload(data)
+    except PayloadError as e:
+        return {'valid': False, 'crc_valid': False, 'error': str(e)}
+
+    if parsed.crc is None:
+        result = {'valid': False, 'crc_valid': False, 'error': 'ไม่มี CRC (Tag 63)'}
+    elif parsed.crc.upper() != parsed.crc_expected:
+        result = {'valid': False, 'crc_valid': False,
+                  'error': f'CRC ไม่ถูกต้อง (ใน payload {parsed.crc}, คำนวณได้ {parsed.crc_expected})'}
+    else:
+        result = {'valid': True, 'crc_valid': True, 'error': None}
+    if details:
+        result['fields'] = {field.tag: field.to_dict() for field in parsed.fields}
+    return result
+
+
+def main(argv=None):
+    import argparse
+    import json
+    import time
+
+    parser = argparse.ArgumentParser(description='Verify EMVCo/PromptPay payloads, one per line')
+    parser.add_argument('input', help="text file with one payload per line, or '-' for stdin")
+    parser.add_argument('--json', action='store_true', help='print every result as JSON Lines')
+    args = parser.parse_args(argv)
+
+    stream = sys.stdin.buffer if args.input == '-' else open(args.input, 'rb')
+    total = invalid = 0
+    started = time.perf_counter()
+    with stream:
+        for line_no, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            total += 1
+            result = verify_payload(line, details=args.json)
+            if args.json:
+                print(json.dumps({'line': line_no, **result}, ensure_ascii=False))
+            elif not result['valid']:
+                print(f"line {line_no}: {result['error']}")
+            invalid += not result['valid']
+    elapsed = time.perf_counter() - started
+
+    rate = total / elapsed if elapsed else 0.0
+    print(f"{total - invalid}/{total} valid in {elapsed:.2f}s ({rate:.0f} payloads/s)",
+          file=sys.stderr)
+    return 1 if invalid else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,22 +1,28 @@
-from flask import Flask, request, send_file, render_template_string, jsonify
+from flask import (Blueprint, Flask, Response, current_app, request, jsonify, redirect,
+                   stream_with_context, url_for)
 import qrcode
-from io import BytesIO
+from io import BytesIO, StringIO, TextIOWrapper
 import base64
+import csv
+import math
+import os
+from functools import lru_cache
+from operator import mul
+from tempfile import SpooledTemporaryFile
 
-app = Flask(__name__)
+import metrics
+from crc16 import crc16_ccitt
+from emv_tlv import PayloadError, parse_payload, verify_payload
+from metrics import stage
+from precompressed import PrecompressedAsset
+from qr_archive import iter_zip
+from qr_cache import RenderCache, SharedRenderCache, SingleFlight, payload_etag
+from qr_pack import PackStore
+from qr_plan import build_qr
+from qr_render import render_matrix, render_png, render_svg
+from qr_static import StaticQRStore
 
-def crc16_ccitt(data):
-    """Calculate CRC16-CCITT checksum for PromptPay"""
-    crc = 0xFFFF
-    for byte in data:
-        crc ^= byte << 8
-        for _ in range(8):
-            if crc & 0x8000:
-                crc = (crc << 1) ^ 0x1021
-            else:
-                crc <<= 1
-            crc &= 0xFFFF
-    return crc
+bp = Blueprint('promptpay', __name__)
 
 def format_mobile(mobile):
     """Format mobile number for PromptPay"""
@@ -35,534 +41,719 @@ def format_mobile(mobile):
     else:
         raise ValueError('รูปแบบเบอร์โทรศัพท์ไม่ถูกต้อง (ต้องเป็นเบอร์โทรศัพท์ 10 หลัก หรือเลขบัตรประชาชน 13 หลัก)')
 
+# PromptPay AID (Tag 29 sub-tag 00)
+PROMPTPAY_AID = "0016A000000677010111"
+
+
+class PayloadTemplate:
+    """Pre-built PromptPay payload for one target (mobile or national ID)
+
+    ส่วนหัวของ payload (Tag 00, 01, 29, 58, 53) ไม่ขึ้นกับจำนวนเงิน จึงสร้าง
+    และคำนวณ CRC ไว้ครั้งเดียว ตอนเรียก fill() จะประกอบเฉพาะส่วนท้าย
+    (Tag 54, 59, 63) แล้วคำนวณ CRC ต่อจากค่าที่เก็บไว้
+    """
+
+    __slots__ = ('target', 'prefix', 'prefix_crc', '_prefix_str', '_merchant_str')
+
+    def __init__(self, mobile):
+        mobile_clean = ''.join(filter(str.isdigit, mobile))
+
+        # Merchant Account Information (Tag 29)
+        if len(mobile_clean) == 13:
+            # เลขบัตรประชาชน - ใช้ Tag 02 แทน Tag 01
+            target = mobile_clean
+            merchant_info = f"{PROMPTPAY_AID}02{len(target):02d}{target}"
+        else:
+            # เบอร์โทรศัพท์ - ใช้ Tag 01
+            target = format_mobile(mobile_clean)
+            merchant_info = f"{PROMPTPAY_AID}01{len(target):02d}{target}"
+
+        merchant = ''.join((
+            f"29{len(merchant_info):02d}{merchant_info}",
+            "5802TH",                                   # Country Code
+            "5303764",                                  # Transaction Currency (THB)
+        ))
+        prefix = ''.join((
+            "000201",                                   # Payload Format Indicator
+            "010212",                                   # Point of Initiation Method (dynamic)
+            merchant,
+        ))
+
+        self.target = target
+        self._merchant_str = merchant
+        self._prefix_str = prefix
+        self.prefix = prefix.encode('ascii')
+        self.prefix_crc = crc16_ccitt(self.prefix)
+
+    def fill(self, amount, name=""):
+        """Return the complete payload for ``amount`` and optional ``name``"""
+        amount_str = f"{float(amount):.2f}"
+
+        # Transaction Amount, Merchant Name (if provided), CRC (Tag 63)
+        if name:
+            name = name[:25]  # Limit to 25 characters
+            tail = f"54{len(amount_str):02d}{amount_str}59{len(name):02d}{name}6304"
+        else:
+            tail = f"54{len(amount_str):02d}{amount_str}6304"
+
+        crc = crc16_ccitt(tail.encode('ascii'), self.prefix_crc)
+        return f"{self._prefix_str}{tail}{crc:04X}"
+
+    def static(self, name=""):
+        """Return the amount-less (static) payload: ``010211`` and no Tag 54
+
+        ผู้จ่ายกรอกจำนวนเงินเองในแอปธนาคาร ใช้กับ QR ที่พิมพ์ติดหน้าร้าน
+        """
+        payload = f"000201010211{self._merchant_str}"
+        if name:
+            name = name[:25]  # Limit to 25 characters
+            payload += f"59{len(name):02d}{name}"
+        payload += "6304"
+        return f"{payload}{crc16_ccitt(payload.encode('ascii')):04X}"
+
+
+@lru_cache(maxsize=4096)
+def compile_payload_template(mobile):
+    """Return the cached PayloadTemplate for a PromptPay target"""
+    return PayloadTemplate(mobile)
+
+
 def generate_promptpay_payload(mobile, amount, name=""):
     """Generate PromptPay QR payload"""
-    mobile_clean = ''.join(filter(str.isdigit, mobile))
-    amount = float(amount)
-    amount_str = f"{amount:.2f}"
+    return compile_payload_template(mobile).fill(amount, name)
+
+
+def generate_static_payload(mobile, name=""):
+    """Generate a static (amount-less) PromptPay QR payload"""
+    return compile_payload_template(mobile).static(name)
+
+# Bill Payment AID (Tag 30 sub-tag 00)
+PROMPTPAY_BILLER_AID = "0016A000000677010112"
+
+
+class BillPaymentTemplate:
+    """Pre-built Bill Payment (Tag 30) payload prefix for one biller
+
+    ความยาวของ Tag 30 ขึ้นกับ Ref1/Ref2 จึงเก็บ prefix (Tag 00, 01, 30 จนถึง
+    Biller ID) และ CRC ของ prefix แยกตามความยาวของ Ref1/Ref2 ซึ่งมีได้ไม่กี่สิบค่า
+    ตอน fill() จะคำนวณ CRC ต่อเฉพาะ Ref1/Ref2 และส่วนท้าย (Tag 58, 53, 54, 59, 62, 63)
+    """
+
+    __slots__ = ('biller_id', '_biller_info', '_prefixes')
+
+    def __init__(self, biller_id):
+        self.biller_id = biller_id
+        self._biller_info = f"{PROMPTPAY_BILLER_AID}01{len(biller_id):02d}{biller_id}"
+        self._prefixes = {}
+
+    def prefix(self, refs_length):
+        """Return (prefix, prefix CRC) for Ref1/Ref2 sub-tags ``refs_length`` characters long"""
+        cached = self._prefixes.get(refs_length)
+        if cached is None:
+            info_length = len(self._biller_info) + refs_length
+            prefix = ''.join((
+                "000201",                               # Payload Format Indicator
+                "010212",                               # Point of Initiation Method
+                f"30{info_length:02d}{self._biller_info}",
+            ))
+            cached = self._prefixes[refs_length] = (prefix, crc16_ccitt(prefix.encode('ascii')))
+        return cached
+
+    def fill(self, ref1, amount, ref2="", name="", terminal="", reference=""):
+        """Return the complete payload for one invoice"""
+        refs = f"02{len(ref1):02d}{ref1}"
+        if ref2:
+            refs += f"03{len(ref2):02d}{ref2}"
+        prefix, prefix_crc = self.prefix(len(refs))
+        amount_str = f"{float(amount):.2f}"
+
+        # Additional Data Field (Tag 62): Reference Label, Terminal Label
+        additional = ""
+        if reference:
+            additional += f"05{len(reference):02d}{reference}"
+        if terminal:
+            additional += f"07{len(terminal):02d}{terminal}"
+
+        tail = [refs, "5802TH", "5303764", f"54{len(amount_str):02d}{amount_str}"]
+        if name:
+            name = name[:25]  # Limit to 25 characters
+            tail.append(f"59{len(name):02d}{name}")
+        if additional:
+            tail.append(f"62{len(additional):02d}{additional}")
+        tail.append("6304")
+        tail = ''.join(tail)
+
+        crc = crc16_ccitt(tail.encode('ascii'), prefix_crc)
+        return f"{prefix}{tail}{crc:04X}"
+
+
+@lru_cache(maxsize=4096)
+def compile_bill_template(biller_id):
+    """Return the cached BillPaymentTemplate for a 15-digit biller ID"""
+    return BillPaymentTemplate(biller_id)
+
+
+def generate_bill_payment_payload(biller_id, ref1, amount, ref2="", name="", terminal="",
+                                  reference=""):
+    """Generate PromptPay Bill Payment QR payload"""
+    return compile_bill_template(biller_id).fill(ref1, amount, ref2, name, terminal, reference)
+
+@bp.route('/')
+def index():
+    # หน้าเว็บถูก render และบีบอัดไว้แล้วใน create_app()
+    return current_app.extensions['promptpay_index'].response(request)
+
+def validate_target(mobile_clean):
+    """Return an error message for an invalid mobile/national ID, or None"""
+    if len(mobile_clean) == 10:
+        # เบอร์โทรศัพท์ 10 หลัก
+        if not mobile_clean.startswith(('06', '08', '09')):
+            return 'เบอร์โทรศัพท์ต้องขึ้นต้นด้วย 06, 08, หรือ 09'
+    elif len(mobile_clean) == 13:
+        # เลขบัตรประชาชน 13 หลัก
+        # ตรวจสอบ checksum ของเลขบัตรประชาชน (ไม่บังคับ แต่แนะนำ)
+        if not is_valid_national_id(mobile_clean):
+            return 'เลขบัตรประชาชนไม่ถูกต้อง'
+    else:
+        return 'ต้องเป็นเบอร์โทรศัพท์ 10 หลัก หรือเลขบัตรประชาชน 13 หลัก'
+    return None
+
+def validate_amount(amount):
+    """Return an error message for an invalid amount, or None"""
+    try:
+        amount_float = float(amount)
+    except ValueError:
+        return 'จำนวนเงินไม่ถูกต้อง'
+    if not math.isfinite(amount_float):
+        return 'จำนวนเงินไม่ถูกต้อง'
+    if amount_float <= 0:
+        return 'จำนวนเงินต้องมากกว่า 0'
+    if amount_float > 999999.99:
+        return 'จำนวนเงินต้องไม่เกิน 999,999.99 บาท'
+    return None
+
+def validate_biller_id(biller_id):
+    """Return an error message for an invalid biller ID, or None"""
+    # เลขประจำตัวผู้เสียภาษี 13 หลัก + suffix 2 หลัก
+    if len(biller_id) != 15 or not biller_id.isdigit():
+        return 'Biller ID ต้องเป็นตัวเลข 15 หลัก'
+    return None
+
+def validate_reference(value, label, max_length=20):
+    """Return an error message for an invalid Ref1/Ref2, or None"""
+    if len(value) > max_length:
+        return f'{label} ต้องไม่เกิน {max_length} ตัวอักษร'
+    if not (value.isascii() and value.isalnum() and value.upper() == value):
+        return f'{label} ต้องเป็นตัวอักษรภาษาอังกฤษพิมพ์ใหญ่หรือตัวเลขเท่านั้น'
+    return None
+
+def validate_label(value, label, max_length=25):
+    """Return an error message for an invalid Tag 62 label, or None"""
+    if len(value) > max_length:
+        return f'{label} ต้องไม่เกิน {max_length} ตัวอักษร'
+    if not (value.isascii() and value.isprintable()):
+        return f'{label} ต้องเป็นตัวอักษรภาษาอังกฤษ'
+    return None
+
+# Render settings ที่ใช้กับทุก QR Code
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_M
+# กำหนด mask pattern (0-7) เพื่อข้ามการค้นหา mask ที่ penalty ต่ำสุด (ไม่บังคับ)
+QR_MASK_PATTERN = int(os.environ['QR_MASK_PATTERN']) if os.environ.get('QR_MASK_PATTERN') else None
+
+# direct = เขียน PNG 1-bit จาก module matrix โดยตรง, pil = ใช้ make_image ของ qrcode
+QR_RENDERERS = ('direct', 'pil')
+QR_RENDERER = os.environ.get('QR_RENDERER', 'direct')
+QR_PNG_COMPRESS_LEVEL = int(os.environ.get('QR_PNG_COMPRESS_LEVEL', 6))
+
+# รูปแบบผลลัพธ์ของ /generate (matrix = ขนาด uint16 + bit ของ module)
+QR_FORMAT_MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+    'matrix': 'application/octet-stream',
+}
+QR_MIMETYPE_FORMATS = {mimetype: fmt for fmt, mimetype in QR_FORMAT_MIMETYPES.items()}
+QR_FORMAT_EXTENSIONS = {'png': 'png', 'svg': 'svg', 'matrix': 'bin'}
+
+render_cache = RenderCache(int(os.environ.get('QR_CACHE_MAX_BYTES', 32 * 1024 * 1024)))
+
+# cache ระดับเครื่องที่ทุก worker ใช้ร่วมกัน (เปิดใช้เมื่อกำหนด QR_SHARED_CACHE_PATH)
+QR_SHARED_CACHE_PATH = os.environ.get('QR_SHARED_CACHE_PATH')
+shared_render_cache = (SharedRenderCache(
+    QR_SHARED_CACHE_PATH, int(os.environ.get('QR_SHARED_CACHE_MAX_BYTES', 256 * 1024 * 1024)))
+    if QR_SHARED_CACHE_PATH else None)
+
+# รวมการ render ที่เหมือนกันซึ่งเข้ามาพร้อมกัน (ปิดได้ด้วย QR_SINGLE_FLIGHT=0)
+render_flight = SingleFlight() if os.environ.get('QR_SINGLE_FLIGHT', '1') != '0' else None
+
+# ภาพที่ render ไว้ล่วงหน้าเป็น <target>.qrpack (ดู qr_pack.py)
+QR_PACK_DIR = os.environ.get('QR_PACK_DIR')
+pack_store = PackStore(QR_PACK_DIR) if QR_PACK_DIR else None
+
+# ภาพ QR แบบ static ของแต่ละร้านเก็บถาวรบนดิสก์ (ดู qr_static.py)
+QR_STATIC_DIR = os.environ.get('QR_STATIC_DIR')
+static_store = StaticQRStore(QR_STATIC_DIR) if QR_STATIC_DIR else None
+
+def make_qr(payload):
+    """Encode a payload into a qrcode.QRCode with the module matrix built"""
+    return build_qr(payload, QR_ERROR_CORRECTION, QR_BOX_SIZE, QR_BORDER, QR_MASK_PATTERN)
+
+def render_qr(payload, fmt='png', renderer=QR_RENDERER):
+    """Render a payload in the requested output format and return bytes"""
+    with stage('encode'):
+        qr = make_qr(payload)
+    with stage('image'):
+        if fmt == 'svg':
+            return render_svg(qr.get_matrix())
+        if fmt == 'matrix':
+            return render_matrix(qr.get_matrix())
+        if renderer != 'pil':
+            return render_png(qr.get_matrix(), QR_BOX_SIZE, QR_PNG_COMPRESS_LEVEL)
+
+        # Generate image
+        img = qr.make_image(fill_color="black", back_color="white")
+    with stage('save'):
+        img_io = BytesIO()
+        img.save(img_io, 'PNG')
+        return img_io.getvalue()
+
+def qr_render_params(fmt='png', renderer=QR_RENDERER):
+    """Return the render settings that identify an output in caches and ETags"""
+    if fmt != 'png':
+        return (fmt, QR_BORDER, QR_ERROR_CORRECTION, QR_MASK_PATTERN)
+    return ('png', renderer, QR_BOX_SIZE, QR_BORDER, QR_ERROR_CORRECTION, QR_MASK_PATTERN,
+            QR_PNG_COMPRESS_LEVEL)
+
+def get_qr_image(payload, fmt='png', renderer=QR_RENDERER, target=None):
+    """Return rendered bytes for a payload, rendering only on a cache miss
+
+    ถ้าระบุ ``target`` (เบอร์ 10 หลักหรือเลขบัตร 13 หลัก) และมี pack ของ target นั้น
+    จะอ่านภาพจาก pack ที่ map ไว้โดยตรงโดยไม่ render
+    """
+    cache_key = (payload,) + qr_render_params(fmt, renderer)
+    if target is not None and pack_store is not None:
+        data = pack_store.get(target, cache_key)
+        if data is not None:
+            # WSGI ต้องการ bytes; ภาพขนาดไม่กี่ร้อยไบต์ คัดลอกครั้งเดียวถูกกว่า sendfile
+            return bytes(data)
+    data = render_cache.get(cache_key)
+    if data is not None:
+        return data
+    if render_flight is None:
+        return _load_or_render(cache_key, payload, fmt, renderer)
+    # คำขอที่เหมือนกันซึ่งเข้ามาระหว่าง render รอผลของครั้งเดียวกัน
+    return render_flight.do(cache_key, lambda: _load_or_render(cache_key, payload, fmt, renderer))
+
+def _load_or_render(cache_key, payload, fmt, renderer):
+    """Read the shared cache or render, then fill the caches"""
+    data = None
+    if shared_render_cache is not None:
+        data = shared_render_cache.get(cache_key)
+    if data is None:
+        data = render_qr(payload, fmt, renderer)
+        if shared_render_cache is not None:
+            shared_render_cache.put(cache_key, data)
+    render_cache.put(cache_key, data)
+    return data
+
+def get_static_qr_image(payload, fmt='png', renderer=QR_RENDERER):
+    """Return rendered bytes for a static payload, preferring the static store
+
+    store อ่านอย่างเดียว (สร้างด้วย ``qr_static.py build``) ร้านที่ไม่มีในนั้นใช้
+    ``get_qr_image`` ซึ่ง cache แบบจำกัดขนาด คำขอจากภายนอกจึงเขียนไฟล์ลงดิสก์ไม่ได้
+    """
+    if static_store is not None:
+        cache_key = (payload,) + qr_render_params(fmt, renderer)
+        data = static_store.get(cache_key, QR_FORMAT_EXTENSIONS[fmt])
+        if data is not None:
+            return data
+    return get_qr_image(payload, fmt, renderer)
+
+def negotiate_format(req=None):
+    """Pick the output format from ?format= / form field or the Accept header"""
+    req = request if req is None else req
+    fmt = req.values.get('format')
+    if fmt:
+        return fmt
+    mimetype = req.accept_mimetypes.best_match(list(QR_FORMAT_MIMETYPES.values()),
+                                               default='image/png')
+    return QR_MIMETYPE_FORMATS[mimetype]
+
+def prepare_payload(req):
+    """Read and validate mobile/amount/name from a request form
+
+    คืน (ข้อความ error, None) หรือ (None, (payload, target)) ใช้ร่วมกันระหว่าง
+    /generate และ /payload ถ้ามีฟิลด์ biller_id จะสร้าง Bill Payment QR แทน
+    """
+    if req.form.get('biller_id'):
+        return prepare_bill_payload(req.form)
     
-    # Build EMVCo payload according to PromptPay standard
-    payload = ""
+    mobile = req.form['mobile']
+    amount = req.form['amount']
+    name = req.form.get('name', '')
     
-    # Payload Format Indicator
-    payload += "000201"
+    if not mobile or not amount:
+        return 'กรุณากรอกข้อมูลให้ครบถ้วน', None
+        
+    # Validate mobile number/national ID
+    with stage('validate'):
+        mobile_clean = ''.join(filter(str.isdigit, mobile))
+        error = validate_target(mobile_clean) or validate_amount(amount)
+    if error:
+        return error, None
+        
+    # Generate payload
+    with stage('payload'):
+        payload = generate_promptpay_payload(mobile_clean, amount, name)
+    return None, (payload, canonical_target(mobile_clean))
+
+def prepare_bill_payload(fields):
+    """Validate Bill Payment fields (a form or batch row); same result as prepare_payload
+
+    ฟิลด์: biller_id, ref1, ref2, amount, name, terminal, reference โดย target
+    ที่คืนคือ Biller ID
+    """
+    biller_id = ''.join(filter(str.isdigit, str(fields.get('biller_id') or '')))
+    ref1 = str(fields.get('ref1') or '').strip().upper()
+    ref2 = str(fields.get('ref2') or '').strip().upper()
+    amount = str(fields.get('amount') or '').strip()
+    name = str(fields.get('name') or '')
+    terminal = str(fields.get('terminal') or '').strip()
+    reference = str(fields.get('reference') or '').strip()
     
-    # Point of Initiation Method
-    payload += "010212"
+    if not ref1 or not amount:
+        return 'กรุณากรอกข้อมูลให้ครบถ้วน', None
     
-    # Merchant Account Information (Tag 29)
-    if len(mobile_clean) == 13:
-        # เลขบัตรประชาชน - ใช้ Tag 02 แทน Tag 01
-        merchant_info = "0016A000000677010111"  # PromptPay AID
-        merchant_info += f"02{len(mobile_clean):02d}{mobile_clean}"  # National ID
-    else:
-        # เบอร์โทรศัพท์ - ใช้ Tag 01
-        formatted_mobile = format_mobile(mobile_clean)
-        merchant_info = "0016A000000677010111"  # PromptPay AID
-        merchant_info += f"01{len(formatted_mobile):02d}{formatted_mobile}"  # Mobile number
+    with stage('validate'):
+        error = (validate_biller_id(biller_id) or validate_reference(ref1, 'Ref1')
+                 or (ref2 and validate_reference(ref2, 'Ref2'))
+                 or validate_label(terminal, 'Terminal') or validate_label(reference, 'Reference')
+                 or validate_amount(amount))
+    if error:
+        return error, None
     
-    payload += f"29{len(merchant_info):02d}{merchant_info}"
+    with stage('payload'):
+        payload = generate_bill_payment_payload(biller_id, ref1, amount, ref2, name, terminal,
+                                                reference)
+    return None, (payload, biller_id)
+
+def prepare_generate(req):
+    """Read and validate a /generate request
+
+    คืน (ข้อความ error, None) เมื่อข้อมูลไม่ถูกต้อง หรือ (None, (payload, fmt, renderer,
+    target)) ใช้ร่วมกันระหว่าง Flask view และโหมด ASGI (asgi.py)
+    """
+    renderer = req.values.get('renderer', QR_RENDERER)
+    fmt = negotiate_format(req)
     
-    # Country Code
-    payload += "5802TH"
+    # Validate inputs
+    if fmt not in QR_FORMAT_MIMETYPES:
+        return f'format ต้องเป็น {", ".join(QR_FORMAT_MIMETYPES)}', None
+    if renderer not in QR_RENDERERS:
+        return f'renderer ต้องเป็น {", ".join(QR_RENDERERS)}', None
     
-    # Transaction Currency
-    payload += "5303764"  # THB
+    error, params = prepare_payload(req)
+    if error:
+        return error, None
+    payload, target = params
+    return None, (payload, fmt, renderer, target)
+
+@bp.route('/generate', methods=['POST'])
+def generate_qr():
+    try:
+        error, params = prepare_generate(request)
+        if error:
+            return error, 400
+        payload, fmt, renderer, target = params
+        
+        # ETag มาจาก payload จึงตอบ 304 ได้โดยไม่ต้อง render
+        etag = payload_etag(payload, *qr_render_params(fmt, renderer))
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            data = get_qr_image(payload, fmt, renderer, target)
+            response = Response(data, mimetype=QR_FORMAT_MIMETYPES[fmt])
+        response.set_etag(etag)
+        response.vary.add('Accept')
+        return response
+        
+    except Exception as e:
+        return f'เกิดข้อผิดพลาด: {str(e)}', 400
+
+@bp.route('/payload', methods=['POST'])
+def payload_json():
+    """Return only the EMVCo payload (for rendering the QR in the browser)
+
+    รับข้อมูลเหมือน /generate แต่ไม่ render ภาพ หน้าเว็บวาด QR เองด้วย
+    static/promptpay-qr.js และใช้ /generate เมื่อวาดไม่ได้
+    """
+    try:
+        error, params = prepare_payload(request)
+    except Exception as e:
+        return jsonify({'error': f'เกิดข้อผิดพลาด: {str(e)}'}), 400
+    if error:
+        return jsonify({'error': error}), 400
+    payload, target = params
+    return jsonify({
+        'payload': payload,
+        'crc': payload[-4:],
+        'length': len(payload),
+        'target': target,
+        'fields': analyze_payload(payload),
+    })
+
+# CDN/เบราว์เซอร์ cache ได้ถาวร เพราะ URL canonical หนึ่ง URL ให้ภาพเดิมเสมอ
+QR_IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def canonical_target(mobile):
+    """Return the canonical 10-digit mobile or 13-digit national ID
+
+    รับรูปแบบเดียวกับ format_mobile (0XXXXXXXXX, XXXXXXXXX, 66XXXXXXXXX,
+    0066XXXXXXXXX) แล้วคืนเบอร์ 10 หลักที่ขึ้นต้นด้วย 0 หรือเลขบัตร 13 หลัก
+    """
+    mobile_clean = ''.join(filter(str.isdigit, mobile))
+    if len(mobile_clean) == 13 and mobile_clean.startswith('0066'):
+        mobile_clean = mobile_clean[4:]
+    elif len(mobile_clean) == 11 and mobile_clean.startswith('66'):
+        mobile_clean = mobile_clean[2:]
+    if len(mobile_clean) == 9 and mobile_clean[0] in ('6', '8', '9'):
+        mobile_clean = '0' + mobile_clean
+    return mobile_clean
+
+@bp.route('/qr/<target>/<amount>.png')
+def qr_image(target, amount):
+    """Cacheable GET form of /generate; non-canonical URLs redirect"""
+    name = request.args.get('name', '')
+    mobile_clean = canonical_target(target)
+    error = validate_target(mobile_clean) or validate_amount(amount)
+    if error:
+        return error, 400
     
-    # Transaction Amount
-    payload += f"54{len(amount_str):02d}{amount_str}"
+    amount_str = f"{float(amount):.2f}"
+    canonical_args = {'name': [name]} if name else {}
+    if (target != mobile_clean or amount != amount_str
+            or request.args.to_dict(flat=False) != canonical_args):
+        location = url_for('.qr_image', target=mobile_clean, amount=amount_str, name=name or None)
+        response = redirect(location, 301)
+        response.headers['Cache-Control'] = QR_IMMUTABLE_CACHE_CONTROL
+        return response
     
-    # Merchant Name (if provided)
-    if name:
-        name = name[:25]  # Limit to 25 characters
-        payload += f"59{len(name):02d}{name}"
+    try:
+        payload = generate_promptpay_payload(mobile_clean, amount_str, name)
+    except Exception as e:
+        return f'เกิดข้อผิดพลาด: {str(e)}', 400
     
-    # Additional Data Field (Tag 62)
-    additional_data = ""
-    if additional_data:
-        payload += f"62{len(additional_data):02d}{additional_data}"
+    etag = payload_etag(payload, *qr_render_params())
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(get_qr_image(payload, target=mobile_clean), mimetype='image/png')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = QR_IMMUTABLE_CACHE_CONTROL
+    return response
+
+@bp.route('/qr/<target>.png')
+def static_qr_image(target):
+    """Static (amount-less) QR of a merchant; never changes, so cached forever"""
+    name = request.args.get('name', '')
+    mobile_clean = canonical_target(target)
+    error = validate_target(mobile_clean)
+    if error:
+        return error, 400
     
-    # CRC (Tag 63)
-    payload += "6304"
+    canonical_args = {'name': [name]} if name else {}
+    if target != mobile_clean or request.args.to_dict(flat=False) != canonical_args:
+        location = url_for('.static_qr_image', target=mobile_clean, name=name or None)
+        response = redirect(location, 301)
+        response.headers['Cache-Control'] = QR_IMMUTABLE_CACHE_CONTROL
+        return response
     
-    # Calculate CRC16
-    crc = crc16_ccitt(payload.encode('ascii'))
-    payload += f"{crc:04X}"
+    try:
+        payload = generate_static_payload(mobile_clean, name)
+    except Exception as e:
+        return f'เกิดข้อผิดพลาด: {str(e)}', 400
     
-    return payload
+    etag = payload_etag(payload, *qr_render_params())
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(get_static_qr_image(payload), mimetype='image/png')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = QR_IMMUTABLE_CACHE_CONTROL
+    return response
 
-@app.route('/')
-def index():
-    return render_template_string('''
-<!DOCTYPE html>
-<html lang="th">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>PromptPay QR Code Generator</title>
-    <link href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css" rel="stylesheet">
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            padding: 20px;
-        }
-        
-        .container {
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            padding: 40px;
-            max-width: 500px;
-            width: 100%;
-        }
-        
-        .header {
-            text-align: center;
-            margin-bottom: 30px;
-        }
-        
-        .header h1 {
-            color: #333;
-            font-size: 2.5em;
-            margin-bottom: 10px;
-        }
-        
-        .header p {
-            color: #666;
-            font-size: 1.1em;
-        }
-        
-        .form-group {
-            margin-bottom: 25px;
-        }
-        
-        .form-group label {
-            display: block;
-            margin-bottom: 8px;
-            color: #333;
-            font-weight: 600;
-            font-size: 1.1em;
-        }
-        
-        .input-wrapper {
-            position: relative;
-        }
-        
-        .input-wrapper i {
-            position: absolute;
-            left: 15px;
-            top: 50%;
-            transform: translateY(-50%);
-            color: #667eea;
-            font-size: 1.2em;
-        }
-        
-        .form-control {
-            width: 100%;
-            padding: 15px 15px 15px 50px;
-            border: 2px solid #e1e5e9;
-            border-radius: 10px;
-            font-size: 1.1em;
-            transition: all 0.3s ease;
-        }
-        
-        .form-control:focus {
-            outline: none;
-            border-color: #667eea;
-            box-shadow: 0 0 0 3px rgba(102, 126, 234, 0.1);
-        }
-        
-        .btn-generate {
-            width: 100%;
-            padding: 18px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            border-radius: 10px;
-            font-size: 1.2em;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            margin-top: 10px;
-        }
-        
-        .btn-generate:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 10px 20px rgba(102, 126, 234, 0.3);
-        }
-        
-        .qr-result {
-            text-align: center;
-            margin-top: 30px;
-            padding: 30px;
-            background: #f8f9fa;
-            border-radius: 15px;
-            display: none;
-        }
-        
-        .qr-code {
-            max-width: 300px;
-            width: 100%;
-            height: auto;
-            border-radius: 10px;
-            box-shadow: 0 10px 20px rgba(0,0,0,0.1);
-        }
-        
-        .download-btn {
-            margin-top: 20px;
-            padding: 12px 30px;
-            background: #28a745;
-            color: white;
-            text-decoration: none;
-            border-radius: 8px;
-            display: inline-block;
-            transition: all 0.3s ease;
-        }
-        
-        .download-btn:hover {
-            background: #218838;
-            transform: translateY(-2px);
-        }
-        
-        .error {
-            background: #f8d7da;
-            color: #721c24;
-            padding: 15px;
-            border-radius: 8px;
-            margin-top: 15px;
-            display: none;
-        }
-        
-        .loading {
-            display: none;
-            text-align: center;
-            margin-top: 20px;
-        }
-        
-        .spinner {
-            border: 4px solid #f3f3f3;
-            border-top: 4px solid #667eea;
-            border-radius: 50%;
-            width: 40px;
-            height: 40px;
-            animation: spin 1s linear infinite;
-            margin: 0 auto;
-        }
-        
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        
-        .info-box {
-            background: #e3f2fd;
-            border-left: 4px solid #2196f3;
-            padding: 15px;
-            margin-bottom: 25px;
-            border-radius: 5px;
-        }
-        
-        .info-box h4 {
-            color: #1976d2;
-            margin-bottom: 8px;
-        }
-        
-        .info-box ul {
-            color: #424242;
-            margin-left: 20px;
-        }
-        
-        .phone-examples {
-            background: #fff3cd;
-            border-left: 4px solid #ffc107;
-            padding: 15px;
-            margin-bottom: 25px;
-            border-radius: 5px;
-        }
-        
-        .phone-examples h4 {
-            color: #856404;
-            margin-bottom: 8px;
-        }
-        
-        .phone-examples ul {
-            color: #856404;
-            margin-left: 20px;
-        }
-        
-        .warning-box {
-            background: #f8d7da;
-            border-left: 4px solid #dc3545;
-            padding: 15px;
-            margin-bottom: 25px;
-            border-radius: 5px;
-        }
-        
-        .warning-box h4 {
-            color: #721c24;
-            margin-bottom: 8px;
-        }
-        
-        .warning-box p {
-            color: #721c24;
-            margin: 0;
-        }
-        
-        @media (max-width: 600px) {
-            .container {
-                padding: 25px;
-                margin: 10px;
-            }
-            
-            .header h1 {
-                font-size: 2em;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1><i class="fas fa-qrcode"></i> PromptPay QR</h1>
-            <p>สร้าง QR Code สำหรับรับเงินผ่าน PromptPay</p>
-        </div>
-        
-        <div class="info-box">
-            <h4><i class="fas fa-info-circle"></i> วิธีใช้งาน</h4>
-            <ul>
-                <li>กรอกเบอร์โทรศัพท์ที่ลงทะเบียน PromptPay</li>
-                <li>กรอกจำนวนเงินที่ต้องการรับ</li>
-                <li>กรอกชื่อผู้รับเงิน (ไม่บังคับ)</li>
-                <li>กด "สร้าง QR Code" เพื่อสร้างบาร์โค้ด</li>
-            </ul>
-        </div>
-        
-        <div class="phone-examples">
-            <h4><i class="fas fa-phone"></i> รูปแบบที่รองรับ</h4>
-            <ul>
-                <li><strong>เบอร์โทรศัพท์:</strong> 06XXXXXXXX, 08XXXXXXXX, 09XXXXXXXX</li>
-                <li><strong>เลขบัตรประชาชน:</strong> 13 หลัก (ต้องลงทะเบียน PromptPay แล้ว)</li>
-            </ul>
-        </div>
-        
-        <div class="warning-box">
-            <h4><i class="fas fa-exclamation-triangle"></i> ข้อควรระวัง</h4>
-            <p>เลขบัตรประชาชนต้องลงทะเบียนกับ PromptPay ผ่านแอปธนาคารก่อนใช้งาน</p>
-        </div>
-        
-        <form id="qrForm">
-            <div class="form-group">
-                <label for="mobile">เบอร์โทรศัพท์ หรือ เลขบัตรประชาชน</label>
-                <div class="input-wrapper">
-                    <i class="fas fa-mobile-alt"></i>
-                    <input type="text" id="mobile" name="mobile" class="form-control" 
-                           placeholder="เบอร์โทรศัพท์ 10 หลัก หรือ เลขบัตรประชาชน 13 หลัก" required>
-                </div>
-            </div>
-            
-            <div class="form-group">
-                <label for="amount">จำนวนเงิน (บาท)</label>
-                <div class="input-wrapper">
-                    <i class="fas fa-money-bill-wave"></i>
-                    <input type="number" id="amount" name="amount" class="form-control" 
-                           placeholder="100.00" step="0.01" min="0.01" required>
-                </div>
-            </div>
-            
-            <div class="form-group">
-                <label for="name">ชื่อผู้รับเงิน (ไม่บังคับ)</label>
-                <div class="input-wrapper">
-                    <i class="fas fa-user"></i>
-                    <input type="text" id="name" name="name" class="form-control" 
-                           placeholder="ชื่อ-นามสกุล" maxlength="25">
-                </div>
-            </div>
-            
-            <button type="submit" class="btn-generate">
-                <i class="fas fa-magic"></i> สร้าง QR Code
-            </button>
-        </form>
-        
-        <div class="loading" id="loading">
-            <div class="spinner"></div>
-            <p>กำลังสร้าง QR Code...</p>
-        </div>
-        
-        <div class="error" id="error"></div>
-        
-        <div class="qr-result" id="qrResult">
-            <h3><i class="fas fa-check-circle" style="color: #28a745;"></i> QR Code สำเร็จ!</h3>
-            <p style="margin: 15px 0;">สแกนด้วยแอปธนาคารเพื่อจ่ายเงิน</p>
-            <img id="qrImage" class="qr-code" alt="PromptPay QR Code">
-            <br>
-            <a id="downloadBtn" class="download-btn" download="promptpay-qr.png">
-                <i class="fas fa-download"></i> ดาวน์โหลด QR Code
-            </a>
-        </div>
-    </div>
-
-    <script>
-        document.getElementById('qrForm').addEventListener('submit', async function(e) {
-            e.preventDefault();
-            
-            const mobile = document.getElementById('mobile').value;
-            const amount = document.getElementById('amount').value;
-            const name = document.getElementById('name').value;
-            const loading = document.getElementById('loading');
-            const error = document.getElementById('error');
-            const qrResult = document.getElementById('qrResult');
-            
-            // Hide previous results
-            error.style.display = 'none';
-            qrResult.style.display = 'none';
-            loading.style.display = 'block';
-            
-            try {
-                const formData = new FormData();
-                formData.append('mobile', mobile);
-                formData.append('amount', amount);
-                formData.append('name', name);
-                
-                const response = await fetch('/generate', {
-                    method: 'POST',
-                    body: formData
-                });
-                
-                if (response.ok) {
-                    const blob = await response.blob();
-                    const imageUrl = URL.createObjectURL(blob);
-                    
-                    document.getElementById('qrImage').src = imageUrl;
-                    document.getElementById('downloadBtn').href = imageUrl;
-                    
-                    loading.style.display = 'none';
-                    qrResult.style.display = 'block';
-                } else {
-                    const errorText = await response.text();
-                    throw new Error(errorText);
-                }
-            } catch (err) {
-                loading.style.display = 'none';
-                error.textContent = 'เกิดข้อผิดพลาด: ' + err.message;
-                error.style.display = 'block';
-            }
-        });
-        
-        // Format input - รองรับทั้งเบอร์โทรและบัตรประชาชน
-        document.getElementById('mobile').addEventListener('input', function(e) {
-            let value = e.target.value.replace(/\D/g, '');
-            
-            // จำกัดความยาวตามประเภท
-            if (value.length <= 10) {
-                // เบอร์โทรศัพท์ 10 หลัก
-                e.target.value = value;
-            } else if (value.length <= 13) {
-                // เลขบัตรประชาชน 13 หลัก
-                e.target.value = value;
-            } else {
-                // ตัดให้เหลือ 13 หลัก
-                e.target.value = value.slice(0, 13);
-            }
-        });
-        
-        // Validate input format
-        document.getElementById('mobile').addEventListener('blur', function(e) {
-            const value = e.target.value;
-            const errorDiv = document.getElementById('error');
-            
-            if (value) {
-                const isValidPhone = /^(06|08|09)\d{8}$/.test(value);
-                const isValidID = /^\d{13}$/.test(value);
-                
-                if (!isValidPhone && !isValidID) {
-                    errorDiv.innerHTML = '<i class="fas fa-exclamation-triangle"></i> รูปแบบไม่ถูกต้อง<br>• เบอร์โทรศัพท์: ต้องขึ้นต้นด้วย 06, 08, 09 และมี 10 หลัก<br>• เลขบัตรประชาชน: ต้องมี 13 หลัก';
-                    errorDiv.style.display = 'block';
-                } else {
-                    errorDiv.style.display = 'none';
-                }
-            }
-        });
-    </script>
-</body>
-</html>
-    ''')
-
-@app.route('/generate', methods=['POST'])
-def generate_qr():
+BATCH_MAX_ROWS = int(os.environ.get('BATCH_MAX_ROWS', 10000))
+BATCH_FIELDS = ('mobile', 'amount', 'name', 'biller_id', 'ref1', 'ref2')
+
+def iter_batch_rows():
+    """Yield row dicts from a JSON or CSV batch request body
+
+    JSON: ``[{"mobile": ..., "amount": ..., "name": ...}, ...]`` หรือ
+    ``{"rows": [...]}``; CSV: ส่งเป็น body ``text/csv`` หรือไฟล์ชื่อ ``file``
+    (แถวแรกเป็น header) โดย CSV จะถูกอ่านทีละบรรทัดจาก stream
+    """
+    if request.is_json:
+        data = request.get_json()
+        rows = data.get('rows', []) if isinstance(data, dict) else data
+        if not isinstance(rows, list):
+            raise ValueError('ข้อมูล JSON ต้องเป็น list ของรายการ')
+        return iter(rows)
+    
+    if 'file' in request.files:
+        # ไฟล์ที่อัปโหลดจะถูกปิดเมื่อ view คืนค่า จึงคัดลอกไว้ก่อนเริ่ม stream
+        stream = SpooledTemporaryFile(max_size=1024 * 1024)
+        request.files['file'].save(stream)
+        stream.seek(0)
+    elif request.mimetype == 'text/csv':
+        stream = request.stream
+    else:
+        raise ValueError('รองรับเฉพาะ JSON หรือ CSV (text/csv หรือไฟล์ชื่อ file)')
+    return csv.DictReader(TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+
+def process_batch_row(row, fmt='png'):
+    """Validate one batch row and return (filename stem, rendered bytes)
+
+    ใช้กฎเดียวกับ /generate (แถวที่มี biller_id เป็น Bill Payment) และโยน
+    ValueError พร้อมข้อความเมื่อข้อมูลไม่ถูกต้อง
+    """
+    if not isinstance(row, dict):
+        raise ValueError('รูปแบบรายการไม่ถูกต้อง')
+    if row.get('biller_id'):
+        error, params = prepare_bill_payload(row)
+        if error:
+            raise ValueError(error)
+        payload, biller_id = params
+        ref1 = str(row['ref1']).strip().upper()
+        amount = float(str(row['amount']).strip())
+        return f"{biller_id}_{ref1}_{amount:.2f}", get_qr_image(payload, fmt)
+    
+    mobile = str(row.get('mobile') or '').strip()
+    amount = str(row.get('amount') or '').strip()
+    name = str(row.get('name') or '')
+    if not mobile or not amount:
+        raise ValueError('กรุณากรอกข้อมูลให้ครบถ้วน')
+    
+    mobile_clean = ''.join(filter(str.isdigit, mobile))
+    error = validate_target(mobile_clean) or validate_amount(amount)
+    if error:
+        raise ValueError(error)
+    
+    payload = generate_promptpay_payload(mobile_clean, amount, name)
+    return f"{mobile_clean}_{float(amount):.2f}", get_qr_image(payload, fmt)
+
+def _csv_line(values):
+    """Encode one CSV record as UTF-8 bytes"""
+    line = StringIO()
+    csv.writer(line).writerow(values)
+    return line.getvalue().encode('utf-8')
+
+def iter_batch_entries(rows):
+    """Yield (filename, data) ZIP entries for batch rows, manifest last"""
+    manifest = SpooledTemporaryFile(max_size=1024 * 1024)
+    manifest.write(_csv_line(['row', *BATCH_FIELDS, 'status', 'file', 'error']))
     try:
-        mobile = request.form['mobile']
-        amount = request.form['amount']
-        name = request.form.get('name', '')
-        
-        # Validate inputs
-        if not mobile or not amount:
-            return 'กรุณากรอกข้อมูลให้ครบถ้วน', 400
-            
-        # Validate mobile number/national ID
-        mobile_clean = ''.join(filter(str.isdigit, mobile))
-        
-        if len(mobile_clean) == 10:
-            # เบอร์โทรศัพท์ 10 หลัก
-            if not mobile_clean.startswith(('06', '08', '09')):
-                return 'เบอร์โทรศัพท์ต้องขึ้นต้นด้วย 06, 08, หรือ 09', 400
-        elif len(mobile_clean) == 13:
-            # เลขบัตรประชาชน 13 หลัก
-            # ตรวจสอบ checksum ของเลขบัตรประชาชน (ไม่บังคับ แต่แนะนำ)
-            if not is_valid_national_id(mobile_clean):
-                return 'เลขบัตรประชาชนไม่ถูกต้อง', 400
-        else:
-            return 'ต้องเป็นเบอร์โทรศัพท์ 10 หลัก หรือเลขบัตรประชาชน 13 หลัก', 400
-            
-        # Validate amount
-        try:
-            amount_float = float(amount)
-            if amount_float <= 0:
-                return 'จำนวนเงินต้องมากกว่า 0', 400
-            if amount_float > 999999.99:
-                return 'จำนวนเงินต้องไม่เกิน 999,999.99 บาท', 400
-        except ValueError:
-            return 'จำนวนเงินไม่ถูกต้อง', 400
-            
-        # Generate payload
-        payload = generate_promptpay_payload(mobile_clean, amount, name)
-        
-        # Create QR Code with optimal settings
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_M,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(payload)
-        qr.make(fit=True)
-        
-        # Generate image
-        img = qr.make_image(fill_color="black", back_color="white")
-        img_io = BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
-        
-        return send_file(img_io, mimetype='image/png', as_attachment=False)
+        for index, row in enumerate(rows, start=1):
+            values = [row.get(field, '') if isinstance(row, dict) else '' for field in BATCH_FIELDS]
+            if index > BATCH_MAX_ROWS:
+                manifest.write(_csv_line([index, *values, 'error', '',
+                                          f'เกินจำนวนสูงสุด {BATCH_MAX_ROWS} รายการต่อครั้ง']))
+                break
+            try:
+                stem, png = process_batch_row(row)
+            except Exception as e:
+                manifest.write(_csv_line([index, *values, 'error', '', str(e)]))
+                continue
+            filename = f"{index:06d}_{stem}.png"
+            manifest.write(_csv_line([index, *values, 'ok', filename, '']))
+            yield filename, png
         
+        manifest.seek(0)
+        yield 'manifest.csv', manifest
+    finally:
+        manifest.close()
+
+@bp.route('/generate/batch', methods=['POST'])
+def generate_batch():
+    """Generate many QR codes at once and stream them back as a ZIP"""
+    try:
+        rows = iter_batch_rows()
     except Exception as e:
         return f'เกิดข้อผิดพลาด: {str(e)}', 400
+    
+    response = Response(stream_with_context(iter_zip(iter_batch_entries(rows))),
+                        mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=promptpay-qr.zip'
+    return response
+
+@bp.route('/sheet', methods=['POST'])
+def generate_sheet():
+    """Lay out many QR codes N-up on A4 pages and stream them back as a PDF
+
+    รับข้อมูลแบบเดียวกับ /generate/batch (เพิ่ม field ``copies`` ได้) และกำหนด
+    จำนวนช่องด้วย ``?cols=3&rows=4`` ทุกแถวถูกตรวจก่อนเริ่ม stream ถ้ามีแถวผิด
+    หรือจำนวน QR รวม copies เกิน ``BATCH_MAX_ROWS`` จะตอบ 400
+    """
+    from qr_sheet import SheetLayout, SheetWriter, qr_modules, sheet_cell
+
+    try:
+        layout = SheetLayout(int(request.args.get('cols', 3)), int(request.args.get('rows', 4)))
+        rows = iter_batch_rows()
+    except Exception as e:
+        return f'เกิดข้อผิดพลาด: {str(e)}', 400
+
+    # เก็บเฉพาะ (payload, ข้อความ, จำนวนสำเนา) ต่อแถว ตัว PDF สร้างทีละหน้าระหว่าง stream
+    # จำนวน QR รวมทุกสำเนาจำกัดไว้ที่ BATCH_MAX_ROWS เช่นเดียวกับจำนวนแถว
+    entries = []
+    errors = []
+    cells = 0
+    for index, row in enumerate(rows, start=1):
+        if index > BATCH_MAX_ROWS:
+            errors.append(f'เกินจำนวนสูงสุด {BATCH_MAX_ROWS} รายการต่อครั้ง')
+            break
+        try:
+            entry = sheet_cell(row)
+        except Exception as e:
+            errors.append(f'แถว {index}: {e}')
+            continue
+        cells += entry[3]
+        if cells > BATCH_MAX_ROWS:
+            errors.append(f'จำนวน QR รวม copies เกินสูงสุด {BATCH_MAX_ROWS} ช่องต่อครั้ง')
+            break
+        entries.append(entry)
+    if errors:
+        return 'เกิดข้อผิดพลาด:\n' + '\n'.join(errors), 400
+
+    def iter_cells():
+        for payload, title, subtitle, copies in entries:
+            for _ in range(copies):
+                yield payload, title, subtitle
+
+    writer = SheetWriter(qr_modules, layout, QR_BORDER)
+    response = Response(stream_with_context(writer.iter_pdf(iter_cells())),
+                        mimetype='application/pdf')
+    response.headers['Content-Disposition'] = 'attachment; filename=promptpay-qr-sheet.pdf'
+    return response
+
+# น้ำหนักของหลักที่ 1-12 ในการคำนวณ checksum เลขบัตรประชาชน
+NATIONAL_ID_WEIGHTS = (13, 12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2)
+# ผลรวมถ่วงน้ำหนักของ '0' (48) ทุกหลัก ใช้หักออกเมื่อคูณจาก byte ASCII โดยตรง
+_NATIONAL_ID_ASCII_OFFSET = 48 * sum(NATIONAL_ID_WEIGHTS)
 
 def is_valid_national_id(national_id):
     """Validate Thai National ID checksum"""
     if len(national_id) != 13:
         return False
     
+    if national_id.isascii() and national_id.isdigit():
+        # คูณ byte ASCII กับน้ำหนักทีละคู่ แทนการแปลงทีละหลักด้วย int()
+        digits = national_id.encode('ascii')
+        remainder = (sum(map(mul, NATIONAL_ID_WEIGHTS, digits)) - _NATIONAL_ID_ASCII_OFFSET) % 11
+        return digits[12] - 48 == (11 - remainder) % 10
+    return _is_valid_national_id_int(national_id)
+
+def _is_valid_national_id_int(national_id):
+    """Digit-by-digit checksum (also accepts Thai and other Unicode digits)"""
     try:
         # คำนวณ checksum ของเลขบัตรประชาชนไทย
         sum_digits = 0
@@ -576,7 +767,7 @@ def is_valid_national_id(national_id):
     except:
         return False
 
-@app.route('/test')
+@bp.route('/test')
 def test():
     """Test endpoint to verify payload generation"""
     try:
@@ -625,107 +816,217 @@ def test():
 def analyze_payload(payload):
     """Analyze PromptPay payload structure"""
     try:
-        info = {}
-        pos = 0
-        
-        while pos < len(payload) - 4:  # -4 for CRC
-            if pos + 4 > len(payload):
-                break
-                
-            tag = payload[pos:pos+2]
-            length = int(payload[pos+2:pos+4])
-            value = payload[pos+4:pos+4+length]
-            
-            tag_names = {
-                '00': 'Payload Format Indicator',
-                '01': 'Point of Initiation Method',
-                '29': 'Merchant Account Information',
-                '52': 'Merchant Category Code',
-                '53': 'Transaction Currency',
-                '54': 'Transaction Amount',
-                '58': 'Country Code',
-                '59': 'Merchant Name',
-                '62': 'Additional Data Field',
-                '63': 'CRC'
-            }
-            
-            info[tag] = {
-                'name': tag_names.get(tag, f'Tag {tag}'),
-                'length': length,
-                'value': value
-            }
-            
-            pos += 4 + length
-        
-        # Add CRC
-        if len(payload) >= 4:
-            info['63'] = {
-                'name': 'CRC',
-                'length': 4,
-                'value': payload[-4:]
-            }
-        
-        return info
-    except:
-        return {'error': 'Cannot analyze payload'}
+        parsed = parse_payload(payload)
+    except PayloadError as e:
+        return {'error': f'Cannot analyze payload: {e}'}
+    return {field.tag: field.to_dict() for field in parsed.fields}
 
-@app.route('/validate/<mobile>')
-def validate_mobile(mobile):
-    """Validate mobile number or national ID format"""
+def iter_verify_items():
+    """Return the payloads of a /verify request (JSON list or text lines)"""
+    if request.is_json:
+        data = request.get_json()
+        items = data.get('payloads', []) if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise ValueError('ข้อมูล JSON ต้องเป็น list ของ payload')
+        return items
+    # text/plain: หนึ่ง payload ต่อบรรทัด
+    return [line for line in request.get_data().splitlines() if line.strip()]
+
+@bp.route('/verify', methods=['POST'])
+def verify():
+    """Verify many EMVCo payloads (TLV structure and CRC) in one request"""
+    try:
+        items = iter_verify_items()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 400
+    if len(items) > BATCH_MAX_ROWS:
+        return jsonify({'error': f'เกินจำนวนสูงสุด {BATCH_MAX_ROWS} รายการต่อครั้ง'}), 400
+    
+    details = request.args.get('details') == '1'
+    results = []
+    for item in items:
+        if isinstance(item, (str, bytes)):
+            result = verify_payload(item.strip(), details)
+        else:
+            result = {'valid': False, 'crc_valid': False, 'error': 'payload ต้องเป็นข้อความ'}
+        if isinstance(item, bytes):
+            item = item.decode('utf-8', 'replace')
+        results.append({'payload': item, **result})
+    
+    return jsonify({
+        'results': results,
+        'total': len(results),
+        'valid': sum(1 for r in results if r['valid']),
+    })
+
+def check_number(mobile):
+    """Validate a mobile number or national ID; return (result dict, HTTP status)"""
     try:
         mobile_clean = ''.join(filter(str.isdigit, mobile))
         
         if len(mobile_clean) == 10:
-            if mobile_clean.startswith(('06', '08', '09')):
-                formatted = format_mobile(mobile_clean)
-                return jsonify({
+            operator = MOBILE_OPERATORS.get(mobile_clean[:2])
+            if operator is not None:
+                return {
                     'original': mobile,
                     'cleaned': mobile_clean,
-                    'formatted': formatted,
+                    'formatted': format_mobile(mobile_clean),
                     'valid': True,
                     'type': 'mobile_phone',
-                    'operator': get_operator(mobile_clean[:2])
-                })
+                    'operator': operator
+                }, 200
             else:
-                return jsonify({
+                return {
                     'original': mobile,
                     'cleaned': mobile_clean,
                     'valid': False,
                     'error': 'เบอร์โทรศัพท์ต้องขึ้นต้นด้วย 06, 08, หรือ 09'
-                }), 400
+                }, 400
         elif len(mobile_clean) == 13:
             is_valid = is_valid_national_id(mobile_clean)
-            return jsonify({
+            return {
                 'original': mobile,
                 'cleaned': mobile_clean,
                 'formatted': mobile_clean,
                 'valid': is_valid,
                 'type': 'national_id',
                 'checksum_valid': is_valid
-            })
+            }, 200
         else:
-            return jsonify({
+            return {
                 'original': mobile,
                 'cleaned': mobile_clean,
                 'valid': False,
                 'error': 'ต้องเป็นเบอร์โทรศัพท์ 10 หลัก หรือเลขบัตรประชาชน 13 หลัก'
-            }), 400
+            }, 400
             
     except Exception as e:
-        return jsonify({
+        return {
             'original': mobile,
             'valid': False,
             'error': str(e)
-        }), 400
+        }, 400
+
+def validate_numbers(numbers):
+    """Validate many mobile numbers/national IDs; same results as /validate/<mobile>
+
+    รายการที่ซ้ำกันคำนวณครั้งเดียว (ไฟล์นำเข้ามักมีเลขซ้ำ)
+    """
+    seen = {}
+    results = []
+    for number in numbers:
+        if not isinstance(number, str):
+            results.append({'original': number, 'valid': False,
+                            'error': 'ต้องเป็นข้อความ (string)'})
+            continue
+        result = seen.get(number)
+        if result is None:
+            result = seen[number] = check_number(number)[0]
+        results.append(result)
+    return results
+
+@bp.route('/validate/<mobile>')
+def validate_mobile(mobile):
+    """Validate mobile number or national ID format"""
+    result, status = check_number(mobile)
+    return jsonify(result), status
+
+@bp.route('/validate', methods=['POST'])
+def validate_bulk():
+    """Validate a JSON list of mobile numbers/national IDs in one request"""
+    data = request.get_json(silent=True)
+    numbers = data.get('numbers') if isinstance(data, dict) else data
+    if not isinstance(numbers, list):
+        return jsonify({'error': 'ข้อมูล JSON ต้องเป็น list ของเบอร์โทรศัพท์/เลขบัตรประชาชน'}), 400
+    if len(numbers) > BATCH_MAX_ROWS:
+        return jsonify({'error': f'เกินจำนวนสูงสุด {BATCH_MAX_ROWS} รายการต่อครั้ง'}), 400
+    
+    results = validate_numbers(numbers)
+    return jsonify({
+        'results': results,
+        'total': len(results),
+        'valid': sum(1 for r in results if r['valid']),
+    })
+
+# ผู้ให้บริการตาม prefix 2 หลักของเบอร์ 10 หลัก (prefix ที่ไม่อยู่ในนี้ใช้กับ PromptPay ไม่ได้)
+MOBILE_OPERATORS = {
+    '06': 'AIS/True',
+    '08': 'AIS/True/dtac',
+    '09': 'AIS/True/dtac'
+}
 
 def get_operator(prefix):
     """Get mobile operator from prefix"""
-    operators = {
-        '06': 'AIS/True',
-        '08': 'AIS/True/dtac',
-        '09': 'AIS/True/dtac'
-    }
-    return operators.get(prefix, 'Unknown')
+    return MOBILE_OPERATORS.get(prefix, 'Unknown')
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of request and stage metrics (all workers)"""
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def _render_cache_events():
+    events = {}
+    caches = [('local', render_cache)]
+    if shared_render_cache is not None:
+        caches.append(('shared', shared_render_cache))
+    if pack_store is not None:
+        caches.append(('pack', pack_store))
+    if static_store is not None:
+        caches.append(('static', static_store))
+    for name, cache in caches:
+        stats = cache.stats()
+        for event in ('hits', 'misses', 'evictions'):
+            if event not in stats:
+                continue
+            events['qr_render_cache_events_total', (('cache', name), ('event', event))] = stats[event]
+    if render_flight is not None:
+        events['qr_render_coalesced_total', ()] = render_flight.stats()['followers']
+    return events
+
+metrics.registry.add_collector(_render_cache_events)
+
+def warm_up(app):
+    """Exercise the hot paths once so the first real request is not cold
+
+    เมื่อรันด้วย gunicorn --preload ขั้นตอนนี้ทำใน master process ครั้งเดียว
+    แล้ว worker ที่ fork ออกมาจะใช้ import, ตาราง และ cache ร่วมกัน (copy-on-write)
+    """
+    client = app.test_client()
+    client.get('/', headers={'Accept-Encoding': 'gzip, br'})
+    for fmt in QR_FORMAT_MIMETYPES:
+        for renderer in QR_RENDERERS:
+            client.post('/generate', query_string={'format': fmt, 'renderer': renderer},
+                        data={'mobile': '0812345678', 'amount': '1.00'})
+    client.get('/qr/1234567890121/1.00.png')
+    client.get('/validate/0812345678')
+    client.get('/test')
+
+def create_app(warm=True):
+    """Create the Flask application (shared by app.py, gunicorn and the dev server)"""
+    app = Flask(__name__)
+    app.register_blueprint(bp)
+    metrics.init_app(app)
+    
+    # หน้าเว็บไม่มีข้อมูลเปลี่ยนตามคำขอ จึง render และบีบอัดไว้ครั้งเดียวตอนเริ่ม
+    app.extensions['promptpay_index'] = PrecompressedAsset(
+        app.jinja_env.get_template('index.html').render(), 'text/html')
+    
+    if warm and os.environ.get('QR_WARM_UP', '1') != '0':
+        # warm-up รันใน master ของ gunicorn (--preload) จึงต้องไม่เริ่ม thread flush ของ metrics
+        with metrics.flusher_paused():
+            warm_up(app)
+        # ไม่นับคำขอของ warm-up (และไม่ให้ worker ที่ fork ออกไปได้ค่าเดิมซ้ำกัน)
+        metrics.reset()
+        render_cache.reset_stats()
+        if shared_render_cache is not None:
+            shared_render_cache.reset_stats()
+        if pack_store is not None:
+            pack_store.reset_stats()
+        if static_store is not None:
+            static_store.reset_stats()
+        if render_flight is not None:
+            render_flight.reset_stats()
+    return app
 
 if __name__ == '__main__':
     print("🚀 Starting PromptPay QR Code Generator...")
@@ -736,4 +1037,4 @@ if __name__ == '__main__':
     print("   📞 Mobile: 06XXXXXXXX, 08XXXXXXXX, 09XXXXXXXX")
     print("   🆔 National ID: 13 digits (with checksum validation)")
     print("\n⚠️  Note: National ID must be registered with PromptPay first!")
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,45 @@
+"""gunicorn settings shared by Procfile and render.yaml"""
+import atexit
+import gc
+import os
+import tempfile
+
+# โหลดแอป (รวม import qrcode/PIL, ตาราง CRC, cache และ warm-up) ครั้งเดียวใน master
+# แล้ว fork worker ออกไปใช้หน่วยความจำร่วมกันแบบ copy-on-write
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# /metrics ต้องรวมค่าจากทุก worker: ถ้าไม่ได้กำหนด METRICS_DIR ใช้โฟลเดอร์ชั่วคราว
+# ของ master นี้ (ต้องตั้งก่อน preload แอป เพราะ metrics อ่านค่าตอน import)
+_default_metrics_dir = os.path.join(tempfile.gettempdir(), f'promptpay-metrics-{os.getpid()}')
+os.environ.setdefault('METRICS_DIR', _default_metrics_dir)
+
+
+def on_starting(server):
+    # ลบ snapshot ของ metrics จากรอบก่อน ก่อนที่แอปจะถูกโหลด
+    import metrics
+    metrics.clear_dir()
+
+
+def post_fork(server, worker):
+    # thread เขียน snapshot ของ metrics ต้องเริ่มในแต่ละ worker หลัง fork เท่านั้น
+    import metrics
+    metrics.start_flusher()
+
+
+def on_exit(server):
+    # master ไม่ได้ตอบคำขอ: ไม่ต้องเขียน snapshot ตอนจบ (ซึ่งจะเกิดหลังลบโฟลเดอร์)
+    import metrics
+    atexit.unregister(metrics.flush)
+    metrics.clear_dir()
+    if metrics.METRICS_DIR == _default_metrics_dir:
+        try:
+            os.rmdir(_default_metrics_dir)
+        except OSError:
+            pass
+
+
+def when_ready(server):
+    # ย้าย object ที่สร้างตอน preload ออกจาก GC เพื่อไม่ให้ worker แตะ page ที่แชร์อยู่
+    gc.freeze()
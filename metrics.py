@@ -0,0 +1,419 @@
+"""Low-overhead request/stage metrics with a Prometheus text exposition.
+
+* ``stage(name)`` จับเวลาแต่ละขั้นตอน (validate, payload, encode, image, save)
+  เก็บเป็น histogram และส่งกลับใน header ``Server-Timing`` ของคำขอนั้น
+* ``init_app(app)`` นับจำนวนคำขอ/ข้อผิดพลาดและเวลาตอบต่อ route
+
+แต่ละ process เก็บค่าในหน่วยความจำ ถ้ากำหนด ``METRICS_DIR`` แต่ละ worker
+จะมี thread เขียน snapshot ลงไฟล์ ``metrics-<pid>-<เวลาเริ่ม process>.json`` ทุก
+``METRICS_FLUSH_INTERVAL`` วินาที แล้ว ``/metrics`` จะรวมค่าจากทุก worker
+(ค่าจาก worker อื่นจึงช้ากว่าจริงได้ไม่เกินช่วงเวลานั้น) ชื่อไฟล์มีเวลาเริ่ม process
+ด้วย worker ใหม่ที่ได้ pid ซ้ำจึงไม่เขียนทับค่าของ worker ที่ตายไปแล้ว snapshot
+ที่ไม่ถูกเขียนนานกว่า ``METRICS_RETIRE_AFTER`` วินาที (worker ที่ตายหรือถูก
+restart) จะถูกรวมเข้าไฟล์ ``metrics-retired.json`` แล้วลบทิ้ง counter จึงไม่ลดลง
+และจำนวนไฟล์ไม่โตตามจำนวน worker ที่เคยมี
+
+ขั้นตอนที่ทำใน process pool (asgi.py, batch.py) จับเวลาด้วย ``capture_stages``
+แล้วส่งค่ากลับมาให้ process หลักบันทึกด้วย ``record_stages``
+"""
+
+import atexit
+import contextvars
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+try:
+    import fcntl
+except ImportError:  # ไม่มีบน Windows: snapshot เก่าไม่ถูกรวมเป็นไฟล์เดียว แต่ยังนับตามปกติ
+    fcntl = None
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5)
+
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0))
+METRICS_RETIRE_AFTER = float(os.environ.get('METRICS_RETIRE_AFTER', 0)) or \
+    max(30.0, METRICS_FLUSH_INTERVAL * 10)
+RETIRED_SNAPSHOT = 'metrics-retired.json'
+
+HELP = {
+    'qr_requests_total': 'HTTP requests by route and status',
+    'qr_request_errors_total': 'HTTP requests answered with status >= 400, by route',
+    'qr_request_seconds': 'HTTP request latency by route',
+    'qr_stage_seconds': 'Latency of each QR generation stage',
+    'qr_render_cache_events_total': 'Render cache hits, misses and evictions',
+    'qr_render_coalesced_total': 'Renders skipped by waiting on an identical render in flight',
+    'qr_pos_updates_total': 'Cart totals published to POS display channels',
+    'qr_pos_superseded_total': 'POS updates replaced by a newer total before they were published',
+}
+
+
+class Registry:
+    """Thread-safe counters and fixed-bucket histograms for one process"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._collectors = []
+        self.reset()
+
+    def reset(self):
+        """Drop all recorded values (collectors are kept)"""
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def add_collector(self, collector):
+        """Register a callable returning {(name, labels): value} counters at scrape time"""
+        self._collectors.append(collector)
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                # bucket ละช่อง + ช่อง +Inf, ตามด้วย sum
+                histogram = self.histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy of every value"""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: list(values) for key, values in self.histograms.items()}
+        for collector in self._collectors:
+            for key, value in collector().items():
+                counters[key] = counters.get(key, 0) + value
+        return _snapshot(self.buckets, counters, histograms)
+
+
+def _snapshot(buckets, counters, histograms):
+    return {
+        'buckets': list(buckets),
+        'counters': [[name, [list(label) for label in labels], value]
+                     for (name, labels), value in counters.items()],
+        'histograms': [[name, [list(label) for label in labels], values]
+                       for (name, labels), values in histograms.items()],
+    }
+
+
+registry = Registry()
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+_flusher_paused = False
+_process_started = time.time_ns()
+# (stage timings list, observe ใน registry นี้ด้วยหรือไม่) ของ capture_stages ที่ใช้อยู่
+_captured = contextvars.ContextVar('metrics_captured', default=None)
+
+
+def _after_fork():
+    global _process_started
+    _process_started = time.time_ns()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _snapshot_path():
+    return os.path.join(METRICS_DIR, f"metrics-{os.getpid()}-{_process_started}.json")
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush():
+    """Write this process's snapshot to METRICS_DIR"""
+    if not METRICS_DIR:
+        return
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        _write_json(_snapshot_path(), registry.snapshot())
+    except OSError:
+        # metrics ต้องไม่ทำให้คำขอล้มเหลว
+        pass
+
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush()
+
+
+def start_flusher():
+    """Start the background flush thread once per process (after fork)
+
+    gunicorn เรียกจาก hook ``post_fork`` ส่วน server อื่นเริ่มเมื่อมีคำขอแรก ห้ามเริ่ม
+    ใน master ก่อน fork: worker ที่ fork ขณะ thread นี้ถือ lock ของ registry หรือ
+    cache อยู่จะได้ lock ที่ไม่มีวันถูกปล่อย
+    """
+    global _flusher_pid
+    if not METRICS_DIR or _flusher_paused or _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            _flusher_pid = os.getpid()
+            threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+@contextmanager
+def flusher_paused():
+    """Don't start the flush thread inside the block (warm-up before fork)"""
+    global _flusher_paused
+    _flusher_paused = True
+    try:
+        yield
+    finally:
+        _flusher_paused = False
+
+
+def reset():
+    """Drop this process's values and its snapshot file"""
+    registry.reset()
+    if METRICS_DIR:
+        try:
+            os.remove(_snapshot_path())
+        except OSError:
+            pass
+
+
+def clear_dir():
+    """Remove every snapshot in METRICS_DIR (call once when the server starts)"""
+    if METRICS_DIR:
+        for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*')):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _retire(paths):
+    """Fold stale worker snapshots into the retired aggregate and remove them
+
+    ทำภายใต้ lock ไฟล์ worker ที่ scrape พร้อมกันจึงไม่รวมไฟล์เดียวกันซ้ำ
+    """
+    retired_path = os.path.join(METRICS_DIR, RETIRED_SNAPSHOT)
+    try:
+        with open(os.path.join(METRICS_DIR, 'metrics-retired.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            snapshots = []
+            taken = []
+            for path in paths:
+                # worker อื่นอาจรวมไฟล์นี้ไปแล้วระหว่างรอ lock
+                snapshot = _read_json(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+                    taken.append(path)
+            if not taken:
+                return
+            retired = _read_json(retired_path)
+            if retired is not None:
+                snapshots.append(retired)
+            _write_json(retired_path, _snapshot(registry.buckets, *_merge(snapshots)))
+            for path in taken:
+                os.remove(path)
+    except OSError:
+        pass
+
+
+def collect():
+    """Merge this process's live values with snapshots from other workers
+
+    snapshot ที่ไม่ถูกเขียนนานกว่า ``METRICS_RETIRE_AFTER`` วินาทีถูกย้ายเข้า
+    ``metrics-retired.json`` ก่อน แล้วจึงอ่านไฟล์นั้นรวมด้วย
+    """
+    snapshots = [registry.snapshot()]
+    if METRICS_DIR:
+        own = _snapshot_path()
+        stale = []
+        now = time.time()
+        for path in glob.glob(os.path.join(METRICS_DIR, 'metrics-*-*.json')):
+            if path == own:
+                continue
+            try:
+                idle = now - os.path.getmtime(path)
+            except OSError:
+                continue
+            if fcntl is not None and idle > METRICS_RETIRE_AFTER:
+                stale.append(path)
+                continue
+            snapshot = _read_json(path)
+            if snapshot is not None:
+                snapshots.append(snapshot)
+        if stale:
+            _retire(stale)
+        retired = _read_json(os.path.join(METRICS_DIR, RETIRED_SNAPSHOT))
+        if retired is not None:
+            snapshots.append(retired)
+    return _merge(snapshots)
+
+
+def _merge(snapshots):
+    """Sum counters and histograms (same buckets only) of several snapshots"""
+    counters = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        if snapshot['buckets'] != list(registry.buckets):
+            continue
+        for name, labels, values in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+    return counters, histograms
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = []
+    for key, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{key}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format"""
+    counters, histograms = collect()
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    bounds = [str(bucket) for bucket in registry.buckets] + ['+Inf']
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(bounds, values[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-1]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def stage(name):
+    """Time one generation stage (histogram + Server-Timing entry)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        captured = _captured.get()
+        if captured is None or captured[1]:
+            registry.observe('qr_stage_seconds', (('stage', name),), elapsed)
+        if captured is not None:
+            captured[0].append((name, elapsed))
+        if has_request_context():
+            g.setdefault('server_timing', []).append((name, elapsed))
+
+
+@contextmanager
+def capture_stages(observe=True):
+    """Collect the (stage, seconds) timings of the block into the yielded list
+
+    ``observe=False`` ใช้ใน process ของ pool: ไม่บันทึกลง registry ของ process นั้น
+    (ซึ่งไม่ถูกรวมใน ``/metrics``) แต่ส่ง list กลับให้ process หลักเรียก ``record_stages``
+    """
+    timings = []
+    token = _captured.set((timings, observe))
+    try:
+        yield timings
+    finally:
+        _captured.reset(token)
+
+
+def record_stages(timings):
+    """Observe stage timings measured in another process"""
+    for name, seconds in timings:
+        registry.observe('qr_stage_seconds', (('stage', name),), seconds)
+
+
+def add_captured_stages(timings):
+    """Append timings from another process to the active ``capture_stages`` list only
+
+    ใช้กับ Server-Timing ของคำขอที่รอผลจาก pool (histogram บันทึกด้วย ``record_stages``
+    ครั้งเดียวต่องาน แม้มีหลายคำขอรอผลเดียวกัน)
+    """
+    captured = _captured.get()
+    if captured is not None:
+        captured[0].extend(timings)
+
+
+def server_timing(timings, elapsed):
+    """Return a ``Server-Timing`` header value: each stage then the request total"""
+    entries = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings]
+    entries.append(f"total;dur={elapsed * 1000:.3f}")
+    return ', '.join(entries)
+
+
+def _before_request():
+    g.request_started = time.perf_counter()
+
+
+def record_request(route, status, elapsed):
+    """Count one finished request and observe its latency"""
+    registry.inc('qr_requests_total', (('route', route), ('status', str(status))))
+    if status >= 400:
+        registry.inc('qr_request_errors_total', (('route', route),))
+    registry.observe('qr_request_seconds', (('route', route),), elapsed)
+    start_flusher()
+
+
+def _after_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    record_request(route, response.status_code, elapsed)
+
+    response.headers['Server-Timing'] = server_timing(g.pop('server_timing', None) or [], elapsed)
+    return response
+
+
+def init_app(app):
+    """Register the request hooks on a Flask app"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+
+atexit.register(flush)
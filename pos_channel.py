@@ -0,0 +1,246 @@
+"""Live POS display channel: push the current QR to customer displays as the cart changes.
+
+จอฝั่งลูกค้าเชื่อมต่อครั้งเดียว (SSE ``GET /pos/<terminal>/events`` หรือ WebSocket
+``/pos/<terminal>/ws``) แล้วได้ event ใหม่ทุกครั้งที่เครื่อง POS ส่งยอดใหม่มาที่
+``POST /pos/<terminal>`` ใช้งานผ่านโหมด ASGI (asgi.py) เท่านั้น
+
+* การแก้ยอดติด ๆ กันถูกรวมด้วย debounce (``QR_POS_DEBOUNCE_MS``) แล้วส่งเฉพาะยอดล่าสุด
+* ยอดใหม่ยกเลิกการ publish ของยอดเดิมที่ยังไม่เสร็จ (รวมงาน render ที่ยังไม่เริ่ม)
+* จอแต่ละเครื่องเก็บเฉพาะ event ล่าสุด จอที่ช้าจะข้ามยอดกลางทางไป ไม่มีคิวสะสม
+* จอที่ขอ ``format=png|svg`` ได้ภาพเป็น data URL ส่วนจอที่ไม่ระบุได้เฉพาะ payload
+  (วาดเองด้วย static/promptpay-qr.js ซึ่งเร็วที่สุด)
+* การส่งยอด (POST/DELETE และข้อความทาง WebSocket) ต้องแนบ token ของ terminal นั้น
+  (HMAC ของชื่อ terminal ด้วย ``QR_POS_SECRET``) ถ้าไม่ตั้ง secret จะส่งยอดไม่ได้เลย
+  จอที่ไม่มี token รับ event ได้อย่างเดียว
+* terminal ที่ไม่มีจอเชื่อมต่อถูกลบหลังไม่มีการใช้งาน ``QR_POS_IDLE_TTL`` วินาที
+
+    python pos_channel.py token counter1     # พิมพ์ token ของ terminal (ต้องตั้ง QR_POS_SECRET)
+
+สถานะของแต่ละ terminal อยู่ใน process เดียว ถ้ารันหลาย worker ต้องให้คำขอของ
+terminal เดียวกันไปที่ worker เดิม
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import sys
+
+import metrics
+from generate_qr import QR_FORMAT_MIMETYPES, QR_RENDERER
+
+QR_POS_DEBOUNCE_MS = float(os.environ.get('QR_POS_DEBOUNCE_MS', 20))
+QR_POS_KEEPALIVE = float(os.environ.get('QR_POS_KEEPALIVE', 15))
+QR_POS_IDLE_TTL = float(os.environ.get('QR_POS_IDLE_TTL', 300))
+QR_POS_SECRET = os.environ.get('QR_POS_SECRET', '')
+
+# รูปแบบภาพที่ส่งผ่าน channel ได้ (None = payload อย่างเดียว)
+POS_FORMATS = (None, 'png', 'svg')
+
+
+def pos_token(terminal, secret=None):
+    """Return the publish token of ``terminal`` (hex HMAC-SHA256 with ``QR_POS_SECRET``)"""
+    secret = QR_POS_SECRET if secret is None else secret
+    if not secret:
+        raise ValueError('ยังไม่ได้ตั้ง QR_POS_SECRET')
+    return hmac.new(secret.encode('utf-8'), terminal.encode('utf-8'), hashlib.sha256).hexdigest()
+
+
+def check_pos_token(terminal, token, secret=None):
+    """Return True if ``token`` may publish to ``terminal`` (always False without a secret)"""
+    secret = QR_POS_SECRET if secret is None else secret
+    if not secret or not token:
+        return False
+    return hmac.compare_digest(pos_token(terminal, secret), token)
+
+
+class Subscriber:
+    """One connected display; holds only the newest undelivered event"""
+
+    __slots__ = ('fmt', 'message', 'task', '_ready')
+
+    def __init__(self, fmt=None):
+        self.fmt = fmt
+        self.message = None
+        self.task = None      # งาน render ยอดปัจจุบันให้จอนี้ตอนเชื่อมต่อ
+        self._ready = asyncio.Event()
+
+    def deliver(self, message):
+        self.message = message
+        self._ready.set()
+
+    async def wait(self):
+        await self._ready.wait()
+
+    def take(self):
+        """Return the pending event and clear it"""
+        self._ready.clear()
+        message, self.message = self.message, None
+        return message
+
+
+class PosChannel:
+    """State of one terminal: current payload, built events and subscribers"""
+
+    __slots__ = ('terminal', 'subscribers', 'version', 'current', 'events', 'task', 'expiry')
+
+    def __init__(self, terminal):
+        self.terminal = terminal
+        self.subscribers = set()
+        self.version = 0
+        self.current = None   # (version, payload, target, amount) ที่ publish แล้ว
+        self.events = {}      # fmt -> event ของ current
+        self.task = None
+        self.expiry = None    # handle ของการลบ channel เมื่อไม่มีจอ
+
+
+class PosHub:
+    """All terminal channels of one process
+
+    ``render`` คือ coroutine ``render(payload, fmt, renderer, target)`` ที่คืน bytes
+    หรือ None เมื่อคิว render เต็ม (``PromptPayASGI.render``)
+    """
+
+    def __init__(self, render, debounce=QR_POS_DEBOUNCE_MS / 1000, idle_ttl=QR_POS_IDLE_TTL):
+        self.render = render
+        self.debounce = debounce
+        self.idle_ttl = idle_ttl
+        self.channels = {}
+
+    def channel(self, terminal):
+        channel = self.channels.get(terminal)
+        if channel is None:
+            channel = self.channels[terminal] = PosChannel(terminal)
+        elif channel.expiry is not None:
+            channel.expiry.cancel()
+            channel.expiry = None
+        return channel
+
+    def _release(self, channel):
+        """Drop or schedule dropping a channel that has no subscribers and no publish running
+
+        ยอดปัจจุบันถูกเก็บไว้อีก ``idle_ttl`` วินาที (จอที่เชื่อมต่อใหม่ยังได้ยอดเดิม)
+        """
+        if channel.subscribers or channel.task is not None or channel.expiry is not None:
+            return
+        if channel.current is None or self.idle_ttl <= 0:
+            self.channels.pop(channel.terminal, None)
+            return
+        channel.expiry = asyncio.get_running_loop().call_later(
+            self.idle_ttl, self._expire, channel)
+
+    def _expire(self, channel):
+        channel.expiry = None
+        if (self.channels.get(channel.terminal) is channel and not channel.subscribers
+                and channel.task is None):
+            del self.channels[channel.terminal]
+
+    def subscribe(self, terminal, fmt=None):
+        """Register a display; it receives the current event right away"""
+        channel = self.channel(terminal)
+        subscriber = Subscriber(fmt)
+        channel.subscribers.add(subscriber)
+        if fmt in channel.events:
+            subscriber.deliver(channel.events[fmt])
+        elif channel.current is not None:
+            subscriber.task = asyncio.create_task(self._deliver_current(channel, subscriber))
+        return subscriber
+
+    def unsubscribe(self, terminal, subscriber):
+        # จอที่หลุดไประหว่างรอภาพแรกไม่ต้อง render ต่อ (channel ถูกลบได้เมื่อไม่มีจอเหลือ
+        # งานของทุกจอจึงถูกยกเลิกก่อน channel หมดอายุเสมอ)
+        if subscriber.task is not None:
+            subscriber.task.cancel()
+            subscriber.task = None
+        channel = self.channels.get(terminal)
+        if channel is None:
+            return
+        channel.subscribers.discard(subscriber)
+        self._release(channel)
+
+    def update(self, terminal, payload, target=None, amount=None):
+        """Publish a new payload (None clears the display) after the debounce delay
+
+        คืนหมายเลข version ของยอดนี้ ยอดก่อนหน้าที่ยัง publish ไม่เสร็จจะถูกยกเลิก
+        """
+        channel = self.channel(terminal)
+        channel.version += 1
+        metrics.registry.inc('qr_pos_updates_total')
+        if channel.task is not None and not channel.task.done():
+            channel.task.cancel()
+            metrics.registry.inc('qr_pos_superseded_total')
+        channel.task = asyncio.create_task(
+            self._publish(channel, (channel.version, payload, target, amount)))
+        return channel.version
+
+    async def _publish(self, channel, current):
+        try:
+            if self.debounce > 0:
+                await asyncio.sleep(self.debounce)
+            if current[1] is None:
+                # ล้างหน้าจอ (ชำระเงินแล้ว/ยกเลิกตะกร้า)
+                channel.current = None
+                channel.events = {}
+                event = await self._event(current, None)
+                for subscriber in channel.subscribers:
+                    subscriber.deliver(event)
+                return
+            channel.current = current
+            channel.events = {}
+            formats = {subscriber.fmt for subscriber in channel.subscribers}
+            # จอที่วาดเองได้ event ก่อน ไม่ต้องรอ render
+            if None in formats:
+                self._broadcast(channel, None, await self._event(current, None))
+            images = [fmt for fmt in formats if fmt is not None]
+            events = await asyncio.gather(*(self._event(current, fmt) for fmt in images))
+            for fmt, event in zip(images, events):
+                self._broadcast(channel, fmt, event)
+        finally:
+            if channel.task is asyncio.current_task():
+                channel.task = None
+                self._release(channel)
+
+    async def _deliver_current(self, channel, subscriber):
+        current = channel.current
+        try:
+            event = await self._event(current, subscriber.fmt)
+        finally:
+            if subscriber.task is asyncio.current_task():
+                subscriber.task = None
+        if channel.current is current:
+            channel.events.setdefault(subscriber.fmt, event)
+            subscriber.deliver(event)
+
+    def _broadcast(self, channel, fmt, event):
+        channel.events[fmt] = event
+        for subscriber in channel.subscribers:
+            if subscriber.fmt == fmt:
+                subscriber.deliver(event)
+
+    async def _event(self, current, fmt):
+        """Build the event sent to displays of format ``fmt``"""
+        version, payload, target, amount = current
+        event = {'version': version, 'payload': payload}
+        if payload is None:
+            return event
+        event.update(crc=payload[-4:], target=target, amount=amount)
+        if fmt is not None:
+            data = await self.render(payload, fmt, QR_RENDERER, target)
+            # คิว render เต็ม: ส่ง payload ไปก่อน (จอวาดเองได้) ภาพเป็น null
+            event['image'] = None if data is None else (
+                f"data:{QR_FORMAT_MIMETYPES[fmt]};base64,{base64.b64encode(data).decode('ascii')}")
+        return event
+
+    def stats(self):
+        return {'terminals': len(self.channels),
+                'subscribers': sum(len(channel.subscribers) for channel in self.channels.values())}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != 'token':
+        sys.exit('usage: python pos_channel.py token <terminal>')
+    try:
+        print(pos_token(sys.argv[2]))
+    except ValueError as e:
+        sys.exit(str(e))
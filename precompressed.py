@@ -0,0 +1,63 @@
+"""Static responses compressed once at startup and served from memory.
+
+สร้าง variant แบบ identity, gzip และ brotli (ถ้าติดตั้งแพ็กเกจ ``brotli``)
+ไว้ล่วงหน้า แล้วเลือกตาม Accept-Encoding ของแต่ละคำขอ พร้อม ETag/304
+"""
+
+import gzip
+from hashlib import blake2b
+
+from flask import Response
+
+try:
+    import brotli
+except ImportError:  # brotli เป็น optional dependency
+    brotli = None
+
+
+class PrecompressedAsset:
+    """An immutable body with pre-built content-encoding variants"""
+
+    def __init__(self, body, mimetype, cache_control='no-cache'):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        digest = blake2b(body, digest_size=8).hexdigest()
+
+        # เรียงตามลำดับที่อยากส่ง เมื่อ client รับได้เท่ากัน
+        self.variants = {}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(body, quality=11)
+        self.variants['gzip'] = gzip.compress(body, compresslevel=9, mtime=0)
+        self.variants['identity'] = body
+        self.etags = {encoding: f"{digest}-{encoding}" for encoding in self.variants}
+
+    def choose_encoding(self, accept_encodings):
+        """Return the best available encoding for an Accept-Encoding header
+
+        ถ้า client ไม่รับ br/gzip จะส่งแบบ identity
+        """
+        best, best_quality = 'identity', 0
+        for encoding in self.variants:
+            if encoding == 'identity':
+                continue
+            quality = accept_encodings[encoding]
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def response(self, request):
+        """Build the response (or 304) for a Flask request"""
+        encoding = self.choose_encoding(request.accept_encodings)
+        etag = self.etags[encoding]
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(self.variants[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = self.cache_control
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,54 @@
+"""Incremental ZIP writer for batches of rendered QR images.
+
+สร้างไฟล์ ZIP ทีละ entry แล้วส่งออกเป็น chunk ทันที โดยไม่ต้องเก็บทั้ง
+archive ไว้ในหน่วยความจำ (ใช้ data descriptor ของ ZIP จึงไม่ต้อง seek)
+"""
+
+import io
+import zipfile
+
+
+class _ChunkSink(io.RawIOBase):
+    """Non-seekable write-only stream that collects chunks until drained"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_zip(entries, compression=zipfile.ZIP_STORED):
+    """Yield the bytes of a ZIP archive built from ``entries``
+
+    ``entries`` คือ iterable ของ (ชื่อไฟล์, ข้อมูล) โดยข้อมูลเป็น bytes
+    หรือ file object แบบ binary ที่อ่านได้ (เช่น manifest ที่เขียนต่อเนื่อง)
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression) as archive:
+        for name, data in entries:
+            if isinstance(data, (bytes, bytearray, memoryview)):
+                archive.writestr(name, data)
+            else:
+                with archive.open(name, 'w') as target:
+                    for block in iter(lambda: data.read(64 * 1024), b''):
+                        target.write(block)
+                        chunk = sink.drain()
+                        if chunk:
+                            yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
@@ -0,0 +1,296 @@
+"""Caches for rendered QR images.
+
+* ``RenderCache`` — LRU ในหน่วยความจำของแต่ละ process จำกัดขนาดรวมเป็นไบต์
+* ``SharedRenderCache`` — ไฟล์ SQLite บนเครื่องที่ทุก gunicorn worker ใช้ร่วมกัน
+* ``SingleFlight`` — รวมการ render ที่เหมือนกันซึ่งกำลังทำอยู่พร้อมกันให้เหลือครั้งเดียว
+
+key คือ payload ที่ normalize แล้วรวมกับพารามิเตอร์การ render
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from hashlib import blake2b
+
+
+def payload_etag(payload, *render_params):
+    """Return a strong ETag for a payload rendered with ``render_params``
+
+    ใช้ CRC (Tag 63) ของ payload นำหน้า ตามด้วย digest สั้น ๆ ของ payload
+    และพารามิเตอร์การ render เพื่อกันกรณี CRC16 ชนกัน
+    """
+    digest = blake2b(digest_size=8)
+    digest.update(payload.encode('utf-8'))
+    for param in render_params:
+        digest.update(b'\x00' + str(param).encode('utf-8'))
+    return f"{payload[-4:]}-{digest.hexdigest()}"
+
+
+def render_key_digest(key):
+    """Return a fixed 16-byte digest of a render cache key (for on-disk stores)"""
+    return blake2b(repr(key).encode('utf-8'), digest_size=16).digest()
+
+
+class RenderCache:
+    """Thread-safe LRU cache of rendered images bounded by total byte size"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached bytes for ``key`` or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store ``data`` under ``key``, evicting least recently used entries"""
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._entries[key] = data
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def reset_stats(self):
+        """Zero the hit/miss/eviction counters"""
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return cache counters as a dict"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class SingleFlight:
+    """Run one call per key at a time; concurrent callers with the same key share its result
+
+    ใช้กับคำขอที่เหมือนกันซึ่งเข้ามาพร้อมกัน (เช่น ช่วงโปรโมชัน) ให้ render ครั้งเดียว
+    ใช้ได้กับ thread ปกติและ gevent/eventlet (ที่ patch threading แล้ว)
+    """
+
+    def __init__(self):
+        self.leaders = 0
+        self.followers = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return ``func()``, or wait for the identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _FlightCall()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def reset_stats(self):
+        with self._lock:
+            self.leaders = self.followers = 0
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self.leaders,
+                    'followers': self.followers}
+
+
+class _FlightCall:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SharedRenderCache:
+    """Render cache shared by every worker on a host, stored in a local SQLite file
+
+    ใช้ WAL เพื่อให้หลาย process อ่านพร้อมกันได้ จำกัดขนาดรวมด้วย ``max_bytes``
+    แล้วลบรายการที่ใช้ล่าสุดนานที่สุดออกจนเหลือ 90% ของขนาดที่กำหนด
+    เวลาใช้ล่าสุดบันทึกแบบหยาบ (ทุก ``touch_interval`` วินาที) เพื่อไม่ให้ทุก hit
+    กลายเป็นการเขียน ข้อผิดพลาดของ SQLite ถือเป็น miss เสมอ
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, touch_interval=60.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Return this thread's connection (reopened after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (
+                key BLOB PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL,
+                used REAL NOT NULL);
+            CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+            CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0),
+                                               bytes INTEGER NOT NULL);
+            INSERT OR IGNORE INTO totals VALUES (0, 0);
+            CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN
+                UPDATE totals SET bytes = bytes + new.size WHERE id = 0; END;
+            CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN
+                UPDATE totals SET bytes = bytes - old.size WHERE id = 0; END;
+        ''')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        """Return cached bytes for ``key`` or None"""
+        digest = render_key_digest(key)
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute('SELECT data, used FROM entries WHERE key = ?', (digest,)).fetchone()
+            if row is not None and row[1] < now - self.touch_interval:
+                conn.execute('UPDATE entries SET used = ? WHERE key = ?', (now, digest))
+        except sqlite3.Error:
+            self._count('errors')
+            return None
+        if row is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return row[0]
+
+    def put(self, key, data):
+        """Store ``data`` under ``key`` and evict old entries above ``max_bytes``"""
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        try:
+            conn = self._connect()
+            # key เดียวกันให้ภาพเดิมเสมอ ถ้ามี worker อื่นเขียนไว้แล้วก็ไม่ต้องเขียนทับ
+            conn.execute('INSERT INTO entries VALUES (?, ?, ?, ?) ON CONFLICT (key) DO NOTHING',
+                         (render_key_digest(key), data, size, time.time()))
+            total = conn.execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+            if total > self.max_bytes:
+                self._evict(conn, total - int(self.max_bytes * 0.9))
+        except sqlite3.Error:
+            self._count('errors')
+
+    def _evict(self, conn, excess, batch=256):
+        """Delete least recently used entries until ``excess`` bytes are freed"""
+        freed = 0
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            while freed < excess:
+                rows = conn.execute('SELECT key, size FROM entries ORDER BY used LIMIT ?',
+                                    (batch,)).fetchall()
+                if not rows:
+                    break
+                for digest, size in rows:
+                    if freed >= excess:
+                        break
+                    conn.execute('DELETE FROM entries WHERE key = ?', (digest,))
+                    freed += size
+                    self._count('evictions')
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+
+    def clear(self):
+        """Drop every entry for all workers (counters are kept)"""
+        try:
+            self._connect().execute('DELETE FROM entries')
+        except sqlite3.Error:
+            self._count('errors')
+
+    def reset_stats(self):
+        """Zero this process's hit/miss/eviction/error counters"""
+        with self._lock:
+            self.hits = self.misses = self.evictions = self.errors = 0
+
+    def stats(self):
+        """Return shared totals and this process's counters as a dict"""
+        try:
+            conn = self._connect()
+            entries = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+            current = conn.execute('SELECT bytes FROM totals WHERE id = 0').fetchone()[0]
+        except sqlite3.Error:
+            entries = current = None
+        with self._lock:
+            return {
+                'entries': entries,
+                'bytes': current,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'errors': self.errors,
+            }
@@ -0,0 +1,265 @@
+"""Memory-mapped "pack" files of pre-rendered QR images for fixed price lists.
+
+ร้านค้าที่ขายตามรายการราคาคงที่รู้ชุด (target, amount) ล่วงหน้า จึง render
+ภาพทั้งหมดของร้านไว้ในไฟล์เดียว (``<target>.qrpack``) แล้วเปิดด้วย mmap
+ตอนให้บริการจะค้นหาแบบ binary search ใน index และคืน memoryview ที่ชี้ไปยัง
+ข้อมูลในไฟล์โดยตรง (ไม่ render และไม่คัดลอก) ถ้าไม่พบจึง render ตามปกติ
+
+รูปแบบไฟล์ (little-endian)::
+
+    header   magic 'QRPK', version (u16), reserved (u16), count (u32), index offset (u64)
+    data     ภาพแต่ละรายการต่อกัน
+    index    count รายการ เรียงตาม key: key digest (16 ไบต์), offset (u64), length (u32)
+
+key digest คือ ``render_key_digest`` ของ key เดียวกับที่ ``get_qr_image`` ใช้
+(payload + พารามิเตอร์การ render) ถ้าตั้งค่าการ render ต่างจากตอนสร้าง pack
+จึงแค่หาไม่พบ ไม่ได้ภาพผิด
+
+    python qr_pack.py build prices.csv --output packs/    # field: mobile, amount, name
+    python qr_pack.py info packs/0812345678.qrpack
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+
+from qr_cache import render_key_digest
+
+PACK_MAGIC = b'QRPK'
+PACK_VERSION = 1
+PACK_SUFFIX = '.qrpack'
+HEADER = struct.Struct('<4sHHIQ')
+INDEX_ENTRY = struct.Struct('<16sQI')
+
+
+class PackError(ValueError):
+    """Raised when a file is not a readable QR pack"""
+
+
+class QRPack:
+    """Read-only, memory-mapped view of one pack file"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            # ต้องมี mapping ก่อนปิดไฟล์ ไฟล์ที่ถูกแทนที่ภายหลังยังอ่านได้จนกว่าจะ close
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PackError(f'{path}: ไฟล์ว่าง')
+        self._view = memoryview(self._map)
+        if len(self._view) < HEADER.size:
+            self.close()
+            raise PackError(f'{path}: ไฟล์สั้นเกินไป')
+        magic, version, _, self.count, self._index_offset = HEADER.unpack_from(self._view)
+        if magic != PACK_MAGIC or version != PACK_VERSION:
+            self.close()
+            raise PackError(f'{path}: ไม่ใช่ QR pack version {PACK_VERSION}')
+        if self._index_offset + self.count * INDEX_ENTRY.size > len(self._view):
+            self.close()
+            raise PackError(f'{path}: index เกินขนาดไฟล์')
+
+    def __len__(self):
+        return self.count
+
+    def _entry(self, i):
+        return INDEX_ENTRY.unpack_from(self._view, self._index_offset + i * INDEX_ENTRY.size)
+
+    def lookup(self, digest):
+        """Return a memoryview of the entry for a 16-byte key digest, or None"""
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key, offset, length = self._entry(mid)
+            if key == digest:
+                return self._view[offset:offset + length]
+            if key < digest:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def get(self, key):
+        """Return a memoryview of the image stored for a render cache key, or None"""
+        return self.lookup(render_key_digest(key))
+
+    def close(self):
+        self._view.release()
+        self._map.close()
+
+
+class PackStore:
+    """Open ``<target>.qrpack`` files from a directory on first use
+
+    รายชื่อ target ที่มี pack อ่านจากโฟลเดอร์ครั้งเดียวตอนสร้าง store และเปิดแต่ละไฟล์
+    ครั้งเดียวต่อ process (target อื่นไม่ถูกจำไว้ หน่วยความจำจึงไม่โตตามคำขอ) ถ้าสร้าง
+    หรือแทนที่ pack ต้อง reload worker (เช่น ``kill -HUP`` gunicorn)
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self._packs = {}
+        self._available = self._scan()
+        self._lock = threading.Lock()
+
+    def _scan(self):
+        """Return the set of targets that have a pack file in the directory"""
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return set()
+        targets = (name[:-len(PACK_SUFFIX)] for name in names if name.endswith(PACK_SUFFIX))
+        return {target for target in targets if target.isdigit()}
+
+    def pack(self, target):
+        """Return the QRPack for ``target`` or None"""
+        pack = self._packs.get(target)
+        if pack is not None or target not in self._available:
+            return pack
+        with self._lock:
+            if target in self._packs:
+                return self._packs[target]
+            path = os.path.join(self.directory, f"{target}{PACK_SUFFIX}")
+            try:
+                pack = self._packs[target] = QRPack(path)
+            except (OSError, PackError):
+                # ไฟล์เสียหรือถูกลบไปแล้ว: ไม่ต้องลองเปิดอีก
+                self._available.discard(target)
+            return pack
+
+    def get(self, target, key):
+        """Return a memoryview of the pre-rendered image for ``key`` or None"""
+        pack = self.pack(target)
+        data = pack.get(key) if pack is not None else None
+        if data is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return data
+
+    def reset_stats(self):
+        self.hits = self.misses = 0
+
+    def stats(self):
+        return {'packs': len(self._packs),
+                'hits': self.hits, 'misses': self.misses}
+
+
+def write_pack(path, entries):
+    """Write (cache key, image bytes) pairs to a pack file atomically"""
+    index = {}
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(b'\x00' * HEADER.size)
+            for key, data in entries:
+                digest = render_key_digest(key)
+                if digest in index:
+                    continue
+                index[digest] = (f.tell(), len(data))
+                f.write(data)
+            index_offset = f.tell()
+            for digest in sorted(index):
+                f.write(INDEX_ENTRY.pack(digest, *index[digest]))
+            f.seek(0)
+            f.write(HEADER.pack(PACK_MAGIC, PACK_VERSION, 0, len(index), index_offset))
+        # แทนที่ทีเดียว worker ที่ map ไฟล์เก่าไว้ยังอ่านไฟล์เก่าได้ต่อ
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(index)
+
+
+def iter_pack_entries(target, prices, formats=('png',)):
+    """Render every (amount, name) of one target, yielding (cache key, bytes)
+
+    payload มาจาก ``generate_promptpay_payload`` และ key จาก ``qr_render_params``
+    เช่นเดียวกับ ``/generate`` จึงค้นหาเจอจากคำขอจริง
+    """
+    from generate_qr import (QR_RENDERER, generate_promptpay_payload, qr_render_params,
+                             render_qr, validate_amount, validate_target)
+
+    error = validate_target(target)
+    if error:
+        raise ValueError(f'{target}: {error}')
+    for amount, name in prices:
+        error = validate_amount(amount)
+        if error:
+            raise ValueError(f'{target} {amount}: {error}')
+        payload = generate_promptpay_payload(target, amount, name)
+        for fmt in formats:
+            yield (payload,) + qr_render_params(fmt, QR_RENDERER), render_qr(payload, fmt)
+
+
+def build_packs(rows, directory, formats=('png',)):
+    """Group rows (mobile, amount, name) by target and write one pack per target
+
+    แถวที่ไม่ถูกต้องจะถูกข้าม คืน (dict ของ path -> จำนวนภาพ, list ของ (ลำดับแถว, error))
+    """
+    from generate_qr import canonical_target, validate_amount, validate_target
+
+    prices = {}
+    failed = []
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            failed.append((index, 'รูปแบบรายการไม่ถูกต้อง'))
+            continue
+        target = canonical_target(str(row.get('mobile') or ''))
+        amount = str(row.get('amount') or '').strip()
+        error = validate_target(target) or validate_amount(amount)
+        if error:
+            failed.append((index, error))
+            continue
+        prices.setdefault(target, []).append((amount, str(row.get('name') or '')))
+
+    os.makedirs(directory, exist_ok=True)
+    written = {}
+    for target, items in prices.items():
+        path = os.path.join(directory, f"{target}{PACK_SUFFIX}")
+        written[path] = write_pack(path, iter_pack_entries(target, items, formats))
+    return written, failed
+
+
+def main(argv=None):
+    from batch import open_rows, report_failed
+    from generate_qr import QR_FORMAT_EXTENSIONS
+
+    parser = argparse.ArgumentParser(description='Build and inspect memory-mapped QR packs')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='pre-render price lists into <target>.qrpack files')
+    build.add_argument('input', help="CSV or JSON Lines (mobile, amount, name), or '-' for stdin")
+    build.add_argument('-o', '--output', required=True, help='pack directory (QR_PACK_DIR)')
+    build.add_argument('--format', action='append', choices=tuple(QR_FORMAT_EXTENSIONS),
+                       help='formats to store (repeatable, default: png)')
+    info = sub.add_parser('info', help='print the number of entries in pack files')
+    info.add_argument('packs', nargs='+')
+    args = parser.parse_args(argv)
+
+    if args.command == 'info':
+        for path in args.packs:
+            pack = QRPack(path)
+            print(f"{path}: {len(pack)} entries, {os.path.getsize(path)} bytes")
+            pack.close()
+        return 0
+
+    started = time.perf_counter()
+    with open_rows(args.input) as rows:
+        written, failed = build_packs(rows, args.output, tuple(args.format or ('png',)))
+    elapsed = time.perf_counter() - started
+    print(f"✅ {sum(written.values())} images in {len(written)} packs -> {args.output} "
+          f"in {elapsed:.2f}s")
+    return report_failed(failed)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
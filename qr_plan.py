@@ -0,0 +1,65 @@
+"""QR encoding with an optional fixed mask pattern.
+
+``QRCode.make(fit=True)`` ลองทุก mask pattern (8 รอบ) เพื่อคำนวณ penalty ซึ่งเป็น
+เวลาส่วนใหญ่ของการ encode ถ้ากำหนด mask pattern ไว้ (``QR_MASK_PATTERN``) จะข้าม
+การค้นหานั้น codeword ที่สแกนได้เหมือนเดิมทุกตัว ต่างกันแค่ mask
+(encode เร็วขึ้นหลายเท่า แต่ mask ที่ไม่ใช่ penalty ต่ำสุดอาจสแกนยากขึ้นเล็กน้อย
+บางจอ/กระดาษ จึงไม่เปิดเป็นค่าเริ่มต้น)
+
+การเลือก version ใช้ของ qrcode เอง การวางแผน version ล่วงหน้าไม่ได้เร็วขึ้นอย่างมีนัย
+
+Run ``python qr_plan.py`` to time ``make(fit=True)`` with and without a fixed mask
+(the equivalence test is test_qr_plan.py).
+"""
+
+import qrcode
+
+
+def build_qr(payload, error_correction=qrcode.constants.ERROR_CORRECT_M,
+             box_size=10, border=4, mask_pattern=None):
+    """Return a QRCode with its matrix built
+
+    ``mask_pattern`` (0-7) ใช้ mask ตายตัวแทนการค้นหา mask ที่มี penalty ต่ำสุด
+    """
+    qr = qrcode.QRCode(
+        error_correction=error_correction,
+        box_size=box_size,
+        border=border,
+        mask_pattern=mask_pattern,
+    )
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr
+
+
+def _fit_qr(payload, error_correction, mask_pattern=None):
+    """Reference encoder: qrcode's own version/mask search"""
+    qr = qrcode.QRCode(version=1, error_correction=error_correction,
+                       mask_pattern=mask_pattern)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    return qr
+
+
+def _benchmark(number=100):
+    """Time make(fit=True) against build_qr with a fixed mask"""
+    import timeit
+
+    from generate_qr import generate_promptpay_payload
+
+    payload = generate_promptpay_payload('0812345678', '1000', 'Shop')
+    level = qrcode.constants.ERROR_CORRECT_M
+    cases = [
+        ('make(fit=True)', lambda: _fit_qr(payload, level)),
+        ('mask 0', lambda: build_qr(payload, level, mask_pattern=0)),
+    ]
+    results = {}
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[label] = seconds / number * 1e3
+    return results
+
+
+if __name__ == '__main__':
+    for label, msec in _benchmark().items():
+        print(f"   {label:<16} {msec:7.3f} ms/encode")
@@ -0,0 +1,132 @@
+"""Direct QR-matrix renderers (PNG, SVG, packed bits) that bypass PIL.
+
+แปลง module matrix (list ของแถว True/False จาก ``QRCode.get_matrix()``
+ซึ่งรวมขอบแล้ว) เป็นไฟล์ภาพโดยตรง แต่ละแถวของ module สร้าง scanline
+เพียงครั้งเดียวแล้วคัดลอกซ้ำตาม box_size
+
+Run ``python qr_render.py`` to compare latency and output size with the
+PIL path used by ``qrcode``.
+"""
+
+import struct
+import zlib
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _png_chunk(kind, data):
+    """Return one PNG chunk (length, type, data, CRC32)"""
+    return (struct.pack('>I', len(data)) + kind + data
+            + struct.pack('>I', zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+def render_png(matrix, box_size=10, compress_level=9):
+    """Render a module matrix as a 1-bit grayscale PNG
+
+    module ที่เป็น True คือสีดำ (bit 0) ส่วนพื้นหลังเป็นสีขาว (bit 1)
+    """
+    modules = len(matrix)
+    size = modules * box_size
+    row_bytes = (size + 7) // 8
+    padding = row_bytes * 8 - size
+    dark = '0' * box_size
+    light = '1' * box_size
+
+    scanlines = []
+    for row in matrix:
+        bits = ''.join([dark if module else light for module in row]) + '0' * padding
+        # filter type 0 (None) นำหน้าแต่ละ scanline
+        scanline = b'\x00' + int(bits, 2).to_bytes(row_bytes, 'big')
+        scanlines.append(scanline * box_size)
+
+    header = struct.pack('>IIBBBBB', size, size, 1, 0, 0, 0, 0)
+    return b''.join((
+        PNG_SIGNATURE,
+        _png_chunk(b'IHDR', header),
+        _png_chunk(b'IDAT', zlib.compress(b''.join(scanlines), compress_level)),
+        _png_chunk(b'IEND', b''),
+    ))
+
+
+def render_svg(matrix):
+    """Render a module matrix as a compact SVG using a single stroked path
+
+    พิกัดใน viewBox มีหน่วยเป็น module แต่ละช่วงของ module สีดำที่ติดกัน
+    ในแถวเดียวกันเป็นเส้นหนา 1 module (ใช้ relative move ภายในแถว)
+    """
+    modules = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        pen = None
+        while x < modules:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < modules and row[x]:
+                x += 1
+            if pen is None:
+                path.append(f"M{start} {y}.5h{x - start}")
+            else:
+                path.append(f"m{start - pen} 0h{x - start}")
+            pen = x
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {modules} {modules}" '
+        f'shape-rendering="crispEdges"><rect width="100%" height="100%" fill="#fff"/>'
+        f'<path stroke="#000" d="{"".join(path)}"/></svg>'
+    ).encode('ascii')
+
+
+def render_matrix(matrix):
+    """Pack a module matrix into bytes
+
+    รูปแบบ: ขนาด (จำนวน module ต่อด้าน) เป็น uint16 big-endian ตามด้วย
+    bit ของทุก module เรียงทีละแถว (MSB ก่อน, 1 = สีดำ) เติม 0 ให้ครบไบต์
+    """
+    modules = len(matrix)
+    bits = ''.join(['1' if module else '0' for row in matrix for module in row])
+    bits += '0' * (-len(bits) % 8)
+    return struct.pack('>H', modules) + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+
+
+def _benchmark(number=200):
+    """Compare render_png with qrcode's PIL image path"""
+    import timeit
+    from io import BytesIO
+
+    import qrcode
+
+    payload = ("00020101021229370016A000000677010111011300668123456785802TH"
+               "530376454061000.005909Test Shop6304ABCD")
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M,
+                       box_size=10, border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    def pil_png():
+        img = qr.make_image(fill_color="black", back_color="white")
+        img_io = BytesIO()
+        img.save(img_io, 'PNG')
+        return img_io.getvalue()
+
+    cases = [('pil', pil_png)]
+    for level in (1, 6, 9):
+        cases.append((f'direct (zlib {level})',
+                      lambda level=level: render_png(matrix, 10, level)))
+
+    cases.append(('svg', lambda: render_svg(matrix)))
+    cases.append(('matrix', lambda: render_matrix(matrix)))
+
+    results = {}
+    for label, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=3))
+        results[label] = (seconds / number * 1e3, len(func()))
+    return results
+
+
+if __name__ == '__main__':
+    for label, (msec, size) in _benchmark().items():
+        print(f"   {label:<16} {msec:7.3f} ms/image  {size:6d} bytes")
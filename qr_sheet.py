@@ -0,0 +1,344 @@
+"""Streaming N-up A4 PDF sheets of PromptPay QR codes for bulk printing.
+
+จัด QR หลายอันต่อหน้า A4 (``cols`` x ``rows``) พร้อมจำนวนเงินและชื่อใต้แต่ละอัน
+แล้วเขียน PDF ทีละหน้าเป็น stream (ไม่ต้องถือทั้งไฟล์ไว้ในหน่วยความจำ)
+
+* QR แต่ละ payload เป็น Form XObject แบบ vector (หนึ่ง path ต่อ QR, run ของ
+  module ในแถวเดียวกันรวมเป็นสี่เหลี่ยมเดียว) เขียนครั้งเดียวแล้วอ้างอิงซ้ำ
+  จาก object number ไฟล์จึงโตตามจำนวน QR ที่ไม่ซ้ำ ไม่ใช่จำนวนช่อง
+* จำ XObject ล่าสุดไว้ไม่เกิน ``max_cached`` รายการ งานขนาดใหญ่มากจึงใช้หน่วย
+  ความจำคงที่ (payload ที่หลุดจาก cache จะถูกเขียนใหม่เมื่อพบอีก)
+* ข้อความใช้ฟอนต์ Helvetica ที่มีในทุก PDF viewer ตัวอักษรนอก ASCII แสดงเป็น ``?``
+
+    python qr_sheet.py rows.csv --output sheet.pdf --cols 3 --rows 4
+    # field: mobile, amount, name, copies (หรือ biller_id, ref1, ref2 สำหรับ Bill Payment)
+"""
+
+import argparse
+import sys
+import zlib
+from collections import OrderedDict
+
+# A4 ในหน่วย point (1/72 นิ้ว) และขอบกระดาษ 10 มม.
+PAGE_WIDTH = 595.28
+PAGE_HEIGHT = 841.89
+PAGE_MARGIN = 28.35
+
+SHEET_MAX_COPIES = 1000
+
+# ความกว้างตัวอักษรของ Helvetica (AFM, หน่วย 1/1000 ของขนาดฟอนต์) สำหรับ ASCII 32-126
+HELVETICA_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+
+
+def pdf_text(text):
+    """Return ``text`` as printable ASCII (others become '?')"""
+    return ''.join(c if ' ' <= c <= '~' else '?' for c in text)
+
+
+def text_width(text, size):
+    """Width in points of ASCII ``text`` set in Helvetica at ``size``"""
+    return sum(HELVETICA_WIDTHS[ord(c) - 32] for c in text) * size / 1000
+
+
+def _pdf_string(text):
+    return '(' + text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)') + ')'
+
+
+def _fmt(value):
+    """Format a number compactly for a content stream"""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+def qr_path(modules):
+    """Content stream drawing dark modules as one filled path (y axis up, 1 unit = 1 module)"""
+    size = len(modules)
+    ops = []
+    for y, row in enumerate(modules):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            ops.append(f"{start} {size - 1 - y} {x - start} 1 re")
+    ops.append('f')
+    return '\n'.join(ops).encode('ascii')
+
+
+class SheetLayout:
+    """Cell geometry for ``cols`` x ``rows`` QR codes on an A4 page"""
+
+    def __init__(self, cols=3, rows=4):
+        if not (1 <= cols <= 10 and 1 <= rows <= 14):
+            raise ValueError('cols ต้องอยู่ระหว่าง 1-10 และ rows ระหว่าง 1-14')
+        self.cols = cols
+        self.rows = rows
+        self.per_page = cols * rows
+        self.cell_width = (PAGE_WIDTH - 2 * PAGE_MARGIN) / cols
+        self.cell_height = (PAGE_HEIGHT - 2 * PAGE_MARGIN) / rows
+        self.title_size = max(5.0, min(14.0, self.cell_height * 0.07, self.cell_width * 0.09))
+        self.subtitle_size = self.title_size * 0.75
+        text_height = (self.title_size + self.subtitle_size) * 1.35
+        self.qr_side = min(self.cell_width, self.cell_height - text_height) * 0.95
+
+    def cell_origin(self, index):
+        """Return the top-left corner of cell ``index`` on its page"""
+        col = index % self.cols
+        row = index // self.cols % self.rows
+        return (PAGE_MARGIN + col * self.cell_width,
+                PAGE_HEIGHT - PAGE_MARGIN - row * self.cell_height)
+
+
+class SheetWriter:
+    """Stream a PDF of QR cells page by page
+
+    ``cells`` คือ iterable ของ (payload, บรรทัดแรก, บรรทัดที่สอง) ``matrix`` คือฟังก์ชัน
+    ที่คืน module matrix (ไม่รวมขอบ) ของ payload หลังเขียนเสร็จ ``pages``, ``cells``
+    และ ``xobjects`` บอกจำนวนหน้า ช่อง และ QR ที่ฝังในไฟล์
+    """
+
+    def __init__(self, matrix, layout=None, border=4, max_cached=4096):
+        self.matrix = matrix
+        self.layout = layout or SheetLayout()
+        self.border = border
+        self.max_cached = max_cached
+        self.pages = 0
+        self.cells = 0
+        self.xobjects = 0
+        self._offsets = []
+        self._position = 0
+        self._cached = OrderedDict()   # payload -> (object number, module count)
+
+    def _object(self, body, stream=None):
+        """Serialise the next indirect object and record its offset"""
+        number = len(self._offsets) + 1
+        self._offsets.append(self._position)
+        if stream is None:
+            data = f"{number} 0 obj\n{body}\nendobj\n".encode('ascii')
+        else:
+            data = (f"{number} 0 obj\n<< {body} /Length {len(stream)} >>\nstream\n".encode('ascii')
+                    + stream + b"\nendstream\nendobj\n")
+        self._position += len(data)
+        return number, data
+
+    def _reserve(self):
+        """Reserve an object number to be written later (Pages)"""
+        self._offsets.append(None)
+        return len(self._offsets)
+
+    def _write_reserved(self, number, body):
+        self._offsets[number - 1] = self._position
+        data = f"{number} 0 obj\n{body}\nendobj\n".encode('ascii')
+        self._position += len(data)
+        return data
+
+    def _xobject(self, payload, chunks):
+        """Return (name, module count) of the XObject for ``payload``, writing it if new"""
+        cached = self._cached.get(payload)
+        if cached is not None:
+            self._cached.move_to_end(payload)
+            return cached
+        modules = self.matrix(payload)
+        size = len(modules)
+        number, data = self._object(
+            f"/Type /XObject /Subtype /Form /BBox [0 0 {size} {size}] /Filter /FlateDecode",
+            zlib.compress(qr_path(modules)))
+        chunks.append(data)
+        self.xobjects += 1
+        cached = self._cached[payload] = (number, size)
+        if len(self._cached) > self.max_cached:
+            self._cached.popitem(last=False)
+        return cached
+
+    def _page(self, cells, pages_number, font_number):
+        """Serialise one page (its new XObjects, content stream and page object)"""
+        layout = self.layout
+        chunks = []
+        content = []
+        used = {}
+        for index, (payload, title, subtitle) in enumerate(cells):
+            number, size = self._xobject(payload, chunks)
+            used[f"Q{number}"] = number
+            left, top = layout.cell_origin(index)
+            scale = layout.qr_side / (size + 2 * self.border)
+            qr_left = left + (layout.cell_width - layout.qr_side) / 2
+            qr_bottom = top - layout.qr_side
+            content.append(f"q {_fmt(scale)} 0 0 {_fmt(scale)} "
+                           f"{_fmt(qr_left + self.border * scale)} "
+                           f"{_fmt(qr_bottom + self.border * scale)} cm /Q{number} Do Q")
+
+            baseline = qr_bottom - layout.title_size * 0.3
+            for text, font_size in ((title, layout.title_size), (subtitle, layout.subtitle_size)):
+                text = pdf_text(text or '')
+                baseline -= font_size * 1.1
+                if text:
+                    x = left + (layout.cell_width - text_width(text, font_size)) / 2
+                    content.append(f"BT /F1 {_fmt(font_size)} Tf {_fmt(x)} {_fmt(baseline)} Td "
+                                   f"{_pdf_string(text)} Tj ET")
+
+        content_number, data = self._object(
+            '/Filter /FlateDecode', zlib.compress('\n'.join(content).encode('ascii')))
+        chunks.append(data)
+        xobjects = ' '.join(f"/{name} {number} 0 R" for name, number in used.items())
+        page_number, data = self._object(
+            f"<< /Type /Page /Parent {pages_number} 0 R "
+            f"/MediaBox [0 0 {_fmt(PAGE_WIDTH)} {_fmt(PAGE_HEIGHT)}] "
+            f"/Resources << /Font << /F1 {font_number} 0 R >> /XObject << {xobjects} >> >> "
+            f"/Contents {content_number} 0 R >>")
+        chunks.append(data)
+        return page_number, b''.join(chunks)
+
+    def iter_pdf(self, cells):
+        """Yield the PDF as byte chunks, one page at a time"""
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self._position = len(header)
+        catalog_number = self._reserve()
+        pages_number = self._reserve()
+        catalog = self._write_reserved(
+            catalog_number, f"<< /Type /Catalog /Pages {pages_number} 0 R >>")
+        font_number, font = self._object(
+            '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>')
+        yield header + catalog + font
+
+        kids = []
+        page = []
+        for cell in cells:
+            page.append(cell)
+            self.cells += 1
+            if len(page) == self.layout.per_page:
+                number, data = self._page(page, pages_number, font_number)
+                kids.append(number)
+                self.pages += 1
+                page = []
+                yield data
+        if page or not kids:
+            number, data = self._page(page, pages_number, font_number)
+            kids.append(number)
+            self.pages += 1
+            yield data
+
+        # Pages และ xref อยู่ท้ายไฟล์ เพราะรู้จำนวนหน้าเมื่อเขียนครบแล้วเท่านั้น
+        tail = [self._write_reserved(pages_number, (
+            f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] "
+            f"/Count {len(kids)} >>"))]
+        xref_offset = self._position
+        tail.append(f"xref\n0 {len(self._offsets) + 1}\n0000000000 65535 f \n".encode('ascii'))
+        tail.extend(f"{offset:010d} 00000 n \n".encode('ascii') for offset in self._offsets)
+        tail.append((f"trailer\n<< /Size {len(self._offsets) + 1} /Root {catalog_number} 0 R >>\n"
+                     f"startxref\n{xref_offset}\n%%EOF\n").encode('ascii'))
+        yield b''.join(tail)
+
+
+def sheet_cell(row):
+    """Validate one row and return (payload, title, subtitle, copies)
+
+    แถวที่มี biller_id เป็น Bill Payment แถวที่ไม่มี amount เป็น QR แบบ static
+    โยน ValueError พร้อมข้อความเมื่อข้อมูลไม่ถูกต้อง
+    """
+    from generate_qr import (canonical_target, generate_promptpay_payload,
+                             generate_static_payload, prepare_bill_payload, validate_amount,
+                             validate_target)
+
+    if not isinstance(row, dict):
+        raise ValueError('รูปแบบรายการไม่ถูกต้อง')
+    try:
+        copies = int(row.get('copies') or 1)
+    except (TypeError, ValueError):
+        raise ValueError('copies ต้องเป็นจำนวนเต็ม')
+    if not 1 <= copies <= SHEET_MAX_COPIES:
+        raise ValueError(f'copies ต้องอยู่ระหว่าง 1-{SHEET_MAX_COPIES}')
+    name = str(row.get('name') or '')
+    amount = str(row.get('amount') or '').strip()
+
+    if row.get('biller_id'):
+        error, params = prepare_bill_payload(row)
+        if error:
+            raise ValueError(error)
+        ref1 = str(row['ref1']).strip().upper()
+        subtitle = f"{name} ({ref1})" if name else f"Ref1 {ref1}"
+        return params[0], f"{float(amount):.2f} THB", subtitle, copies
+
+    target = canonical_target(str(row.get('mobile') or ''))
+    error = validate_target(target) or (validate_amount(amount) if amount else None)
+    if error:
+        raise ValueError(error)
+    if not amount:
+        return generate_static_payload(target, name), 'PromptPay', name or target, copies
+    payload = generate_promptpay_payload(target, amount, name)
+    return payload, f"{float(amount):.2f} THB", name or target, copies
+
+
+def iter_cells(rows, errors=None):
+    """Yield (payload, title, subtitle) per copy of each valid row
+
+    แถวที่ไม่ถูกต้องจะถูกข้ามและเพิ่ม (ลำดับแถว, ข้อความ) ลงใน ``errors``
+    (ถ้าไม่ระบุ ``errors`` จะโยน ValueError)
+    """
+    for index, row in enumerate(rows, start=1):
+        try:
+            payload, title, subtitle, copies = sheet_cell(row)
+        except ValueError as e:
+            if errors is None:
+                raise ValueError(f'แถว {index}: {e}')
+            errors.append((index, str(e)))
+            continue
+        for _ in range(copies):
+            yield payload, title, subtitle
+
+
+def qr_modules(payload):
+    """Module matrix of ``payload`` (no border) with the same settings as /generate
+
+    อ่านผ่าน render cache ในรูปแบบ ``matrix`` QR ที่เคยสร้างแล้ว (เช่นแผ่นที่พิมพ์ซ้ำ)
+    จึงไม่ต้อง encode ใหม่
+    """
+    from generate_qr import QR_BORDER, get_qr_image
+
+    data = get_qr_image(payload, 'matrix')
+    size = int.from_bytes(data[:2], 'big')
+    bits = f"{int.from_bytes(data[2:], 'big'):0{(len(data) - 2) * 8}b}"
+    # matrix ที่ cache ไว้รวมขอบ QR_BORDER module ทุกด้าน
+    inner = size - 2 * QR_BORDER
+    return [[bits[(y + QR_BORDER) * size + QR_BORDER + x] == '1' for x in range(inner)]
+            for y in range(inner)]
+
+
+def main(argv=None):
+    from batch import open_rows, report_failed
+    from generate_qr import QR_BORDER
+
+    parser = argparse.ArgumentParser(description='Print PromptPay QR codes N-up on A4 PDF pages')
+    parser.add_argument('input', help="CSV or JSON Lines (mobile, amount, name, copies), or '-'")
+    parser.add_argument('-o', '--output', required=True, help="PDF file, or '-' for stdout")
+    parser.add_argument('--cols', type=int, default=3)
+    parser.add_argument('--rows', type=int, default=4)
+    args = parser.parse_args(argv)
+
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+
+    errors = []
+    writer = SheetWriter(qr_modules, SheetLayout(args.cols, args.rows), QR_BORDER)
+    with open_rows(args.input) as rows:
+        try:
+            for chunk in writer.iter_pdf(iter_cells(rows, errors)):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout.buffer:
+                output.close()
+
+    print(f"✅ {writer.cells} QR codes ({writer.xobjects} distinct) on {writer.pages} pages "
+          f"-> {args.output}", file=sys.stderr)
+    return report_failed(errors)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
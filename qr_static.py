@@ -0,0 +1,166 @@
+"""Permanent on-disk store of static (amount-less) merchant QR images.
+
+QR แบบ static (``010211`` ไม่มี Tag 54) ของร้านหนึ่งไม่เคยเปลี่ยน จึง render
+ล่วงหน้าด้วย ``build`` แล้วเก็บเป็นไฟล์ถาวร (ไม่มีการลบ ต่างจาก render cache) และ
+ให้บริการที่ ``GET /qr/<target>.png`` แบบ immutable เซิร์ฟเวอร์อ่าน store อย่างเดียว
+ร้านที่ไม่มีในนั้นจะ render ผ่าน cache ปกติ (คำขอจากภายนอกจึงไม่เพิ่มไฟล์บนดิสก์)
+
+ชื่อไฟล์คือ ``render_key_digest`` ของ key เดียวกับที่ ``get_qr_image`` ใช้
+(payload + พารามิเตอร์การ render) เก็บเป็น ``<2 ตัวแรก>/<digest>.<ext>``
+ถ้าเปลี่ยนการตั้งค่าการ render ก็จะได้ไฟล์ใหม่ ไม่ได้ภาพเก่าผิด ๆ
+
+    python qr_static.py build merchants.csv --output static_qr/ -w 8   # field: mobile, name
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from qr_cache import render_key_digest
+
+
+class StaticQRStore:
+    """Write-once image files keyed by render cache key"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+    def path(self, key, extension='png'):
+        """Return the file path for a render cache key"""
+        digest = render_key_digest(key).hex()
+        return os.path.join(self.directory, digest[:2], f"{digest}.{extension}")
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, extension='png'):
+        """Return the stored bytes for ``key`` or None"""
+        try:
+            with open(self.path(key, extension), 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return data
+
+    def put(self, key, data, extension='png'):
+        """Store ``data`` atomically (concurrent writers of one key write the same bytes)"""
+        path = self.path(key, extension)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # ถ้าเขียนไม่ได้ก็แค่ render ใหม่ครั้งหน้า
+            return False
+        self._count('writes')
+        return True
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.writes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'writes': self.writes}
+
+
+def precompute_chunk(rows, directory, formats):
+    """Pool task: render the static QR of each (row number, row) into ``directory``
+
+    คืน (จำนวนไฟล์ที่เขียน, จำนวนที่มีอยู่แล้ว, list ของ (ลำดับแถว, error))
+    """
+    from generate_qr import (QR_FORMAT_EXTENSIONS, QR_RENDERER, canonical_target,
+                             generate_static_payload, qr_render_params, render_qr,
+                             validate_target)
+
+    store = StaticQRStore(directory)
+    written = existing = 0
+    failed = []
+    for index, row in rows:
+        if not isinstance(row, dict):
+            failed.append((index, 'รูปแบบรายการไม่ถูกต้อง'))
+            continue
+        target = canonical_target(str(row.get('mobile') or ''))
+        error = validate_target(target)
+        if error:
+            failed.append((index, error))
+            continue
+        try:
+            payload = generate_static_payload(target, str(row.get('name') or ''))
+        except Exception as e:
+            failed.append((index, str(e)))
+            continue
+        for fmt in formats:
+            key = (payload,) + qr_render_params(fmt, QR_RENDERER)
+            extension = QR_FORMAT_EXTENSIONS[fmt]
+            # รันซ้ำได้: ร้านที่ทำไว้แล้วไม่ต้อง render ใหม่
+            if os.path.exists(store.path(key, extension)):
+                existing += 1
+            elif store.put(key, render_qr(payload, fmt), extension):
+                written += 1
+            else:
+                failed.append((index, f'เขียนไฟล์ไม่ได้: {store.path(key, extension)}'))
+    return written, existing, failed
+
+
+def precompute(rows, directory, formats=('png',), workers=None, chunk_size=64):
+    """Render the static QR of every merchant row (mobile, name) with a process pool"""
+    from batch import iter_chunks, map_chunks
+
+    written = existing = 0
+    failed = []
+    started = time.perf_counter()
+
+    for chunk_written, chunk_existing, chunk_failed in map_chunks(
+            precompute_chunk, iter_chunks(rows, chunk_size), directory, formats,
+            workers=workers):
+        written += chunk_written
+        existing += chunk_existing
+        failed.extend(chunk_failed)
+
+    return {
+        'written': written,
+        'existing': existing,
+        'failed': sorted(failed),
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def main(argv=None):
+    from batch import open_rows, report_failed
+    from generate_qr import QR_FORMAT_EXTENSIONS
+
+    parser = argparse.ArgumentParser(description='Precompute static merchant QR codes')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='render the static QR of every merchant in a list')
+    build.add_argument('input', help="CSV or JSON Lines (mobile, name), or '-' for stdin")
+    build.add_argument('-o', '--output', required=True, help='store directory (QR_STATIC_DIR)')
+    build.add_argument('--format', action='append', choices=tuple(QR_FORMAT_EXTENSIONS),
+                       help='formats to store (repeatable, default: png)')
+    build.add_argument('-w', '--workers', type=int, default=None, help='default: CPU count')
+    args = parser.parse_args(argv)
+
+    with open_rows(args.input) as rows:
+        summary = precompute(rows, args.output, tuple(args.format or ('png',)), args.workers)
+
+    print(f"✅ {summary['written']} images written, {summary['existing']} already stored "
+          f"-> {args.output} in {summary['seconds']:.2f}s")
+    return report_failed(summary['failed'])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,464 @@
+/*
+ * QR Code encoder for the PromptPay page (byte mode, error correction level M).
+ *
+ * วาด payload ที่ได้จาก /payload ลง <canvas> ในเบราว์เซอร์ เซิร์ฟเวอร์จึงไม่ต้อง
+ * render ภาพ ใช้ระดับแก้ไขข้อผิดพลาด M, ขนาดช่อง 10 px และขอบ 4 ช่อง
+ * เหมือนภาพจาก /generate ถ้าเบราว์เซอร์ไม่รองรับ หน้าเว็บจะกลับไปใช้ /generate
+ *
+ *     const qr = PromptPayQR.encode(payload);
+ *     PromptPayQR.drawToCanvas(canvas, qr, {scale: 10, border: 4});
+ */
+(function (global) {
+    'use strict';
+
+    // จำนวน codeword แก้ไขข้อผิดพลาดต่อ block และจำนวน block ของระดับ M (index = version)
+    const ECC_CODEWORDS_PER_BLOCK = [-1,
+        10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+        26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28];
+    const NUM_ECC_BLOCKS = [-1,
+        1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+        17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49];
+    const FORMAT_BITS_M = 0;
+
+    const PENALTY_N1 = 3;
+    const PENALTY_N2 = 3;
+    const PENALTY_N3 = 40;
+    const PENALTY_N4 = 10;
+
+    function getBit(value, i) {
+        return ((value >>> i) & 1) !== 0;
+    }
+
+    function utf8Bytes(text) {
+        if (typeof TextEncoder !== 'undefined') {
+            return Array.from(new TextEncoder().encode(text));
+        }
+        return Array.from(unescape(encodeURIComponent(text)), function (c) {
+            return c.charCodeAt(0);
+        });
+    }
+
+    // ---- Reed-Solomon บน GF(256), polynomial 0x11D ----
+
+    function gfMultiply(x, y) {
+        let z = 0;
+        for (let i = 7; i >= 0; i--) {
+            z = (z << 1) ^ ((z >>> 7) * 0x11D);
+            z ^= ((y >>> i) & 1) * x;
+        }
+        return z;
+    }
+
+    function rsDivisor(degree) {
+        const result = new Array(degree).fill(0);
+        result[degree - 1] = 1;
+        let root = 1;
+        for (let i = 0; i < degree; i++) {
+            for (let j = 0; j < degree; j++) {
+                result[j] = gfMultiply(result[j], root);
+                if (j + 1 < degree) {
+                    result[j] ^= result[j + 1];
+                }
+            }
+            root = gfMultiply(root, 0x02);
+        }
+        return result;
+    }
+
+    function rsRemainder(data, divisor) {
+        const result = divisor.map(function () { return 0; });
+        for (const b of data) {
+            const factor = b ^ result.shift();
+            result.push(0);
+            divisor.forEach(function (coef, i) {
+                result[i] ^= gfMultiply(coef, factor);
+            });
+        }
+        return result;
+    }
+
+    // ---- ขนาดและตำแหน่งตาม version ----
+
+    function numRawDataModules(version) {
+        let result = (16 * version + 128) * version + 64;
+        if (version >= 2) {
+            const numAlign = Math.floor(version / 7) + 2;
+            result -= (25 * numAlign - 10) * numAlign - 55;
+            if (version >= 7) {
+                result -= 36;
+            }
+        }
+        return result;
+    }
+
+    function numDataCodewords(version) {
+        return Math.floor(numRawDataModules(version) / 8) -
+            ECC_CODEWORDS_PER_BLOCK[version] * NUM_ECC_BLOCKS[version];
+    }
+
+    function alignmentPositions(version, size) {
+        if (version === 1) {
+            return [];
+        }
+        const numAlign = Math.floor(version / 7) + 2;
+        const step = version === 32 ? 26 :
+            Math.ceil((version * 4 + 4) / (numAlign * 2 - 2)) * 2;
+        const result = [6];
+        for (let pos = size - 7; result.length < numAlign; pos -= step) {
+            result.splice(1, 0, pos);
+        }
+        return result;
+    }
+
+    // ---- ข้อมูล: mode byte, ตัวนับความยาว, padding และ ECC ----
+
+    function dataCodewords(bytes, version) {
+        const bits = [];
+        function append(value, length) {
+            for (let i = length - 1; i >= 0; i--) {
+                bits.push((value >>> i) & 1);
+            }
+        }
+        append(0x4, 4);
+        append(bytes.length, version < 10 ? 8 : 16);
+        bytes.forEach(function (b) { append(b, 8); });
+
+        const capacity = numDataCodewords(version) * 8;
+        append(0, Math.min(4, capacity - bits.length));
+        append(0, (8 - bits.length % 8) % 8);
+        for (let pad = 0xEC; bits.length < capacity; pad ^= 0xEC ^ 0x11) {
+            append(pad, 8);
+        }
+
+        const result = [];
+        for (let i = 0; i < bits.length; i += 8) {
+            let b = 0;
+            for (let j = 0; j < 8; j++) {
+                b = (b << 1) | bits[i + j];
+            }
+            result.push(b);
+        }
+        return result;
+    }
+
+    function addEccAndInterleave(data, version) {
+        const numBlocks = NUM_ECC_BLOCKS[version];
+        const blockEccLen = ECC_CODEWORDS_PER_BLOCK[version];
+        const rawCodewords = Math.floor(numRawDataModules(version) / 8);
+        const numShortBlocks = numBlocks - rawCodewords % numBlocks;
+        const shortBlockLen = Math.floor(rawCodewords / numBlocks);
+
+        const blocks = [];
+        const divisor = rsDivisor(blockEccLen);
+        for (let i = 0, k = 0; i < numBlocks; i++) {
+            const block = data.slice(k, k + shortBlockLen - blockEccLen + (i < numShortBlocks ? 0 : 1));
+            k += block.length;
+            const ecc = rsRemainder(block, divisor);
+            if (i < numShortBlocks) {
+                block.push(0);
+            }
+            blocks.push(block.concat(ecc));
+        }
+
+        const result = [];
+        for (let i = 0; i < blocks[0].length; i++) {
+            blocks.forEach(function (block, j) {
+                // block สั้นมีช่องว่างหนึ่งช่องท้ายส่วนข้อมูล
+                if (i !== shortBlockLen - blockEccLen || j >= numShortBlocks) {
+                    result.push(block[i]);
+                }
+            });
+        }
+        return result;
+    }
+
+    // ---- matrix ----
+
+    function QRMatrix(version) {
+        this.version = version;
+        this.size = version * 4 + 17;
+        this.modules = [];
+        this.isFunction = [];
+        for (let y = 0; y < this.size; y++) {
+            this.modules.push(new Array(this.size).fill(false));
+            this.isFunction.push(new Array(this.size).fill(false));
+        }
+    }
+
+    QRMatrix.prototype.setFunction = function (x, y, dark) {
+        this.modules[y][x] = dark;
+        this.isFunction[y][x] = true;
+    };
+
+    QRMatrix.prototype.drawFunctionPatterns = function () {
+        const size = this.size;
+        for (let i = 0; i < size; i++) {
+            this.setFunction(6, i, i % 2 === 0);
+            this.setFunction(i, 6, i % 2 === 0);
+        }
+        this.drawFinder(3, 3);
+        this.drawFinder(size - 4, 3);
+        this.drawFinder(3, size - 4);
+
+        const positions = alignmentPositions(this.version, size);
+        const last = positions.length - 1;
+        for (let i = 0; i <= last; i++) {
+            for (let j = 0; j <= last; j++) {
+                // ไม่ทับ finder pattern สามมุม
+                if (!((i === 0 && j === 0) || (i === 0 && j === last) || (i === last && j === 0))) {
+                    this.drawAlignment(positions[i], positions[j]);
+                }
+            }
+        }
+        this.drawFormatBits(0);
+        this.drawVersion();
+    };
+
+    QRMatrix.prototype.drawFinder = function (x, y) {
+        for (let dy = -4; dy <= 4; dy++) {
+            for (let dx = -4; dx <= 4; dx++) {
+                const dist = Math.max(Math.abs(dx), Math.abs(dy));
+                const xx = x + dx;
+                const yy = y + dy;
+                if (xx >= 0 && xx < this.size && yy >= 0 && yy < this.size) {
+                    this.setFunction(xx, yy, dist !== 2 && dist !== 4);
+                }
+            }
+        }
+    };
+
+    QRMatrix.prototype.drawAlignment = function (x, y) {
+        for (let dy = -2; dy <= 2; dy++) {
+            for (let dx = -2; dx <= 2; dx++) {
+                this.setFunction(x + dx, y + dy, Math.max(Math.abs(dx), Math.abs(dy)) !== 1);
+            }
+        }
+    };
+
+    QRMatrix.prototype.drawFormatBits = function (mask) {
+        const data = FORMAT_BITS_M << 3 | mask;
+        let rem = data;
+        for (let i = 0; i < 10; i++) {
+            rem = (rem << 1) ^ ((rem >>> 9) * 0x537);
+        }
+        const bits = (data << 10 | rem) ^ 0x5412;
+        const size = this.size;
+
+        for (let i = 0; i <= 5; i++) {
+            this.setFunction(8, i, getBit(bits, i));
+        }
+        this.setFunction(8, 7, getBit(bits, 6));
+        this.setFunction(8, 8, getBit(bits, 7));
+        this.setFunction(7, 8, getBit(bits, 8));
+        for (let i = 9; i < 15; i++) {
+            this.setFunction(14 - i, 8, getBit(bits, i));
+        }
+        for (let i = 0; i < 8; i++) {
+            this.setFunction(size - 1 - i, 8, getBit(bits, i));
+        }
+        for (let i = 8; i < 15; i++) {
+            this.setFunction(8, size - 15 + i, getBit(bits, i));
+        }
+        this.setFunction(8, size - 8, true);
+    };
+
+    QRMatrix.prototype.drawVersion = function () {
+        if (this.version < 7) {
+            return;
+        }
+        let rem = this.version;
+        for (let i = 0; i < 12; i++) {
+            rem = (rem << 1) ^ ((rem >>> 11) * 0x1F25);
+        }
+        const bits = this.version << 12 | rem;
+        for (let i = 0; i < 18; i++) {
+            const dark = getBit(bits, i);
+            const a = this.size - 11 + i % 3;
+            const b = Math.floor(i / 3);
+            this.setFunction(a, b, dark);
+            this.setFunction(b, a, dark);
+        }
+    };
+
+    QRMatrix.prototype.drawCodewords = function (codewords) {
+        const size = this.size;
+        let i = 0;
+        for (let right = size - 1; right >= 1; right -= 2) {
+            if (right === 6) {
+                right = 5;
+            }
+            const upward = ((right + 1) & 2) === 0;
+            for (let vert = 0; vert < size; vert++) {
+                const y = upward ? size - 1 - vert : vert;
+                for (let j = 0; j < 2; j++) {
+                    const x = right - j;
+                    if (!this.isFunction[y][x] && i < codewords.length * 8) {
+                        this.modules[y][x] = getBit(codewords[i >>> 3], 7 - (i & 7));
+                        i++;
+                    }
+                }
+            }
+        }
+    };
+
+    QRMatrix.prototype.applyMask = function (mask) {
+        for (let y = 0; y < this.size; y++) {
+            for (let x = 0; x < this.size; x++) {
+                let invert;
+                switch (mask) {
+                    case 0: invert = (x + y) % 2 === 0; break;
+                    case 1: invert = y % 2 === 0; break;
+                    case 2: invert = x % 3 === 0; break;
+                    case 3: invert = (x + y) % 3 === 0; break;
+                    case 4: invert = (Math.floor(x / 3) + Math.floor(y / 2)) % 2 === 0; break;
+                    case 5: invert = x * y % 2 + x * y % 3 === 0; break;
+                    case 6: invert = (x * y % 2 + x * y % 3) % 2 === 0; break;
+                    default: invert = ((x + y) % 2 + x * y % 3) % 2 === 0; break;
+                }
+                if (invert && !this.isFunction[y][x]) {
+                    this.modules[y][x] = !this.modules[y][x];
+                }
+            }
+        }
+    };
+
+    QRMatrix.prototype.penaltyScore = function () {
+        const size = this.size;
+        const modules = this.modules;
+        let result = 0;
+
+        // แถว/คอลัมน์ที่สีเดียวกันต่อกัน และลายที่คล้าย finder pattern
+        for (let pass = 0; pass < 2; pass++) {
+            for (let a = 0; a < size; a++) {
+                let runDark = false;
+                let runLength = 0;
+                const history = [0, 0, 0, 0, 0, 0, 0];
+                for (let b = 0; b < size; b++) {
+                    const dark = pass === 0 ? modules[a][b] : modules[b][a];
+                    if (dark === runDark) {
+                        runLength++;
+                        if (runLength === 5) {
+                            result += PENALTY_N1;
+                        } else if (runLength > 5) {
+                            result++;
+                        }
+                    } else {
+                        this.addRunHistory(runLength, history);
+                        if (!runDark) {
+                            result += this.countFinderLike(history) * PENALTY_N3;
+                        }
+                        runDark = dark;
+                        runLength = 1;
+                    }
+                }
+                if (runDark) {
+                    this.addRunHistory(runLength, history);
+                    runLength = 0;
+                }
+                this.addRunHistory(runLength + size, history);
+                result += this.countFinderLike(history) * PENALTY_N3;
+            }
+        }
+
+        // บล็อก 2x2 สีเดียวกัน
+        for (let y = 0; y < size - 1; y++) {
+            for (let x = 0; x < size - 1; x++) {
+                const dark = modules[y][x];
+                if (dark === modules[y][x + 1] && dark === modules[y + 1][x] &&
+                        dark === modules[y + 1][x + 1]) {
+                    result += PENALTY_N2;
+                }
+            }
+        }
+
+        // สัดส่วนช่องดำ
+        let dark = 0;
+        modules.forEach(function (row) {
+            row.forEach(function (module) { dark += module ? 1 : 0; });
+        });
+        const total = size * size;
+        result += (Math.ceil(Math.abs(dark * 20 - total * 10) / total) - 1) * PENALTY_N4;
+        return result;
+    };
+
+    QRMatrix.prototype.addRunHistory = function (runLength, history) {
+        if (history[0] === 0) {
+            runLength += this.size;  // ขอบสีขาวรอบ symbol
+        }
+        history.pop();
+        history.unshift(runLength);
+    };
+
+    QRMatrix.prototype.countFinderLike = function (history) {
+        const n = history[1];
+        const core = n > 0 && history[2] === n && history[3] === n * 3 &&
+            history[4] === n && history[5] === n;
+        return (core && history[0] >= n * 4 && history[6] >= n ? 1 : 0) +
+            (core && history[6] >= n * 4 && history[0] >= n ? 1 : 0);
+    };
+
+    /**
+     * Encode text into a QR symbol: {version, mask, size, modules[y][x]}.
+     * ``mask`` (0-7) is optional; by default the lowest penalty mask is used.
+     */
+    function encode(text, mask) {
+        const bytes = utf8Bytes(text);
+        let version = 1;
+        while (4 + (version < 10 ? 8 : 16) + bytes.length * 8 > numDataCodewords(version) * 8) {
+            version++;
+            if (version > 40) {
+                throw new RangeError('ข้อมูลยาวเกินกว่าจะสร้าง QR Code ได้');
+            }
+        }
+
+        const qr = new QRMatrix(version);
+        qr.drawFunctionPatterns();
+        qr.drawCodewords(addEccAndInterleave(dataCodewords(bytes, version), version));
+
+        if (mask === undefined || mask === null) {
+            let minPenalty = Infinity;
+            for (let candidate = 0; candidate < 8; candidate++) {
+                qr.applyMask(candidate);
+                qr.drawFormatBits(candidate);
+                const penalty = qr.penaltyScore();
+                if (penalty < minPenalty) {
+                    mask = candidate;
+                    minPenalty = penalty;
+                }
+                qr.applyMask(candidate);  // XOR ซ้ำเพื่อคืนค่าเดิม
+            }
+        }
+        qr.applyMask(mask);
+        qr.drawFormatBits(mask);
+        return {version: version, mask: mask, size: qr.size, modules: qr.modules};
+    }
+
+    /** Draw an encoded symbol on a canvas (black on white, like /generate). */
+    function drawToCanvas(canvas, qr, options) {
+        const scale = (options && options.scale) || 10;
+        const border = options && options.border !== undefined ? options.border : 4;
+        const width = (qr.size + border * 2) * scale;
+        canvas.width = width;
+        canvas.height = width;
+
+        const ctx = canvas.getContext('2d');
+        ctx.fillStyle = '#ffffff';
+        ctx.fillRect(0, 0, width, width);
+        ctx.fillStyle = '#000000';
+        for (let y = 0; y < qr.size; y++) {
+            for (let x = 0; x < qr.size; x++) {
+                if (qr.modules[y][x]) {
+                    ctx.fillRect((x + border) * scale, (y + border) * scale, scale, scale);
+                }
+            }
+        }
+        return canvas;
+    }
+
+    const PromptPayQR = {encode: encode, drawToCanvas: drawToCanvas};
+    if (typeof module !== 'undefined' && module.exports) {
+        module.exports = PromptPayQR;
+    } else {
+        global.PromptPayQR = PromptPayQR;
+    }
+})(typeof window !== 'undefined' ? window : this);
@@ -0,0 +1,44 @@
+"""ASGI /generate: pool rendering reports the same stages as the Flask app"""
+
+import asyncio
+
+import pytest
+
+from asgi import PromptPayASGI
+from generate_qr import create_app, render_cache
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = PromptPayASGI(create_app(warm=False), render_workers=1)
+    yield app
+    app.shutdown()
+
+
+async def _post(app, path, body):
+    messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': 'POST', 'path': path, 'query_string': b'',
+             'headers': [(b'content-type', b'application/x-www-form-urlencoded'),
+                         (b'content-length', str(len(body)).encode())]}
+    await app(scope, receive, send)
+    start, body = sent
+    return start['status'], dict(start['headers']), body['body']
+
+
+def test_generate_sets_server_timing(app):
+    render_cache.clear()
+    status, headers, body = asyncio.run(
+        _post(app, '/generate', b'mobile=0812345678&amount=77.50'))
+
+    assert status == 200
+    assert body.startswith(b'\x89PNG')
+    stages = [entry.split(';')[0] for entry in headers[b'server-timing'].decode().split(', ')]
+    assert stages == ['validate', 'payload', 'encode', 'image', 'total']
@@ -0,0 +1,25 @@
+"""Input handling shared by the batch, pack, static and sheet command lines"""
+
+from batch import open_rows, report_failed
+
+
+def test_open_rows_sniffs_the_extension(tmp_path):
+    csv_path = tmp_path / 'rows.csv'
+    # ไฟล์จาก Excel มักมี BOM นำหน้า header
+    csv_path.write_bytes('﻿mobile,amount\n0812345678,10\n'.encode('utf-8'))
+    jsonl_path = tmp_path / 'rows.ndjson'
+    jsonl_path.write_text('{"mobile": "0812345678"}\n\nnot json\n', encoding='utf-8')
+
+    with open_rows(str(csv_path)) as rows:
+        assert list(rows) == [{'mobile': '0812345678', 'amount': '10'}]
+    with open_rows(str(jsonl_path)) as rows:
+        assert list(rows) == [{'mobile': '0812345678'}, 'not json']
+    with open_rows(str(jsonl_path), 'csv') as rows:
+        assert next(rows) == {'{"mobile": "0812345678"}': 'not json'}
+
+
+def test_report_failed(capsys):
+    assert report_failed([]) == 0
+    assert capsys.readouterr().err == ''
+    assert report_failed([(2, 'bad amount')]) == 1
+    assert capsys.readouterr().err == '❌ 1 failed rows:\n   row 2: bad amount\n'
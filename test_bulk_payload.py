@@ -0,0 +1,73 @@
+"""Property tests: the columnar builders match the scalar payload templates byte for byte"""
+
+import random
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from bulk_payload import build_bill_payloads, build_payloads  # noqa: E402
+from generate_qr import compile_bill_template, compile_payload_template  # noqa: E402
+
+ROWS = 500
+NAME_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 .-&'
+REF_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+LABEL_ALPHABET = REF_ALPHABET + 'abcxyz -_./#'
+
+
+def _text(rng, alphabet, low, high):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randrange(low, high)))
+
+
+@pytest.mark.parametrize('seed', range(10))
+@pytest.mark.parametrize('use_names', [False, True])
+def test_build_payloads_matches_fill(seed, use_names):
+    rng = random.Random(seed)
+    targets = [rng.choice(['06', '08', '09']) + f"{rng.randrange(10 ** 8):08d}"
+               if rng.random() < 0.8 else f"{rng.randrange(10 ** 13):013d}"
+               for _ in range(ROWS)]
+    # รวมค่าที่ปัดเศษยาก (2.675, 1.005), ศูนย์ติดลบ, ค่าใหญ่มาก และ NaN
+    amounts = [rng.choice([rng.randrange(1, 100000000) / 100, rng.uniform(0.001, 999999.99),
+                           round(rng.uniform(0, 1000), 3), rng.randrange(0, 10 ** 6) / 1000,
+                           0.125, 2.675, 1.005, -0.0, -12.345, 1e20, float('nan')])
+               for _ in range(ROWS)]
+    names = [_text(rng, NAME_ALPHABET, 0, 40) for _ in range(ROWS)]
+
+    built = build_payloads(targets, amounts, names if use_names else None)
+    for i in range(ROWS):
+        name = names[i] if use_names else ''
+        expected = compile_payload_template(targets[i]).fill(amounts[i], name)
+        assert built[i] == expected.encode('ascii'), (targets[i], amounts[i], name)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_build_bill_payloads_matches_fill(seed):
+    rng = random.Random(100 + seed)
+    billers = [f"{rng.randrange(10 ** 15):015d}" for _ in range(7)]
+    columns = {
+        'biller_ids': [rng.choice(billers) for _ in range(ROWS)],
+        'ref1s': [_text(rng, REF_ALPHABET, 1, 21) for _ in range(ROWS)],
+        'amounts': [rng.choice([rng.randrange(1, 100000000) / 100, 2.675, 1.005,
+                                rng.uniform(0.01, 999999.99)]) for _ in range(ROWS)],
+        'ref2s': [_text(rng, REF_ALPHABET, 0, 21) for _ in range(ROWS)],
+        'names': [_text(rng, LABEL_ALPHABET, 0, 40) for _ in range(ROWS)],
+        'terminals': [_text(rng, LABEL_ALPHABET, 0, 26) if rng.random() < 0.5 else ''
+                      for _ in range(ROWS)],
+        'references': [_text(rng, LABEL_ALPHABET, 0, 26) if rng.random() < 0.5 else ''
+                       for _ in range(ROWS)],
+    }
+
+    built = build_bill_payloads(**columns)
+    for i in range(ROWS):
+        biller_id, ref1, amount, ref2, name, terminal, reference = (
+            columns[name][i] for name in ('biller_ids', 'ref1s', 'amounts', 'ref2s', 'names',
+                                          'terminals', 'references'))
+        expected = compile_bill_template(biller_id).fill(ref1, amount, ref2, name, terminal,
+                                                         reference)
+        assert built[i] == expected.encode('ascii'), (biller_id, ref1, amount, ref2)
+
+
+def test_empty_input():
+    assert len(build_payloads([], [])) == 0
+    assert len(build_payloads([], [], [])) == 0
+    assert len(build_bill_payloads([], [], [])) == 0
@@ -0,0 +1,64 @@
+"""CRC16-CCITT table engine against the original bit-by-bit implementation"""
+
+import random
+
+import pytest
+
+from crc16 import CRC16_INIT, _crc16_ccitt_bitwise, crc16_ccitt
+from generate_qr import compile_payload_template, generate_promptpay_payload
+
+
+def _random_samples(count=2000, seed=0):
+    rng = random.Random(seed)
+    return [bytes(rng.randrange(256) for _ in range(rng.randrange(1, 160)))
+            for _ in range(count)]
+
+
+SAMPLES = [b"", b"\x00", b"\xff", b"1", b"123456789",
+           b"00020101021229370016A000000677010111"] + _random_samples()
+
+
+def test_check_value():
+    # ค่ามาตรฐาน CRC-16/CCITT-FALSE ของ "123456789"
+    assert crc16_ccitt(b"123456789") == 0x29B1
+
+
+def test_empty_input_is_init():
+    assert crc16_ccitt(b"") == CRC16_INIT
+    assert crc16_ccitt(b"", 0x1234) == 0x1234
+
+
+@pytest.mark.parametrize('byte', range(256))
+def test_single_byte(byte):
+    assert crc16_ccitt(bytes([byte])) == _crc16_ccitt_bitwise(bytes([byte]))
+
+
+def test_matches_bitwise():
+    for data in SAMPLES:
+        assert crc16_ccitt(data) == _crc16_ccitt_bitwise(data), data
+
+
+def test_resume_matches_single_pass():
+    # คำนวณต่อจากค่ากลางทาง (crc=) ต้องได้ผลเท่ากับคำนวณรวดเดียว ทุกจุดตัด
+    for data in SAMPLES[:200]:
+        expected = _crc16_ccitt_bitwise(data)
+        for cut in range(len(data) + 1):
+            assert crc16_ccitt(data[cut:], crc16_ccitt(data[:cut])) == expected, (data, cut)
+
+
+def test_resume_from_arbitrary_crc():
+    rng = random.Random(1)
+    for data in SAMPLES[:500]:
+        start = rng.randrange(0x10000)
+        assert crc16_ccitt(data, start) == _crc16_ccitt_bitwise(data, start)
+
+
+@pytest.mark.parametrize('target', ['0812345678', '0612345678', '1101700230708'])
+@pytest.mark.parametrize('amount, name', [('1', ''), ('100.50', 'Test Shop'),
+                                          ('99999.99', 'A' * 30)])
+def test_payload_prefix_crc(target, amount, name):
+    # PayloadTemplate คำนวณ CRC ต่อจาก CRC ของ prefix ที่เก็บไว้
+    template = compile_payload_template(target)
+    assert template.prefix_crc == _crc16_ccitt_bitwise(template.prefix)
+    payload = generate_promptpay_payload(target, amount, name)
+    assert payload[-4:] == f"{_crc16_ccitt_bitwise(payload[:-4].encode('ascii')):04X}"
@@ -0,0 +1,33 @@
+"""HTTP behaviour of the Flask app (test client, no warm-up)"""
+
+import csv
+import io
+import zipfile
+
+import pytest
+
+from generate_qr import create_app
+
+
+@pytest.fixture
+def client():
+    return create_app(warm=False).test_client()
+
+
+def test_batch_manifest_identifies_bill_rows(client):
+    rows = [
+        {'mobile': '0812345678', 'amount': '10'},
+        {'biller_id': '010753600031508', 'ref1': 'INV001', 'ref2': 'A1', 'amount': '99'},
+        {'biller_id': '010753600031508', 'ref1': 'bad ref!', 'amount': '5'},
+    ]
+    response = client.post('/generate/batch', json=rows)
+    assert response.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+        manifest = list(csv.DictReader(io.TextIOWrapper(archive.open('manifest.csv'), 'utf-8')))
+
+    assert [entry['row'] for entry in manifest] == ['1', '2', '3']
+    assert [entry['status'] for entry in manifest] == ['ok', 'ok', 'error']
+    assert manifest[0]['mobile'] == '0812345678'
+    assert (manifest[1]['biller_id'], manifest[1]['ref1'], manifest[1]['ref2']) == \
+        ('010753600031508', 'INV001', 'A1')
+    assert manifest[2]['ref1'] == 'bad ref!' and manifest[2]['error']
@@ -0,0 +1,81 @@
+"""Multi-process metrics: snapshot files, retired workers and pool stage timings"""
+
+import json
+import os
+import time
+
+import pytest
+
+import metrics
+from batch import iter_chunks, map_chunks, render_chunk
+from generate_qr import render_cache
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    metrics.registry.reset()
+    yield tmp_path
+    metrics.registry.reset()
+
+
+def _write_snapshot(path, requests, age=0):
+    snapshot = metrics._snapshot(metrics.registry.buckets,
+                                 {('qr_requests_total', (('route', '/generate'),)): requests},
+                                 {})
+    path.write_text(json.dumps(snapshot))
+    if age:
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+
+
+def _requests(counters):
+    return counters.get(('qr_requests_total', (('route', '/generate'),)), 0)
+
+
+def test_snapshot_name_is_unique_per_process(metrics_dir):
+    metrics.flush()
+    name, = os.listdir(metrics_dir)
+    assert name == f"metrics-{os.getpid()}-{metrics._process_started}.json"
+
+    # worker ใหม่ที่ได้ pid เดิมต้องไม่เขียนทับไฟล์ของ worker ที่ตายไปแล้ว
+    started = metrics._process_started
+    metrics._after_fork()
+    assert metrics._process_started != started
+
+
+def test_dead_worker_counters_are_retired_not_lost(metrics_dir):
+    _write_snapshot(metrics_dir / 'metrics-101-1.json', 5)
+    _write_snapshot(metrics_dir / 'metrics-102-1.json', 7, age=metrics.METRICS_RETIRE_AFTER + 5)
+    _write_snapshot(metrics_dir / 'metrics-103-1.json', 11, age=metrics.METRICS_RETIRE_AFTER + 5)
+
+    counters, _ = metrics.collect()
+    assert _requests(counters) == 23
+    assert sorted(os.listdir(metrics_dir)) == ['metrics-101-1.json', 'metrics-retired.json',
+                                               'metrics-retired.lock']
+
+    # รวมครั้งที่สองต้องไม่นับซ้ำ และ worker ที่ตายทีหลังถูกบวกเพิ่มเข้าไฟล์เดิม
+    _write_snapshot(metrics_dir / 'metrics-101-1.json', 6, age=metrics.METRICS_RETIRE_AFTER + 5)
+    counters, _ = metrics.collect()
+    assert _requests(counters) == 24
+    assert not list(metrics_dir.glob('metrics-*-*.json'))
+
+    metrics.clear_dir()
+    assert not os.listdir(metrics_dir)
+
+
+def test_pool_stage_timings_reach_the_parent(metrics_dir):
+    with metrics.capture_stages(observe=False) as timings:
+        with metrics.stage('encode'):
+            pass
+    assert [name for name, _ in timings] == ['encode']
+    assert not metrics.registry.histograms
+
+    render_cache.clear()  # worker ที่ fork มาต้อง render จริง ไม่ใช่อ่าน cache ที่สืบทอดมา
+    rows = [{'mobile': '0812345678', 'amount': str(amount)} for amount in range(1, 4)]
+    results = list(map_chunks(render_chunk, iter_chunks(rows, 2), 'png', workers=1))
+    assert sum(len(chunk) for chunk in results) == 3
+
+    _, histograms = metrics.collect()
+    encodes = histograms[('qr_stage_seconds', (('stage', 'encode'),))]
+    assert sum(encodes[:-1]) == 3
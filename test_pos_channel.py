@@ -0,0 +1,68 @@
+"""POS display channels: late subscribers get the current QR, leavers stop its render"""
+
+import asyncio
+
+from pos_channel import PosHub
+
+
+class SlowRender:
+    """Render coroutine that blocks until released, counting cancelled calls"""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self, payload, fmt, renderer, target):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return b'image'
+
+
+async def _published(hub):
+    hub.update('counter1', '00020101021229370016A000000677010111', '0812345678', '10.00')
+    await asyncio.sleep(0.01)
+    return hub.channels['counter1']
+
+
+def test_late_subscriber_gets_the_current_image():
+    async def run():
+        render = SlowRender()
+        hub = PosHub(render, debounce=0, idle_ttl=60)
+        await _published(hub)
+
+        subscriber = hub.subscribe('counter1', 'png')
+        assert subscriber.task is not None
+        render.release.set()
+        await subscriber.wait()
+        event = subscriber.take()
+        assert event['image'] == 'data:image/png;base64,aW1hZ2U='
+        assert subscriber.task is None
+        hub.unsubscribe('counter1', subscriber)
+
+    asyncio.run(run())
+
+
+def test_unsubscribe_cancels_the_initial_render():
+    async def run():
+        render = SlowRender()
+        hub = PosHub(render, debounce=0, idle_ttl=60)
+        channel = await _published(hub)
+
+        subscriber = hub.subscribe('counter1', 'png')
+        task = subscriber.task
+        await asyncio.sleep(0.01)
+        assert render.started == 1
+
+        hub.unsubscribe('counter1', subscriber)
+        await asyncio.sleep(0)
+        assert task.cancelled() and render.cancelled == 1
+        assert subscriber.task is None
+        # ไม่มีจอเหลือ: channel รอหมดอายุตามปกติ
+        assert not channel.subscribers and channel.expiry is not None
+
+    asyncio.run(run())
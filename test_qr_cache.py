@@ -0,0 +1,91 @@
+"""Request coalescing: identical concurrent get_qr_image misses render once"""
+
+import threading
+import time
+
+import pytest
+
+import generate_qr
+from qr_cache import SingleFlight
+
+CALLERS = 8
+
+
+@pytest.fixture
+def flight(monkeypatch):
+    flight = SingleFlight()
+    monkeypatch.setattr(generate_qr, 'render_flight', flight)
+    monkeypatch.setattr(generate_qr, 'shared_render_cache', None)
+    monkeypatch.setattr(generate_qr, 'pack_store', None)
+    generate_qr.render_cache.clear()
+    yield flight
+    generate_qr.render_cache.clear()
+
+
+def _slow_render(monkeypatch, flight, result):
+    """Replace render_qr with one that waits for every other caller to queue up"""
+    calls = []
+
+    def render_qr(payload, fmt='png', renderer=None):
+        calls.append(payload)
+        deadline = time.monotonic() + 5
+        while flight.stats()['followers'] < CALLERS - 1 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    monkeypatch.setattr(generate_qr, 'render_qr', render_qr)
+    return calls
+
+
+def _call_concurrently(payload):
+    """Run get_qr_image from CALLERS threads at once; return each result or exception"""
+    results = [None] * CALLERS
+    start = threading.Barrier(CALLERS)
+
+    def call(i):
+        start.wait()
+        try:
+            results[i] = generate_qr.get_qr_image(payload)
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(CALLERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_misses_render_once(monkeypatch, flight):
+    payload = generate_qr.generate_promptpay_payload('0812345678', '42.00')
+    calls = _slow_render(monkeypatch, flight, b'png-bytes')
+
+    results = _call_concurrently(payload)
+
+    assert calls == [payload]
+    assert results == [b'png-bytes'] * CALLERS
+    assert flight.stats() == {'in_flight': 0, 'leaders': 1, 'followers': CALLERS - 1}
+    # คำขอถัดไปอ่านจาก cache ไม่ render ซ้ำ
+    assert generate_qr.get_qr_image(payload) == b'png-bytes'
+    assert len(calls) == 1
+
+
+def test_leader_error_reaches_every_follower(monkeypatch, flight):
+    payload = generate_qr.generate_promptpay_payload('0812345678', '43.00')
+    error = RuntimeError('render failed')
+    calls = _slow_render(monkeypatch, flight, error)
+
+    results = _call_concurrently(payload)
+
+    assert len(calls) == 1
+    assert all(result is error for result in results)
+    assert flight.stats()['in_flight'] == 0
+    key = (payload,) + generate_qr.qr_render_params('png', generate_qr.QR_RENDERER)
+    assert generate_qr.render_cache.get(key) is None
+
+    # ข้อผิดพลาดไม่ถูกจำไว้: คำขอใหม่ render ใหม่
+    monkeypatch.setattr(generate_qr, 'render_qr', lambda payload, fmt='png', renderer=None: b'ok')
+    assert generate_qr.get_qr_image(payload) == b'ok'
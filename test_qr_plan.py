@@ -0,0 +1,48 @@
+"""build_qr against qrcode's own make(fit=True)"""
+
+import pytest
+import qrcode
+
+from generate_qr import generate_bill_payment_payload, generate_promptpay_payload, \
+    generate_static_payload
+from qr_plan import _fit_qr, build_qr
+
+LEVELS = (qrcode.constants.ERROR_CORRECT_L, qrcode.constants.ERROR_CORRECT_M,
+          qrcode.constants.ERROR_CORRECT_Q, qrcode.constants.ERROR_CORRECT_H)
+
+
+def _sample_payloads():
+    """Return PromptPay payloads covering the usual length range"""
+    payloads = []
+    for target in ('0812345678', '0612345678', '1234567890121'):
+        for amount in ('1', '75.50', '1000', '999999.99'):
+            for name in ('', 'Shop', 'Somchai Coffee Bangkok 25'):
+                payloads.append(generate_promptpay_payload(target, amount, name))
+        payloads.append(generate_static_payload(target, 'Shop'))
+    payloads.append(generate_bill_payment_payload('010753600031508', 'INV0001234567890',
+                                                  '1250.00', 'CUSTOMER42', 'Utility',
+                                                  'POS1', 'REF9'))
+    # ข้อมูลยาวเพื่อทดสอบช่วง version 10 ขึ้นไป
+    payloads.append('0812345678' * 40 + 'PROMPTPAY QR ' * 20 + 'Somchai Coffee' * 10)
+    return payloads
+
+
+@pytest.mark.parametrize('payload', _sample_payloads())
+@pytest.mark.parametrize('level', LEVELS)
+def test_default_matches_make_fit(payload, level):
+    expected = _fit_qr(payload, level)
+    built = build_qr(payload, level)
+    assert built.version == expected.version
+    assert built.modules == expected.modules
+
+
+@pytest.mark.parametrize('payload', _sample_payloads())
+@pytest.mark.parametrize('mask_pattern', range(8))
+def test_fixed_mask_keeps_scanned_content(payload, mask_pattern):
+    level = qrcode.constants.ERROR_CORRECT_M
+    expected = _fit_qr(payload, level)
+    fixed = build_qr(payload, level, mask_pattern=mask_pattern)
+    # codeword ที่สแกนได้ต้องเหมือนเดิม ต่างกันแค่ mask
+    assert fixed.version == expected.version
+    assert fixed.data_cache == expected.data_cache
+    assert fixed.modules == _fit_qr(payload, level, mask_pattern=mask_pattern).modules